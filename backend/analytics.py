@@ -0,0 +1,196 @@
+"""
+Analytics Ingestion Service for Toria
+Bounded in-memory event queue flushed to MongoDB in batches by size or time
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import db
+
+# Buffered writer configuration
+ANALYTICS_QUEUE_SIZE = int(os.getenv('ANALYTICS_QUEUE_SIZE', '10000'))
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', '500'))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+# "drop": accept what fits and count the rest; "reject": refuse the request so the client retries
+ANALYTICS_OVERFLOW_POLICY = os.getenv('ANALYTICS_OVERFLOW_POLICY', 'drop').lower()
+MAX_EVENTS_PER_BATCH = int(os.getenv('ANALYTICS_MAX_EVENTS_PER_REQUEST', '500'))
+
+
+class AnalyticsQueueFull(Exception):
+    """Raised under the 'reject' policy when a batch does not fit in the queue"""
+
+
+def build_event(payload: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Normalize a client payload into an analytics_events document"""
+    now = datetime.utcnow()
+    event = {
+        "user_id": payload.get("user_id") or user_id,
+        "event_name": payload.get("event_name") or payload.get("event"),
+        "properties": payload.get("properties", {}),
+        "timestamp": now.isoformat(),
+        # BSON date for the retention TTL index
+        "received_at": now
+    }
+    if payload.get("timestamp"):
+        event["client_timestamp"] = payload["timestamp"]
+    return event
+
+
+class AnalyticsBuffer:
+    """Queues events and writes them with insert_many(ordered=False)"""
+
+    def __init__(self,
+                 queue_size: int = ANALYTICS_QUEUE_SIZE,
+                 batch_size: int = ANALYTICS_BATCH_SIZE,
+                 flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+                 overflow_policy: str = ANALYTICS_OVERFLOW_POLICY):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.queue: Optional[asyncio.Queue] = None
+        self.stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "flushed": 0,
+            "failed": 0,
+            "batches": 0
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._collecting: List[Dict[str, Any]] = []
+        self._writing: Optional[asyncio.Future] = None
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the app's running loop
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        return self.queue
+
+    def enqueue(self, events: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Queue events without waiting; applies the overflow policy when full"""
+        queue = self._get_queue()
+
+        if self.overflow_policy == "reject" and queue.maxsize - queue.qsize() < len(events):
+            self.stats["rejected"] += len(events)
+            raise AnalyticsQueueFull(f"Analytics queue full ({queue.qsize()}/{queue.maxsize})")
+
+        accepted = 0
+        for event in events:
+            try:
+                queue.put_nowait(event)
+                accepted += 1
+            except asyncio.QueueFull:
+                break
+
+        dropped = len(events) - accepted
+        self.stats["enqueued"] += accepted
+        self.stats["dropped"] += dropped
+        return {"accepted": accepted, "dropped": dropped}
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        written = len(batch)
+        try:
+            await db.analytics_events.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts keep going past bad documents; count what failed
+            written = e.details.get("nInserted", 0)
+            print(f"Failed to write {len(batch) - written} analytics events: {e}")
+        except PyMongoError as e:
+            written = 0
+            print(f"Failed to write {len(batch)} analytics events: {e}")
+
+        self.stats["flushed"] += written
+        self.stats["failed"] += len(batch) - written
+        self.stats["batches"] += 1
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        queue = self._get_queue()
+        batch = []
+        while len(batch) < limit and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        queue = self._get_queue()
+        while True:
+            # Wait for the first event, then give the batch up to flush_interval to fill
+            batch = self._collecting = [await queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+
+            # Shielded so shutdown never abandons a half-sent batch
+            self._collecting = []
+            self._writing = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._writing)
+
+    def start(self):
+        """Start the background writer on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and flush whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._writing is not None and not self._writing.done():
+            await self._writing
+        if self._collecting:
+            batch, self._collecting = self._collecting, []
+            await self._write(batch)
+
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            await self._write(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        queue = self._get_queue()
+        return {
+            **self.stats,
+            "queue_depth": queue.qsize(),
+            "queue_capacity": queue.maxsize,
+            "overflow_policy": self.overflow_policy
+        }
+
+
+# Global instance
+analytics_buffer = AnalyticsBuffer()
+
+# Helper functions for external use
+def track_events(events: List[Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, int]:
+    """Queue raw client events for the buffered writer"""
+    return analytics_buffer.enqueue([build_event(event, user_id) for event in events])
+
+def start_analytics_writer():
+    """Start the buffered analytics writer"""
+    analytics_buffer.start()
+
+async def stop_analytics_writer():
+    """Flush queued events and stop the writer"""
+    await analytics_buffer.stop()
+
+def get_analytics_stats() -> Dict[str, Any]:
+    """Get ingestion queue statistics"""
+    return analytics_buffer.get_stats()
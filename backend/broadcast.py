@@ -0,0 +1,203 @@
+"""
+Segment Broadcast Notifications for Toria
+Fans one notification out to every user in a segment as a tracked background job
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from database import db
+from push import enqueue_push
+from unread import count_new_notifications
+
+# Fan-out configuration
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '1000'))
+BROADCAST_MAX_CONCURRENT_JOBS = int(os.getenv('BROADCAST_MAX_CONCURRENT_JOBS', '2'))
+BROADCAST_DEFAULT_DAYS_AHEAD = int(os.getenv('BROADCAST_DEFAULT_DAYS_AHEAD', '7'))
+
+SEGMENT_TYPES = ("upcoming_plan_city", "preference")
+
+
+def segment_query(segment: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Collection and filter whose documents' user_id make up the segment
+
+    upcoming_plan_city: {"city": "Delhi", "days_ahead": 7}
+    preference:         {"flag": "notifications", "value": true}
+    """
+    kind = segment.get("type")
+    if kind == "upcoming_plan_city":
+        if not segment.get("city"):
+            raise ValueError("upcoming_plan_city segment needs a city")
+        now = datetime.utcnow()
+        days_ahead = int(segment.get("days_ahead", BROADCAST_DEFAULT_DAYS_AHEAD))
+        return "day_plans", {
+            "status": "upcoming",
+            "city": segment["city"],
+            "date": {"$gte": now.isoformat(), "$lte": (now + timedelta(days=days_ahead)).isoformat()}
+        }
+    if kind == "preference":
+        if not segment.get("flag"):
+            raise ValueError("preference segment needs a flag")
+        return "users", {f"preferences.{segment['flag']}": segment.get("value", True)}
+    raise ValueError(f"segment type must be one of {list(SEGMENT_TYPES)}")
+
+
+class BroadcastService:
+    """Runs fan-out jobs and records their progress in notification_jobs"""
+
+    def __init__(self, chunk_size: int = BROADCAST_CHUNK_SIZE,
+                 max_concurrent_jobs: int = BROADCAST_MAX_CONCURRENT_JOBS):
+        self.chunk_size = chunk_size
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        return self._semaphore
+
+    async def submit(self, segment: Dict[str, Any], title: str, body: str,
+                     data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Validate the segment, record the job and start it in the background"""
+        segment_query(segment)
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "segment": segment,
+            "title": title,
+            "body": body,
+            "data": data or {},
+            "status": "queued",
+            "matched": 0,
+            "skipped_opted_out": 0,
+            "inserted": 0,
+            "failed": 0,
+            "created_at": datetime.utcnow()
+        }
+        await db.notification_jobs.insert_one(job)
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["_id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["_id"], None))
+        return {"job_id": job["_id"], "status": job["status"]}
+
+    async def _opted_out(self, user_ids: List[str]) -> Set[str]:
+        cursor = db.users.find(
+            {"user_id": {"$in": user_ids}, "preferences.notifications": False}, {"user_id": 1}
+        )
+        return {doc["user_id"] async for doc in cursor}
+
+    async def _send_chunk(self, job: Dict[str, Any], user_ids: List[str], progress: Dict[str, int]):
+        opted_out = await self._opted_out(user_ids)
+        recipients = [user_id for user_id in user_ids if user_id not in opted_out]
+        progress["skipped_opted_out"] += len(opted_out)
+        if not recipients:
+            return
+
+        now = datetime.utcnow()
+        notifications = [
+            {
+                "user_id": user_id,
+                "title": job["title"],
+                "body": job["body"],
+                "data": {**job["data"], "broadcast_id": job["_id"]},
+                "sent_at": now,
+                "type": "push",
+                "status": "queued",
+                "read": False
+            }
+            for user_id in recipients
+        ]
+        try:
+            await db.notifications.insert_many(notifications, ordered=False)
+            inserted = notifications
+        except BulkWriteError as e:
+            failed_indexes = {error["index"] for error in e.details.get("writeErrors", [])}
+            inserted = [n for i, n in enumerate(notifications) if i not in failed_indexes]
+            progress["failed"] += len(failed_indexes)
+
+        await count_new_notifications([n["user_id"] for n in inserted])
+        await enqueue_push(inserted)
+        progress["inserted"] += len(inserted)
+
+    async def _run(self, job: Dict[str, Any]):
+        progress = {"matched": 0, "skipped_opted_out": 0, "inserted": 0, "failed": 0}
+        async with self._get_semaphore():
+            await db.notification_jobs.update_one(
+                {"_id": job["_id"]}, {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+            )
+            try:
+                collection, query = segment_query(job["segment"])
+                cursor = db[collection].find(query, {"_id": 0, "user_id": 1}).batch_size(self.chunk_size)
+
+                # A user with several matching plans is notified once
+                seen: Set[str] = set()
+                chunk: List[str] = []
+                async for doc in cursor:
+                    user_id = doc.get("user_id")
+                    if not user_id or user_id in seen:
+                        continue
+                    seen.add(user_id)
+                    chunk.append(user_id)
+                    if len(chunk) >= self.chunk_size:
+                        progress["matched"] += len(chunk)
+                        await self._send_chunk(job, chunk, progress)
+                        await db.notification_jobs.update_one({"_id": job["_id"]}, {"$set": progress})
+                        chunk = []
+
+                if chunk:
+                    progress["matched"] += len(chunk)
+                    await self._send_chunk(job, chunk, progress)
+
+                await db.notification_jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {**progress, "status": "completed", "finished_at": datetime.utcnow()}}
+                )
+                print(f"📣 Broadcast {job['_id']} finished: {progress}")
+
+            except asyncio.CancelledError:
+                await asyncio.shield(db.notification_jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {**progress, "status": "interrupted", "finished_at": datetime.utcnow()}}
+                ))
+                raise
+            except Exception as e:
+                # Any failure must end the job, or it would read as running forever
+                print(f"Broadcast {job['_id']} failed: {e}")
+                await db.notification_jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {**progress, "status": "failed", "error": str(e), "finished_at": datetime.utcnow()}}
+                )
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await db.notification_jobs.find_one({"_id": job_id})
+
+    async def stop(self):
+        """Cancel running jobs; they are recorded as interrupted with their progress"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global instance
+broadcast_service = BroadcastService()
+
+# Helper functions for external use
+async def broadcast_notification(segment: Dict[str, Any], title: str, body: str, data: Dict = None):
+    """Start a fan-out job for a user segment"""
+    return await broadcast_service.submit(segment, title, body, data)
+
+async def get_broadcast_job(job_id: str):
+    """Get a fan-out job and its progress"""
+    return await broadcast_service.get_job(job_id)
+
+async def stop_broadcasts():
+    """Interrupt running fan-out jobs"""
+    await broadcast_service.stop()
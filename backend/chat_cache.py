@@ -0,0 +1,195 @@
+"""
+Chat Response Cache for Toria
+Reuses general travel chat replies for repeated questions, keyed by the normalized
+message and the user's preferences, with an optional NumPy similarity index
+"""
+
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+from response_cache import cache_key, normalize_params
+
+# Try to enable the similarity index
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Cache configuration
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', '21600'))
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '2048'))
+# Shorter messages ("yes", "tell me more") depend on the conversation and are never cached
+CHAT_CACHE_MIN_WORDS = int(os.getenv('CHAT_CACHE_MIN_WORDS', '3'))
+CHAT_CACHE_SIMILARITY = os.getenv('CHAT_CACHE_SIMILARITY', 'false').lower() in ('1', 'true', 'yes')
+CHAT_CACHE_SIMILARITY_THRESHOLD = float(os.getenv('CHAT_CACHE_SIMILARITY_THRESHOLD', '0.9'))
+
+EMBEDDING_DIM = 512
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# Words that point back at earlier turns ("is it safe?", "what to eat there"); such follow-ups
+# depend on the conversation and are never cached. "is there"/"are there" ask, not refer.
+_REFERENTIAL = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|same|else|another|instead|"
+    r"more|again|also|above|earlier|previous)\b|(?<!is )(?<!are )\bthere\b"
+)
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_message(message: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a chat message"""
+    return normalize_params(_PUNCTUATION.sub(" ", message))
+
+
+def embed(text: str) -> "np.ndarray":
+    """Hashed word and character-trigram vector; cheap, local and good enough for rephrasings"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _EvictionCountingCache(TTLCache):
+    """TTLCache that counts capacity evictions (expiry is not counted)"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class EmbeddingIndex:
+    """Row-per-entry matrix of message vectors searched with one dot product"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self.vectors = np.zeros((self.capacity, EMBEDDING_DIM), dtype=np.float32)
+        self.keys: List[CacheKey] = []
+        # key -> row, so a key stored again after expiring reuses its row
+        self.rows: Dict[CacheKey, int] = {}
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self.rows
+
+    def add(self, key: CacheKey, vector: "np.ndarray", live: Dict[CacheKey, Any]):
+        row = self.rows.get(key)
+        if row is not None:
+            self.vectors[row] = vector
+            return
+        if len(self.keys) >= self.capacity:
+            self.compact(live)
+        if len(self.keys) >= self.capacity:
+            # Every row is live; grow rather than lose entries the cache still holds
+            self.capacity *= 2
+            self.vectors = np.resize(self.vectors, (self.capacity, EMBEDDING_DIM))
+        self.rows[key] = len(self.keys)
+        self.vectors[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def compact(self, live: Dict[CacheKey, Any]):
+        """Drop rows whose cache entry expired or was evicted, keeping one row per key"""
+        rows = [i for i, key in enumerate(self.keys) if key in live and self.rows.get(key) == i]
+        self.vectors[:len(rows)] = self.vectors[rows]
+        self.keys = [self.keys[i] for i in rows]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+
+    def search(self, vector: "np.ndarray", preferences_hash: str,
+               live: Dict[CacheKey, Any]) -> Tuple[Optional[CacheKey], float]:
+        """Closest live entry for the same preferences, with its cosine similarity"""
+        if not self.keys:
+            return None, 0.0
+        scores = self.vectors[:len(self.keys)] @ vector
+        for row in np.argsort(scores)[::-1]:
+            key = self.keys[row]
+            if key[0] == preferences_hash and key in live:
+                return key, float(scores[row])
+        return None, 0.0
+
+
+class ChatResponseCache:
+    """Exact-match cache of chat replies, optionally falling back to the nearest similar question"""
+
+    def __init__(self,
+                 ttl: float = CHAT_CACHE_TTL,
+                 maxsize: int = CHAT_CACHE_SIZE,
+                 min_words: int = CHAT_CACHE_MIN_WORDS,
+                 similarity: bool = CHAT_CACHE_SIMILARITY,
+                 threshold: float = CHAT_CACHE_SIMILARITY_THRESHOLD):
+        self.cache = _EvictionCountingCache(maxsize=maxsize, ttl=ttl)
+        self.min_words = min_words
+        self.threshold = threshold
+        self.index = EmbeddingIndex(maxsize) if similarity and NUMPY_AVAILABLE else None
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "skipped": 0}
+
+    def _key(self, message: str, preferences: Optional[Dict[str, Any]]) -> Optional[CacheKey]:
+        """Key for a standalone question; None for short or referential follow-ups"""
+        text = normalize_message(message)
+        if len(text.split()) < self.min_words or _REFERENTIAL.search(text):
+            return None
+        return cache_key(preferences or {}), text
+
+    def get(self, message: str, preferences: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Cached reply for this question and preferences, if any"""
+        key = self._key(message, preferences)
+        if key is None:
+            self.stats["skipped"] += 1
+            return None
+
+        response = self.cache.get(key)
+        if response is not None:
+            self.stats["hits"] += 1
+            return response
+
+        if self.index is not None:
+            match, score = self.index.search(embed(key[1]), key[0], self.cache)
+            if match is not None and score >= self.threshold:
+                response = self.cache.get(match)
+                if response is not None:
+                    self.stats["similar_hits"] += 1
+                    return response
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, message: str, preferences: Optional[Dict[str, Any]], response: str):
+        key = self._key(message, preferences)
+        if key is None or not response:
+            return
+        self.cache[key] = response
+        self.stats["stores"] += 1
+        if self.index is not None and key not in self.index:
+            self.index.add(key, embed(key[1]), self.cache)
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["hits"] + self.stats["similar_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "evictions": self.cache.evictions,
+            "entries": len(self.cache),
+            "capacity": self.cache.maxsize,
+            "hit_rate": hits / lookups if lookups else None,
+            "similarity_index": len(self.index.keys) if self.index is not None else None
+        }
+
+
+# Global instance
+chat_response_cache = ChatResponseCache()
+
+# Helper functions for external use
+def get_chat_cache_stats() -> Dict[str, Any]:
+    """Get chat response cache statistics"""
+    return chat_response_cache.get_stats()
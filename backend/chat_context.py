@@ -0,0 +1,111 @@
+"""
+Chatbot Context Cache for Toria
+Per-thread cache of the user's preferences and active itinerary, with the prompt
+fragments already rendered, so follow-up turns skip the Mongo reads and serialization
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+from database import db
+from prompt_compaction import prompt_compactor
+
+# Cache configuration
+CHAT_CONTEXT_CACHE_SIZE = int(os.getenv('CHAT_CONTEXT_CACHE_SIZE', '5000'))
+CHAT_CONTEXT_CACHE_TTL = float(os.getenv('CHAT_CONTEXT_CACHE_TTL', '300'))
+
+CONTEXT_TYPES = ("profile_dayplans", "start_my_day", "general")
+
+
+def render_prompt_fragments(context_type: str, user_preferences: Dict[str, Any],
+                            current_itinerary: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """The compacted blocks the chat prompts embed, rendered once per context load"""
+    fragments = {"preferences": prompt_compactor.compact_preferences(user_preferences)}
+    if context_type in ("profile_dayplans", "start_my_day"):
+        fragments["itinerary"] = prompt_compactor.compact_itinerary(current_itinerary, context_type)
+    return fragments
+
+
+class ChatContextCache:
+    """Context for each (user_id, context_type) thread, dropped on preference or plan writes"""
+
+    def __init__(self, maxsize: int = CHAT_CONTEXT_CACHE_SIZE, ttl: float = CHAT_CONTEXT_CACHE_TTL):
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+
+    async def _fetch_preferences(self, user_id: str) -> Dict[str, Any]:
+        user_doc = await db.users.find_one({"user_id": user_id}, {"preferences": 1})
+        return user_doc.get("preferences", {}) if user_doc else {}
+
+    async def _fetch_itinerary(self, user_id: str, itinerary_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not itinerary_id:
+            return None
+        # No _id: the itinerary is kept in checkpointed chat state, which cannot serialize ObjectId
+        return await db.day_plans.find_one({"id": itinerary_id, "user_id": user_id}, {"_id": 0})
+
+    async def load(self, user_id: str, context_type: str, itinerary_id: Optional[str]) -> Dict[str, Any]:
+        """Cached context for one thread; both documents are read concurrently on a miss"""
+        key: Tuple[str, str] = (user_id, context_type)
+        entry = self.cache.get(key)
+        if entry is not None and entry["itinerary_id"] == itinerary_id:
+            self.stats["hits"] += 1
+            return entry
+
+        self.stats["misses"] += 1
+        preferences, itinerary = await asyncio.gather(
+            self._fetch_preferences(user_id),
+            self._fetch_itinerary(user_id, itinerary_id),
+            return_exceptions=True
+        )
+        failed = isinstance(preferences, Exception) or isinstance(itinerary, Exception)
+        if isinstance(preferences, Exception):
+            preferences = {}
+        if isinstance(itinerary, Exception):
+            itinerary = None
+
+        entry = {
+            "itinerary_id": itinerary_id,
+            "user_preferences": preferences,
+            "current_itinerary": itinerary,
+            "fragments": render_prompt_fragments(context_type, preferences, itinerary)
+        }
+        if failed:
+            # Serve the degraded context for this turn only
+            self.stats["errors"] += 1
+        else:
+            self.cache[key] = entry
+        return entry
+
+    def invalidate(self, user_id: str, itinerary_id: Optional[str] = None):
+        """Drop a user's cached threads, or only those built on one itinerary"""
+        for context_type in CONTEXT_TYPES:
+            key = (user_id, context_type)
+            entry = self.cache.get(key)
+            if entry is None or (itinerary_id and entry["itinerary_id"] != itinerary_id):
+                continue
+            self.cache.pop(key, None)
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.cache),
+            "hit_rate": self.stats["hits"] / lookups if lookups else None
+        }
+
+
+# Global instance
+chat_context_cache = ChatContextCache()
+
+# Helper functions for external use
+def invalidate_chat_context(user_id: str, itinerary_id: Optional[str] = None):
+    """Forget cached chatbot context after the user's preferences or plans change"""
+    chat_context_cache.invalidate(user_id, itinerary_id)
+
+def get_chat_context_stats() -> Dict[str, Any]:
+    """Get chatbot context cache statistics"""
+    return chat_context_cache.get_stats()
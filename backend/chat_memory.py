@@ -0,0 +1,195 @@
+"""
+Chatbot Conversation Memory for Toria
+MongoDB-backed LangGraph checkpointer that keeps only each thread's latest checkpoint,
+with an LRU of hot threads in memory; idle threads expire via retention.py
+"""
+
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from cachetools import LRUCache
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+
+# Memory configuration
+CHAT_MEMORY_MAX_THREADS = int(os.getenv('CHAT_MEMORY_MAX_THREADS', '1000'))
+# Messages kept per thread; older ones are removed from the conversation state
+CHAT_MAX_MESSAGES = int(os.getenv('CHAT_MAX_MESSAGES', '20'))
+
+
+class CheckpointConflict(Exception):
+    """Raised when a thread was advanced elsewhere since this worker loaded it"""
+
+
+class MongoCheckpointSaver(BaseCheckpointSaver):
+    """Latest-checkpoint-only saver for the chat graph
+
+    The chatbot never rewinds a conversation, so older checkpoints are overwritten
+    instead of kept. Serialized thread documents for recently active threads stay
+    in an LRU so a turn does not need a Mongo read; cold threads fall out of memory
+    and are loaded again on their next turn.
+
+    Mongo stays the source of truth: a checkpoint is only written over the one it
+    was built from. If another worker moved the thread on, the cached copy is
+    dropped and CheckpointConflict is raised so the turn can be rerun on fresh state.
+    """
+
+    def __init__(self, max_threads: int = CHAT_MEMORY_MAX_THREADS, *, serde=None):
+        super().__init__(serde=serde)
+        self.threads: LRUCache = LRUCache(maxsize=max_threads)
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0}
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    @staticmethod
+    def _doc_id(key: Tuple[str, str]) -> str:
+        return f"{key[0]}|{key[1]}"
+
+    async def _load(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        doc = self.threads.get(key)
+        if doc is not None:
+            self.stats["hits"] += 1
+            return doc
+
+        self.stats["misses"] += 1
+        doc = await db.chat_threads.find_one({"_id": self._doc_id(key)})
+        if doc is not None:
+            self.threads[key] = doc
+        return doc
+
+    def _to_tuple(self, doc: Dict[str, Any]) -> CheckpointTuple:
+        configurable = {"thread_id": doc["thread_id"], "checkpoint_ns": doc["checkpoint_ns"]}
+        parent_id = doc.get("parent_checkpoint_id")
+        return CheckpointTuple(
+            config={"configurable": {**configurable, "checkpoint_id": doc["checkpoint_id"]}},
+            checkpoint=self.serde.loads_typed(tuple(doc["checkpoint"])),
+            metadata=self.serde.loads_typed(tuple(doc["metadata"])),
+            parent_config={"configurable": {**configurable, "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[
+                (write["task_id"], write["channel"], self.serde.loads_typed(tuple(write["value"])))
+                for write in doc.get("writes", [])
+            ]
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        doc = await self._load(self._key(config))
+        if doc is None:
+            return None
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id and checkpoint_id != doc["checkpoint_id"]:
+            # Older checkpoints are not retained
+            return None
+        return self._to_tuple(doc)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or limit == 0:
+            return
+        checkpoint = await self.aget_tuple(config)
+        if checkpoint is None:
+            return
+        if before is not None and checkpoint.config["configurable"]["checkpoint_id"] >= get_checkpoint_id(before):
+            return
+        if filter and any(checkpoint.metadata.get(k) != v for k, v in filter.items()):
+            return
+        yield checkpoint
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id, checkpoint_ns = self._key(config)
+        parent_id = config["configurable"].get("checkpoint_id")
+        doc = {
+            "_id": self._doc_id((thread_id, checkpoint_ns)),
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": parent_id,
+            "checkpoint": list(self.serde.dumps_typed(checkpoint)),
+            "metadata": list(self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))),
+            "writes": [],
+            "updated_at": datetime.utcnow()
+        }
+        # Compare-and-set on the checkpoint this one follows
+        if parent_id is None:
+            try:
+                await db.chat_threads.insert_one(doc)
+                written = True
+            except DuplicateKeyError:
+                written = False
+        else:
+            result = await db.chat_threads.replace_one({"_id": doc["_id"], "checkpoint_id": parent_id}, doc)
+            written = result.matched_count == 1
+        if not written:
+            self.threads.pop((thread_id, checkpoint_ns), None)
+            self.stats["conflicts"] += 1
+            raise CheckpointConflict(f"Chat thread {thread_id} changed on another worker")
+        self.threads[(thread_id, checkpoint_ns)] = doc
+        self.stats["writes"] += 1
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"]
+        }}
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]],
+                          task_id: str, task_path: str = "") -> None:
+        key = self._key(config)
+        doc = await self._load(key)
+        if doc is None or doc["checkpoint_id"] != config["configurable"].get("checkpoint_id"):
+            return
+
+        existing = {(w["task_id"], w["idx"]) for w in doc["writes"]}
+        new_writes = []
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            if write_idx >= 0 and (task_id, write_idx) in existing:
+                continue
+            new_writes.append({
+                "task_id": task_id,
+                "idx": write_idx,
+                "channel": channel,
+                "value": list(self.serde.dumps_typed(value)),
+                "task_path": task_path
+            })
+        if not new_writes:
+            return
+
+        doc["writes"].extend(new_writes)
+        await db.chat_threads.update_one(
+            {"_id": doc["_id"], "checkpoint_id": doc["checkpoint_id"]},
+            {"$push": {"writes": {"$each": new_writes}}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        for key in [k for k in self.threads if k[0] == thread_id]:
+            self.threads.pop(key, None)
+        await db.chat_threads.delete_many({"thread_id": thread_id})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "threads_in_memory": len(self.threads), "capacity": self.threads.maxsize}
+
+
+# Global instance
+chat_memory = MongoCheckpointSaver()
+
+# Helper functions for external use
+def get_chat_memory_stats() -> Dict[str, Any]:
+    """Get conversation memory cache statistics"""
+    return chat_memory.get_stats()
@@ -3,10 +3,10 @@ Travel Buddy Chatbot using LangChain + LangGraph
 Provides conversational AI for travel planning and assistance
 """
 
+import asyncio
 import os
-from typing import Dict, List, Any, Optional, TypedDict, Annotated
+from typing import AsyncIterator, Dict, List, Any, Optional, TypedDict, Annotated
 from datetime import datetime
-import json
 
 # Try to import the Google Generative AI integration
 # If not available, use a mock implementation
@@ -15,38 +15,64 @@ try:
     LANGCHAIN_GOOGLE_AVAILABLE = True
 except ImportError:
     LANGCHAIN_GOOGLE_AVAILABLE = False
-    # Mock class to replace GoogleGenerativeAI
-    class MockGoogleGenerativeAI:
-        def __init__(self, model=None, google_api_key=None, temperature=0.7):
-            self.model = model
-            self.temperature = temperature
-        
-        async def ainvoke(self, messages):
-            return {"content": "This is a mock response as langchain-google-genai is not available."}
-        
-        def invoke(self, messages):
-            return "This is a mock response as langchain-google-genai is not available."
 
 # Import the rest of the dependencies
 try:
-    from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+    from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, RemoveMessage
     from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
     from langchain_core.output_parsers import JsonOutputParser
+    from langchain_core.runnables import Runnable
     from langgraph.graph import StateGraph, START, END
-    from langgraph.checkpoint.memory import MemorySaver
     from langgraph.graph.message import add_messages
+    from langgraph.config import get_stream_writer
 except ImportError:
     # Fallback implementations if needed
     pass
 
-from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 
+from llm_gateway import llm_gateway, LLMSaturated
+from chat_memory import chat_memory, CheckpointConflict, CHAT_MAX_MESSAGES
+from chat_context import chat_context_cache
+from chat_cache import chat_response_cache
+
 load_dotenv()
 
+# Force the mock LLM (load tests, offline development)
+CHATBOT_MOCK_LLM = os.getenv('CHATBOT_MOCK_LLM', 'false').lower() in ('1', 'true', 'yes')
+# Simulated mock LLM response time in seconds
+MOCK_LLM_LATENCY = float(os.getenv('MOCK_LLM_LATENCY', '0'))
+
+
+class MockGoogleGenerativeAI(Runnable):
+    """Stand-in LLM that composes into chains like the real one and streams word by word"""
+    
+    def __init__(self, model=None, google_api_key=None, temperature=0.7, latency: float = MOCK_LLM_LATENCY):
+        self.model = model
+        self.temperature = temperature
+        self.latency = latency
+    
+    def _reply(self) -> str:
+        return "This is a mock response as langchain-google-genai is not available."
+    
+    def invoke(self, input, config=None, **kwargs) -> str:
+        return self._reply()
+    
+    async def ainvoke(self, input, config=None, **kwargs) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply()
+    
+    async def astream(self, input, config=None, **kwargs):
+        words = self._reply().split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else f" {word}"
+
 # LLM Setup
-if LANGCHAIN_GOOGLE_AVAILABLE:
+if LANGCHAIN_GOOGLE_AVAILABLE and not CHATBOT_MOCK_LLM:
     llm = GoogleGenerativeAI(
         model="gemini-2.0-flash-exp", 
         google_api_key=os.getenv('EMERGENT_LLM_KEY'),
@@ -59,10 +85,28 @@ else:
         temperature=0.7
     )
 
-# MongoDB connection
-MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.toria_db
+# Canned replies served without the LLM when the gateway is saturated or times out
+FALLBACK_MESSAGES = {
+    "profile_dayplans": "I'm a little busy right now, but your day plans are all here. Ask me again in a moment!",
+    "start_my_day": "I'm a little busy right now. Your itinerary is still on track - try me again in a moment!",
+    "general": "Lots of travellers are chatting with me right now. Please try again in a moment!"
+}
+FALLBACK_ACTIONS = {
+    "profile_dayplans": [
+        {"type": "view_plans", "label": "View your plans"},
+        {"type": "create_plan", "label": "Create new plan"}
+    ],
+    "start_my_day": [
+        {"type": "nearby_suggestions", "label": "Find nearby alternatives"},
+        {"type": "check_done", "label": "Mark location as visited"},
+        {"type": "get_directions", "label": "Get directions"}
+    ],
+    "general": [
+        {"type": "plan_trip", "label": "Plan a new trip"},
+        {"type": "find_places", "label": "Find places to visit"},
+        {"type": "travel_tips", "label": "Get travel tips"}
+    ]
+}
 
 class ChatState(TypedDict):
     """State for the chatbot conversation"""
@@ -72,13 +116,15 @@ class ChatState(TypedDict):
     itinerary_id: Optional[str]
     current_itinerary: Optional[Dict]
     user_preferences: Optional[Dict]
+    prompt_fragments: Optional[Dict[str, str]]
     suggested_actions: List[Dict]
 
 class ToriaChatbot:
     """Main chatbot class with LangGraph state management"""
     
     def __init__(self):
-        self.memory = MemorySaver()
+        # Mongo-backed so threads survive restarts and cold threads leave worker memory
+        self.memory = chat_memory
         self.graph = self._create_graph()
         
     def _create_graph(self) -> StateGraph:
@@ -105,9 +151,12 @@ class ToriaChatbot:
                 "general": "general_travel_chat"
             }
         )
-        workflow.add_edge("profile_dayplans_chat", "provide_suggestions")
-        workflow.add_edge("start_my_day_chat", "provide_suggestions")
-        workflow.add_edge("general_travel_chat", "provide_suggestions")
+        # Suggestions depend only on the loaded context, so they run alongside the reply
+        # and reach streaming clients before the first token
+        workflow.add_edge("route_context", "provide_suggestions")
+        workflow.add_edge("profile_dayplans_chat", END)
+        workflow.add_edge("start_my_day_chat", END)
+        workflow.add_edge("general_travel_chat", END)
         workflow.add_edge("provide_suggestions", END)
         
         return workflow.compile(checkpointer=self.memory)
@@ -125,33 +174,40 @@ class ToriaChatbot:
     
     async def _route_context(self, state: ChatState) -> Dict:
         """Determine conversation context and load relevant data"""
-        user_id = state["user_id"]
-        context_type = state["context_type"]
-        
-        # Load user preferences
-        try:
-            user_doc = await db.users.find_one({"user_id": user_id})
-            user_preferences = user_doc.get("preferences", {}) if user_doc else {}
-        except Exception:
-            user_preferences = {}
-        
-        # Load itinerary if specified
-        current_itinerary = None
-        if state.get("itinerary_id"):
-            try:
-                itinerary_doc = await db.day_plans.find_one({
-                    "id": state["itinerary_id"],
-                    "user_id": user_id
-                })
-                current_itinerary = itinerary_doc if itinerary_doc else None
-            except Exception:
-                current_itinerary = None
+        # Preferences and itinerary are read together and reused across turns
+        context = await chat_context_cache.load(
+            state["user_id"], state["context_type"], state.get("itinerary_id")
+        )
         
         return {
-            "user_preferences": user_preferences,
-            "current_itinerary": current_itinerary
+            "user_preferences": context["user_preferences"],
+            "current_itinerary": context["current_itinerary"],
+            "prompt_fragments": context["fragments"],
+            "messages": self._trim_messages(state["messages"])
         }
     
+    def _trim_messages(self, messages: List) -> List:
+        """Drop the oldest turns so the thread holds CHAT_MAX_MESSAGES once the reply is added"""
+        if CHAT_MAX_MESSAGES <= 0:
+            return []
+        # One slot is left for the reply; the new question is always kept
+        keep = max(CHAT_MAX_MESSAGES - 1, 1)
+        if len(messages) <= keep:
+            return []
+        return [RemoveMessage(id=msg.id) for msg in messages[:len(messages) - keep]]
+    
+    async def _generate(self, chain, inputs: Dict[str, Any]) -> str:
+        """Run the chain as a stream in a gateway slot, forwarding each token to streaming callers"""
+        writer = get_stream_writer()
+        parts = []
+        # Only the model call holds a slot; context loads and cache hits never wait for one
+        async for chunk in llm_gateway.stream(chain.astream(inputs)):
+            text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+            if text:
+                parts.append(text)
+                writer({"token": text})
+        return "".join(parts)
+    
     async def _profile_dayplans_chat(self, state: ChatState) -> Dict:
         """Handle chat from Profile → My Day Plans context"""
         
@@ -172,28 +228,19 @@ class ToriaChatbot:
         User preferences: {preferences}
         """
         
-        context_info = {
-            "itinerary": state.get("current_itinerary"),
-            "total_plans": "multiple plans available"
-        }
-        
-        preferences_info = state.get("user_preferences", {})
+        fragments = state["prompt_fragments"]
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt.format(
-                context=json.dumps(context_info, indent=2),
-                preferences=json.dumps(preferences_info, indent=2)
-            )),
+            ("system", system_prompt),
             MessagesPlaceholder(variable_name="messages")
         ])
         
         chain = prompt | llm
         
-        # Get the last human message
-        last_message = state["messages"][-1] if state["messages"] else HumanMessage(content="Hello!")
-        
-        # Generate response
-        response = await chain.ainvoke({
+        # Fragments go in as template inputs so braces in user data stay literal
+        response = await self._generate(chain, {
+            "context": fragments["itinerary"],
+            "preferences": fragments["preferences"],
             "messages": state["messages"]
         })
         
@@ -221,20 +268,18 @@ class ToriaChatbot:
         User preferences: {preferences}
         """
         
-        itinerary_info = state.get("current_itinerary", {})
-        preferences_info = state.get("user_preferences", {})
+        fragments = state["prompt_fragments"]
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt.format(
-                itinerary=json.dumps(itinerary_info, indent=2),
-                preferences=json.dumps(preferences_info, indent=2)
-            )),
+            ("system", system_prompt),
             MessagesPlaceholder(variable_name="messages")
         ])
         
         chain = prompt | llm
         
-        response = await chain.ainvoke({
+        response = await self._generate(chain, {
+            "itinerary": fragments["itinerary"],
+            "preferences": fragments["preferences"],
             "messages": state["messages"]
         })
         
@@ -262,20 +307,31 @@ class ToriaChatbot:
         User preferences: {preferences}
         """
         
-        preferences_info = state.get("user_preferences", {})
+        fragments = state["prompt_fragments"]
+        question = state["messages"][-1].content
+        preferences_info = state.get("user_preferences") or {}
+        
+        # FAQ-style questions are answered from cache without calling the model; the cache
+        # skips short and referential follow-ups, whose answer depends on earlier turns
+        response = chat_response_cache.get(question, preferences_info)
+        if response is not None:
+            get_stream_writer()({"token": response})
+            return {
+                "messages": [AIMessage(content=response)]
+            }
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt.format(
-                preferences=json.dumps(preferences_info, indent=2)
-            )),
+            ("system", system_prompt),
             MessagesPlaceholder(variable_name="messages")
         ])
         
         chain = prompt | llm
         
-        response = await chain.ainvoke({
+        response = await self._generate(chain, {
+            "preferences": fragments["preferences"],
             "messages": state["messages"]
         })
+        chat_response_cache.put(question, preferences_info, response)
         
         return {
             "messages": [AIMessage(content=response)]
@@ -323,16 +379,15 @@ class ToriaChatbot:
                 }
             ]
         
+        get_stream_writer()({"suggested_actions": suggested_actions})
+        
         return {
             "suggested_actions": suggested_actions
         }
     
-    async def chat(self, 
-                   user_id: str, 
-                   message: str, 
-                   context_type: str = "general",
-                   itinerary_id: Optional[str] = None) -> Dict[str, Any]:
-        """Main chat interface"""
+    def _prepare(self, user_id: str, message: str, context_type: str,
+                 itinerary_id: Optional[str]) -> tuple:
+        """Thread configuration and initial state for one turn"""
         
         # Create thread configuration
         config = {"configurable": {"thread_id": f"{user_id}_{context_type}"}}
@@ -345,12 +400,59 @@ class ToriaChatbot:
             "itinerary_id": itinerary_id,
             "current_itinerary": None,
             "user_preferences": None,
+            "prompt_fragments": None,
             "suggested_actions": []
         }
+        return config, initial_state
+    
+    async def _invoke(self, initial_state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one turn, rerunning it once on fresh state if another worker moved the thread on"""
+        # Sync checkpoints make a stale thread fail on its first write, before the model is called
+        try:
+            return await self.graph.ainvoke(initial_state, config, durability="sync")
+        except CheckpointConflict:
+            return await self.graph.ainvoke(initial_state, config, durability="sync")
+    
+    async def _stream(self, initial_state: Dict[str, Any], config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Custom stream events of one turn, rerun on fresh state like _invoke if nothing was emitted yet"""
+        emitted = False
+        try:
+            async for chunk in self.graph.astream(initial_state, config, stream_mode="custom", durability="sync"):
+                emitted = True
+                yield chunk
+        except CheckpointConflict:
+            if emitted:
+                raise
+            async for chunk in self.graph.astream(initial_state, config, stream_mode="custom", durability="sync"):
+                yield chunk
+    
+    def _context(self, user_id: str, context_type: str, itinerary_id: Optional[str]) -> Dict[str, Any]:
+        return {
+            "itinerary_id": itinerary_id,
+            "context_type": context_type,
+            "user_id": user_id
+        }
+    
+    def _fallback(self, user_id: str, context_type: str, itinerary_id: Optional[str], reason: str) -> Dict[str, Any]:
+        """Immediate reply when the LLM is unavailable; never touches the LLM"""
+        return {
+            "message": FALLBACK_MESSAGES.get(context_type, FALLBACK_MESSAGES["general"]),
+            "actions": FALLBACK_ACTIONS.get(context_type, FALLBACK_ACTIONS["general"]),
+            "context": {**self._context(user_id, context_type, itinerary_id), "fallback": reason}
+        }
+    
+    async def chat(self, 
+                   user_id: str, 
+                   message: str, 
+                   context_type: str = "general",
+                   itinerary_id: Optional[str] = None) -> Dict[str, Any]:
+        """Main chat interface"""
+        
+        config, initial_state = self._prepare(user_id, message, context_type, itinerary_id)
         
         try:
             # Run the conversation
-            result = await self.graph.ainvoke(initial_state, config)
+            result = await self._invoke(initial_state, config)
             
             # Extract the AI response
             ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
@@ -359,33 +461,84 @@ class ToriaChatbot:
             return {
                 "message": response_text,
                 "actions": result.get("suggested_actions", []),
-                "context": {
-                    "itinerary_id": itinerary_id,
-                    "context_type": context_type,
-                    "user_id": user_id
-                }
+                "context": self._context(user_id, context_type, itinerary_id)
             }
             
+        except LLMSaturated:
+            return self._fallback(user_id, context_type, itinerary_id, "busy")
+        except asyncio.TimeoutError:
+            return self._fallback(user_id, context_type, itinerary_id, "timeout")
         except Exception as e:
             print(f"Chatbot error: {e}")
             return {
                 "message": "I'm having trouble right now. Please try again in a moment!",
                 "actions": [],
-                "context": {
-                    "itinerary_id": itinerary_id,
-                    "context_type": context_type,
-                    "user_id": user_id,
-                    "error": str(e)
-                }
+                "context": {**self._context(user_id, context_type, itinerary_id), "error": str(e)}
             }
 
-# Global chatbot instance
-toria_chatbot = ToriaChatbot()
+    async def chat_stream(self,
+                          user_id: str,
+                          message: str,
+                          context_type: str = "general",
+                          itinerary_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming chat interface: yields `actions` and `token` events, then `done`"""
+        
+        config, initial_state = self._prepare(user_id, message, context_type, itinerary_id)
+        context = self._context(user_id, context_type, itinerary_id)
+        tokens = []
+        actions = []
+        
+        try:
+            async for chunk in self._stream(initial_state, config):
+                if "token" in chunk:
+                    tokens.append(chunk["token"])
+                    yield {"event": "token", "data": {"text": chunk["token"]}}
+                elif "suggested_actions" in chunk:
+                    actions = chunk["suggested_actions"]
+                    yield {"event": "actions", "data": {"actions": actions}}
+            
+            yield {"event": "done", "data": {
+                "message": "".join(tokens) or "I'm here to help! What would you like to know?",
+                "actions": actions,
+                "context": context
+            }}
+            
+        except (LLMSaturated, asyncio.TimeoutError) as e:
+            if tokens:
+                # Part of the reply is already on screen; close it out rather than replace it
+                yield {"event": "done", "data": {
+                    "message": "".join(tokens),
+                    "actions": actions,
+                    "context": {**context, "truncated": True}
+                }}
+            else:
+                reason = "busy" if isinstance(e, LLMSaturated) else "timeout"
+                yield {"event": "done", "data": self._fallback(user_id, context_type, itinerary_id, reason)}
+        except Exception as e:
+            print(f"Chatbot stream error: {e}")
+            yield {"event": "error", "data": {
+                "message": "I'm having trouble right now. Please try again in a moment!",
+                "context": {**context, "error": str(e)}
+            }}
+
+# Global chatbot instance, compiled on first use or during startup warm-up
+_toria_chatbot: Optional[ToriaChatbot] = None
+
+def get_chatbot() -> ToriaChatbot:
+    """The shared chatbot, compiling its graph the first time"""
+    global _toria_chatbot
+    if _toria_chatbot is None:
+        _toria_chatbot = ToriaChatbot()
+    return _toria_chatbot
+
+async def probe_llm(timeout: float = 10.0) -> str:
+    """One tiny LLM round trip, which also opens the client's connection"""
+    return await llm_gateway.run(lambda: llm.ainvoke("Reply with OK."), timeout=timeout)
 
 # Convenience functions for different entry points
 async def chat_from_profile_dayplans(user_id: str, message: str, itinerary_id: Optional[str] = None):
     """Entry point from Profile → My Day Plans"""
-    return await toria_chatbot.chat(
+    return await get_chatbot().chat(
         user_id=user_id,
         message=message,
         context_type="profile_dayplans",
@@ -394,7 +547,7 @@ async def chat_from_profile_dayplans(user_id: str, message: str, itinerary_id: O
 
 async def chat_from_start_my_day(user_id: str, message: str, itinerary_id: str):
     """Entry point from Start My Day execution"""
-    return await toria_chatbot.chat(
+    return await get_chatbot().chat(
         user_id=user_id,
         message=message,
         context_type="start_my_day",
@@ -403,8 +556,13 @@ async def chat_from_start_my_day(user_id: str, message: str, itinerary_id: str):
 
 async def general_travel_chat(user_id: str, message: str):
     """General travel assistance"""
-    return await toria_chatbot.chat(
+    return await get_chatbot().chat(
         user_id=user_id,
         message=message,
         context_type="general"
-    )
\ No newline at end of file
+    )
+
+def stream_chat(user_id: str, message: str, context_type: str = "general",
+                itinerary_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming entry point for any chat context"""
+    return get_chatbot().chat_stream(user_id, message, context_type, itinerary_id)
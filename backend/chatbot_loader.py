@@ -0,0 +1,117 @@
+"""
+Chatbot Loader for Toria
+Optionally defers the LangChain/LangGraph import, and warms the chatbot up at startup
+(import, graph compilation, tokenizer, LLM probe) with per-phase timings
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import time
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+from prompt_compaction import preload_tokenizer
+
+# Loader configuration
+# Import the chatbot stack in the startup hook (or on first use) instead of with the server module
+CHATBOT_LAZY_IMPORT = os.getenv('CHATBOT_LAZY_IMPORT', 'false').lower() in ('1', 'true', 'yes')
+CHATBOT_WARMUP = os.getenv('CHATBOT_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+# A one-line LLM call during warm-up; opens the client's connection before real traffic
+CHATBOT_WARMUP_PROBE = os.getenv('CHATBOT_WARMUP_PROBE', 'true').lower() in ('1', 'true', 'yes')
+CHATBOT_WARMUP_TIMEOUT = float(os.getenv('CHATBOT_WARMUP_TIMEOUT', '10'))
+
+
+class ChatbotLoader:
+    """Owns the chatbot module and records how long each cold-start phase took"""
+
+    def __init__(self, lazy: bool = CHATBOT_LAZY_IMPORT):
+        self.lazy = lazy
+        self._module: Optional[ModuleType] = None
+        self.status = "not_loaded"
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def module(self) -> ModuleType:
+        """The chatbot module, imported on first call"""
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module("chatbot")
+            self.timings["import"] = time.perf_counter() - started
+            self.status = "imported"
+        return self._module
+
+    async def load(self) -> ModuleType:
+        """The chatbot module; a deferred import runs in a worker thread so it never blocks the loop"""
+        if self._module is not None:
+            return self._module
+        return await asyncio.to_thread(self.module)
+
+    async def warm_up(self, probe: bool = CHATBOT_WARMUP_PROBE,
+                      timeout: float = CHATBOT_WARMUP_TIMEOUT) -> Dict[str, Any]:
+        """Import, compile the graph, load the tokenizer and probe the LLM; failures are recorded, never raised"""
+        started = time.perf_counter()
+        try:
+            chatbot = await self.load()
+
+            phase = time.perf_counter()
+            chatbot.get_chatbot()
+            self.timings["graph"] = time.perf_counter() - phase
+
+            phase = time.perf_counter()
+            await preload_tokenizer()
+            self.timings["tokenizer"] = time.perf_counter() - phase
+
+            if probe:
+                phase = time.perf_counter()
+                try:
+                    await chatbot.probe_llm(timeout=timeout)
+                except Exception as e:
+                    self.errors["llm_probe"] = str(e) or type(e).__name__
+                self.timings["llm_probe"] = time.perf_counter() - phase
+
+            self.status = "degraded" if self.errors else "ready"
+        except Exception as e:
+            self.errors["load"] = str(e)
+            self.status = "failed"
+        self.timings["total"] = time.perf_counter() - started
+
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+        print(f"🤖 Chatbot warm-up {self.status}: {phases}")
+        for name, error in self.errors.items():
+            print(f"Chatbot warm-up {name} failed: {error}")
+        return self.get_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "lazy_import": self.lazy,
+            "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+            "errors": self.errors
+        }
+
+
+# Global instance
+chatbot_loader = ChatbotLoader()
+if not chatbot_loader.lazy:
+    chatbot_loader.module()
+
+# Helper functions for external use
+async def load_chatbot() -> ModuleType:
+    """The chatbot module, importing it now (off the event loop) if the import was deferred"""
+    return await chatbot_loader.load()
+
+async def warm_up_chatbot():
+    """Run the startup warm-up if enabled; otherwise the chatbot loads on first use"""
+    if CHATBOT_WARMUP:
+        await chatbot_loader.warm_up()
+
+def get_chatbot_warmup_stats() -> Dict[str, Any]:
+    """Get chatbot load status and cold-start phase timings"""
+    return chatbot_loader.get_stats()
+
+def get_chat_memory_stats() -> Optional[Dict[str, Any]]:
+    """Conversation memory statistics, once the chatbot stack is loaded"""
+    chat_memory = sys.modules.get("chat_memory")
+    return chat_memory.get_chat_memory_stats() if chat_memory else None
@@ -0,0 +1,206 @@
+"""
+Shared MongoDB Connection Layer for Toria
+One Motor client and connection pool per worker, shared by every service module
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MongoDB configuration
+MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'toria_db')
+
+# Connection pool configuration (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_RETRY_WRITES = os.getenv('MONGO_RETRY_WRITES', 'true').lower() == 'true'
+MONGO_RETRY_READS = os.getenv('MONGO_RETRY_READS', 'true').lower() == 'true'
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool counters from PyMongo's pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters"""
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.checkout_failures = 0
+            self.pools_cleared = 0
+
+    def _incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    # Pool lifecycle events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    # Connection lifecycle events
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._incr("checked_out")
+
+    def connection_checked_in(self, event):
+        self._incr("checked_out", -1)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a consistent copy of the counters"""
+        with self._lock:
+            return {
+                "open_connections": self.connections_created - self.connections_closed,
+                "in_use": self.checked_out,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared
+            }
+
+
+class DatabaseManager:
+    """Owns the single Motor client used by server, chatbot and notifications"""
+
+    def __init__(self, url: str = MONGO_URL, db_name: str = MONGO_DB_NAME):
+        self.url = url
+        self.db_name = db_name
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.pool_listener = PoolStatsListener()
+        self.connected_at: Optional[datetime] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.client is not None
+
+    def pool_options(self) -> Dict[str, Any]:
+        """Client options for the connection pool, timeouts and retries"""
+        return {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "retryWrites": MONGO_RETRY_WRITES,
+            "retryReads": MONGO_RETRY_READS
+        }
+
+    def _create_client(self):
+        self.pool_listener.reset()
+        self.client = AsyncIOMotorClient(
+            self.url,
+            event_listeners=[self.pool_listener],
+            **self.pool_options()
+        )
+        self.connected_at = datetime.utcnow()
+
+    async def connect(self):
+        """Create the shared client and verify the server is reachable"""
+        if self.client is not None:
+            return
+
+        self._create_client()
+
+        try:
+            await self.client.admin.command("ping")
+            print(f"🗄️ MongoDB connected (pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})")
+        except Exception as e:
+            # Keep the client: the driver reconnects on its own once Mongo is back
+            print(f"MongoDB ping failed on startup: {e}")
+
+    async def close(self):
+        """Close the shared client and release all pooled connections"""
+        if self.client is None:
+            return
+
+        self.client.close()
+        self.client = None
+        self.connected_at = None
+        print("🗄️ MongoDB connection closed")
+
+    def get_database(self) -> AsyncIOMotorDatabase:
+        """Return the application database, creating the client lazily if needed"""
+        if self.client is None:
+            # Scripts and one-off jobs may use the db without the FastAPI startup hook
+            self._create_client()
+        return self.client[self.db_name]
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Report pool configuration and live connection counters"""
+        return {
+            "connected": self.is_connected,
+            "connected_at": self.connected_at.isoformat() if self.connected_at else None,
+            "database": self.db_name,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            **self.pool_listener.snapshot()
+        }
+
+
+class _DatabaseProxy:
+    """Module-level `db` handle that always resolves to the shared client's database"""
+
+    def __getattr__(self, name: str):
+        return getattr(database_manager.get_database(), name)
+
+    def __getitem__(self, name: str):
+        return database_manager.get_database()[name]
+
+
+# Global instances
+database_manager = DatabaseManager()
+db = _DatabaseProxy()
+
+# Helper functions for external use
+async def connect_to_mongo():
+    """Open the shared MongoDB connection pool"""
+    await database_manager.connect()
+
+async def close_mongo_connection():
+    """Close the shared MongoDB connection pool"""
+    await database_manager.close()
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get connection pool statistics"""
+    return database_manager.pool_stats()
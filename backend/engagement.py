@@ -0,0 +1,217 @@
+"""
+Reel Engagement Service for Toria
+Idempotent per-user upvotes and saves with write-behind counter aggregation
+"""
+
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from database import db
+
+# Write-behind configuration
+ENGAGEMENT_FLUSH_INTERVAL = float(os.getenv('ENGAGEMENT_FLUSH_INTERVAL', '2.0'))
+ENGAGEMENT_MAX_PENDING_KEYS = int(os.getenv('ENGAGEMENT_MAX_PENDING_KEYS', '1000'))
+
+# (collection, key_field, key_value, upsert)
+CounterTarget = Tuple[str, str, str, bool]
+# A written target with the deltas that were applied to it
+FlushedCounter = Tuple[CounterTarget, Dict[str, int]]
+
+
+class WriteBehindCounter:
+    """Collects $inc deltas in memory and flushes them as bulk_write batches"""
+
+    def __init__(self, flush_interval: float = ENGAGEMENT_FLUSH_INTERVAL,
+                 max_pending_keys: int = ENGAGEMENT_MAX_PENDING_KEYS):
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        self.pending: Dict[CounterTarget, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.stats = {"increments": 0, "flushes": 0, "documents_flushed": 0, "flush_errors": 0}
+        self._flush_listeners: List[Callable[[List[FlushedCounter]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+
+    def increment(self, collection: str, key_field: str, key_value: str,
+                  field: str, amount: int = 1, upsert: bool = False):
+        """Buffer an increment; wakes the flusher early when the buffer gets large"""
+        self.pending[(collection, key_field, key_value, upsert)][field] += amount
+        self.stats["increments"] += 1
+
+        if len(self.pending) >= self.max_pending_keys:
+            self._wake.set()
+
+    def add_flush_listener(self, listener: Callable[[List[FlushedCounter]], None]):
+        """Register a callback invoked with the targets and deltas written by each flush"""
+        self._flush_listeners.append(listener)
+
+    def pending_delta(self, collection: str, key_field: str, key_value: str, field: str) -> int:
+        """Unflushed delta for one counter, so reads can stay current"""
+        total = 0
+        for upsert in (False, True):
+            deltas = self.pending.get((collection, key_field, key_value, upsert))
+            if deltas:
+                total += deltas.get(field, 0)
+        return total
+
+    async def flush(self) -> int:
+        """Write all buffered deltas; failed operations are merged back for the next flush"""
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+
+            batch, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+
+            operations: Dict[str, list] = defaultdict(list)
+            # Targets in the same order as each collection's operations
+            targets: Dict[str, List[CounterTarget]] = defaultdict(list)
+            for target, deltas in batch.items():
+                collection, key_field, key_value, upsert = target
+                increments = {field: amount for field, amount in deltas.items() if amount}
+                if increments:
+                    operations[collection].append(
+                        UpdateOne({key_field: key_value}, {"$inc": increments}, upsert=upsert)
+                    )
+                    targets[collection].append(target)
+
+            flushed = 0
+            written: List[FlushedCounter] = []
+            for collection, ops in operations.items():
+                try:
+                    await db[collection].bulk_write(ops, ordered=False)
+                    failed = set()
+                except BulkWriteError as e:
+                    # Unordered: every operation not listed in writeErrors was applied
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    print(f"Failed to flush {len(failed)} of {len(ops)} counter updates to {collection}: {e}")
+                    self.stats["flush_errors"] += 1
+                except PyMongoError as e:
+                    # No per-operation outcome; retry the whole batch
+                    failed = set(range(len(ops)))
+                    print(f"Failed to flush {len(ops)} counter updates to {collection}: {e}")
+                    self.stats["flush_errors"] += 1
+
+                for index, target in enumerate(targets[collection]):
+                    if index in failed:
+                        for field, amount in batch[target].items():
+                            self.pending[target][field] += amount
+                    else:
+                        written.append((target, dict(batch[target])))
+                flushed += len(ops) - len(failed)
+
+            self.stats["flushes"] += 1
+            self.stats["documents_flushed"] += flushed
+
+            for listener in self._flush_listeners:
+                try:
+                    listener(written)
+                except Exception as e:
+                    print(f"Counter flush listener failed: {e}")
+
+            return flushed
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write out anything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "pending_keys": len(self.pending)}
+
+
+class ReelEngagementService:
+    """Records upvotes and saves once per user and maintains reel counters"""
+
+    def __init__(self):
+        self.counters = WriteBehindCounter()
+
+    async def upvote(self, reel_id: str, user_id: str) -> bool:
+        """Upvote a reel; returns False when the user had already upvoted it"""
+        created = await self._record_once(db.reel_upvotes, {
+            "user_id": user_id,
+            "reel_id": reel_id
+        }, {"upvoted_at": datetime.utcnow().isoformat()})
+
+        if created:
+            # No upsert: engagement on an unknown reel id must not create a stub reel
+            self.counters.increment("reels", "id", reel_id, "upvotes")
+        return created
+
+    async def save(self, reel_id: str, user_id: str) -> bool:
+        """Save a reel; returns False when the user had already saved it"""
+        created = await self._record_once(db.saved_reels, {
+            "user_id": user_id,
+            "reel_id": reel_id
+        }, {"saved_at": datetime.utcnow().isoformat()})
+
+        if created:
+            self.counters.increment("reels", "id", reel_id, "saves")
+            self.counters.increment("users", "user_id", user_id, "stats.reels_saved")
+        return created
+
+    async def _record_once(self, collection, key: Dict[str, Any], fields: Dict[str, Any]) -> bool:
+        """Insert the (user, reel) record unless it exists; safe under concurrent taps"""
+        try:
+            result = await collection.update_one(key, {"$setOnInsert": {**key, **fields}}, upsert=True)
+            return result.upserted_id is not None
+        except DuplicateKeyError:
+            # A concurrent request won the upsert race
+            return False
+
+    def pending_counts(self, reel_id: str) -> Dict[str, int]:
+        """Unflushed upvote/save deltas for a reel"""
+        return {
+            "upvotes": self.counters.pending_delta("reels", "id", reel_id, "upvotes"),
+            "saves": self.counters.pending_delta("reels", "id", reel_id, "saves")
+        }
+
+
+# Global instance
+engagement_service = ReelEngagementService()
+
+# Helper functions for external use
+async def upvote_reel(reel_id: str, user_id: str) -> bool:
+    """Upvote a reel once per user"""
+    return await engagement_service.upvote(reel_id, user_id)
+
+async def save_reel(reel_id: str, user_id: str) -> bool:
+    """Save a reel once per user"""
+    return await engagement_service.save(reel_id, user_id)
+
+def start_engagement_flusher():
+    """Start the write-behind counter flusher"""
+    engagement_service.counters.start()
+
+async def stop_engagement_flusher():
+    """Flush pending counters and stop the flusher"""
+    await engagement_service.counters.stop()
+
+def get_engagement_stats() -> Dict[str, Any]:
+    """Get write-behind counter statistics"""
+    return engagement_service.counters.get_stats()
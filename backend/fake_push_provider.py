@@ -0,0 +1,68 @@
+"""
+Local Fake Push Provider for Toria
+Offline stand-in for a multicast push API, for throughput testing of the delivery pipeline
+
+Run:   python fake_push_provider.py --port 9099 --latency-ms 40 --failure-rate 0.02
+Point the backend at it with PUSH_TRANSPORT=http PUSH_PROVIDER_URL=http://localhost:9099/v1/send-multicast
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+MAX_TOKENS_PER_REQUEST = 500
+
+
+def create_app(latency_ms: float = 40.0, failure_rate: float = 0.0,
+               invalid_rate: float = 0.0, throttle_rate: float = 0.0) -> web.Application:
+    """Build the provider app; rates are per-token probabilities, throttle_rate is per request"""
+    stats = {"requests": 0, "tokens": 0, "throttled": 0, "started_at": time.time()}
+
+    async def send_multicast(request: web.Request) -> web.Response:
+        payload = await request.json()
+        tokens = payload.get("tokens", [])
+        if len(tokens) > MAX_TOKENS_PER_REQUEST:
+            return web.json_response({"error": f"at most {MAX_TOKENS_PER_REQUEST} tokens per request"}, status=400)
+
+        await asyncio.sleep(latency_ms / 1000)
+        stats["requests"] += 1
+        if random.random() < throttle_rate:
+            stats["throttled"] += 1
+            return web.json_response({"error": "rate limited"}, status=429)
+
+        results = []
+        for token in tokens:
+            roll = random.random()
+            if token.startswith("invalid") or roll < invalid_rate:
+                results.append({"token": token, "status": "invalid_token"})
+            elif roll < invalid_rate + failure_rate:
+                results.append({"token": token, "status": "retry"})
+            else:
+                results.append({"token": token, "status": "ok"})
+        stats["tokens"] += len(tokens)
+        return web.json_response({"results": results})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        elapsed = time.time() - stats["started_at"]
+        return web.json_response({**stats, "tokens_per_second": stats["tokens"] / elapsed if elapsed else 0})
+
+    app = web.Application()
+    app.router.add_post("/v1/send-multicast", send_multicast)
+    app.router.add_get("/v1/stats", get_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake multicast push provider")
+    parser.add_argument("--port", type=int, default=9099)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of tokens answered 'retry'")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of tokens answered 'invalid_token'")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered 429")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.latency_ms, args.failure_rate, args.invalid_rate, args.throttle_rate),
+                port=args.port)
@@ -0,0 +1,230 @@
+"""
+MongoDB Index Bootstrap and Query-Plan Diagnostics for Toria
+Creates the indexes behind the hot queries and checks their plans with explain()
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from database import db, connect_to_mongo, close_mongo_connection
+
+# Indexes per collection, named so repeated bootstraps are no-ops
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "day_plans": [
+        # get_user_day_plans: find({user_id}).sort(created_at desc, _id desc)
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_created_at_id"),
+        # schedule_trip_notifications: find({status, date range}).sort(date, _id)
+        IndexModel([("status", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)], name="status_date_id"),
+        # segment broadcasts: find({status, city, date range})
+        IndexModel([("status", ASCENDING), ("city", ASCENDING), ("date", ASCENDING)], name="status_city_date"),
+        # chatbot itinerary lookups: find_one({id, user_id})
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user"),
+    ],
+    "saved_reels": [
+        # get_saved_reels: find({user_id}).sort(saved_at desc, _id desc)
+        IndexModel([("user_id", ASCENDING), ("saved_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_saved_at_id"),
+        # one save per (user, reel)
+        IndexModel([("user_id", ASCENDING), ("reel_id", ASCENDING)], name="user_reel", unique=True),
+    ],
+    "reel_upvotes": [
+        # one upvote per (user, reel)
+        IndexModel([("user_id", ASCENDING), ("reel_id", ASCENDING)], name="user_reel", unique=True),
+    ],
+    "reels": [
+        # write-behind counter upserts: update({id})
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        # get_reels: find({location, type}).sort(position) and find({location}).sort(position)
+        IndexModel([("location", ASCENDING), ("type", ASCENDING), ("position", ASCENDING)],
+                   name="location_type_position"),
+        IndexModel([("location", ASCENDING), ("position", ASCENDING)], name="location_position"),
+    ],
+    "notifications": [
+        # get_user_notifications: find({user_id}).sort(sent_at desc, _id desc)
+        IndexModel([("user_id", ASCENDING), ("sent_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_sent_at_id"),
+        # mark-read updates and the one-time unread backfill: {user_id, read}
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING)], name="user_read"),
+    ],
+    "push_outbox": [
+        # delivery worker claims: find({status: pending, next_attempt_at <= now}).sort(next_attempt_at)
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        # reclaiming expired claims: find({status: sending, lease_until < now})
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        # reading back one worker's claim: find({claim_id})
+        IndexModel([("claim_id", ASCENDING)], name="claim_id", sparse=True),
+    ],
+    "push_tokens": [
+        # one owner per device token; token lookups on register and invalidation
+        IndexModel([("token", ASCENDING)], name="token", unique=True),
+        # fan-out to a user's devices: find({user_id: {$in}})
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "trip_plan_jobs": [
+        # plan jobs expire a day after they were submitted
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=86400),
+    ],
+    "response_cache": [
+        # persisted responses expire on their own
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "chat_threads": [
+        # deleting a user's conversation: delete_many({thread_id}); turns read by _id
+        IndexModel([("thread_id", ASCENDING)], name="thread_id"),
+    ],
+    "analytics_rollups": [
+        # rollup upserts and /api/analytics/summary range reads
+        IndexModel([("granularity", ASCENDING), ("user_id", ASCENDING), ("bucket", ASCENDING),
+                    ("event_name", ASCENDING)], name="granularity_user_bucket_event", unique=True),
+    ],
+    "users": [
+        # profile and preference lookups by user_id
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True),
+    ],
+}
+
+def _hot_queries() -> List[Dict[str, Any]]:
+    """The read paths that must be served by an index"""
+    now = datetime.utcnow()
+    day_after = now + timedelta(days=2)
+
+    return [
+        {
+            "name": "get_user_day_plans",
+            "collection": "day_plans",
+            "filter": {"user_id": "__explain__"},
+            "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        },
+        {
+            "name": "get_saved_reels",
+            "collection": "saved_reels",
+            "filter": {"user_id": "__explain__"},
+            "sort": [("saved_at", DESCENDING), ("_id", DESCENDING)],
+        },
+        {
+            "name": "get_user_notifications",
+            "collection": "notifications",
+            "filter": {"user_id": "__explain__"},
+            "sort": [("sent_at", DESCENDING), ("_id", DESCENDING)],
+        },
+        {
+            "name": "get_reels",
+            "collection": "reels",
+            "filter": {"location": "__explain__", "type": "Food"},
+            "sort": [("position", ASCENDING)],
+        },
+        {
+            "name": "schedule_trip_notifications",
+            "collection": "day_plans",
+            "filter": {
+                "date": {"$gte": now.isoformat(), "$lte": day_after.isoformat()},
+                "status": "upcoming",
+                "reminders_sent.12h": {"$exists": False},
+            },
+            "sort": [("date", ASCENDING), ("_id", ASCENDING)],
+        },
+        {
+            "name": "claim_push_outbox",
+            "collection": "push_outbox",
+            "filter": {"status": "pending", "next_attempt_at": {"$lte": now}},
+            "sort": [("next_attempt_at", ASCENDING)],
+        },
+        {
+            "name": "get_user_profile",
+            "collection": "users",
+            "filter": {"user_id": "__explain__"},
+            "sort": None,
+        },
+    ]
+
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Create all indexes; failures are logged per index and do not block startup"""
+    created = {}
+
+    for collection, models in INDEX_SPECS.items():
+        created[collection] = []
+        for model in models:
+            try:
+                created[collection].extend(await db[collection].create_indexes([model]))
+            except PyMongoError as e:
+                # e.g. a unique index over existing duplicates
+                print(f"Failed to create index {model.document['name']} on {collection}: {e}")
+
+    print(f"🗂️ Indexes ensured on {len(created)} collections")
+    return created
+
+
+def _collect_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of a winning plan tree"""
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_collect_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_collect_stages(child))
+
+    return stages
+
+
+async def explain_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Run explain() for one hot query and flag collection scans and in-memory sorts"""
+    cursor = db[query["collection"]].find(query["filter"])
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+
+    try:
+        explanation = await cursor.explain()
+    except PyMongoError as e:
+        return {"query": query["name"], "collection": query["collection"], "error": str(e)}
+
+    winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    stages = _collect_stages(winning_plan)
+
+    return {
+        "query": query["name"],
+        "collection": query["collection"],
+        "stages": stages,
+        "collection_scan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages,
+        "ok": "COLLSCAN" not in stages and "SORT" not in stages,
+    }
+
+
+async def explain_hot_queries() -> List[Dict[str, Any]]:
+    """Explain every hot query"""
+    return [await explain_query(query) for query in _hot_queries()]
+
+
+async def _main():
+    """CLI: python indexes.py [--create] - create indexes, then report query plans"""
+    import sys
+
+    await connect_to_mongo()
+    try:
+        if "--create" in sys.argv:
+            await ensure_indexes()
+
+        reports = await explain_hot_queries()
+        for report in reports:
+            status = "✅" if report.get("ok") else "❌"
+            print(f"{status} {report['query']} ({report['collection']}): {report.get('stages', report.get('error'))}")
+
+        print(json.dumps(reports, indent=2))
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,180 @@
+"""
+Lease-Based Leader Election for Toria
+Mongo-stored leases so each scheduled job runs on exactly one worker/replica
+"""
+
+import asyncio
+import contextvars
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from database import db
+
+# Lease configuration
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '15'))
+LEADER_RENEW_INTERVAL = float(os.getenv('LEADER_RENEW_INTERVAL', '5'))
+# Stop acting as leader this long before the lease could expire on the server
+LEADER_SAFETY_MARGIN = float(os.getenv('LEADER_SAFETY_MARGIN', '2'))
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Lease and fencing token held by the scheduled job running in this context
+current_fence: contextvars.ContextVar = contextvars.ContextVar("current_fence", default=None)
+
+
+class LeaseLostError(Exception):
+    """Raised when a job's fencing token is no longer the current lease holder"""
+
+
+class MongoLease:
+    """One named lease; holding it makes this instance the leader for that name
+
+    Expiry is computed with the server's $$NOW so clock skew between replicas
+    cannot produce two leaders. Each takeover increments a fencing token.
+    """
+
+    def __init__(self, name: str,
+                 ttl: float = LEADER_LEASE_TTL,
+                 renew_interval: float = LEADER_RENEW_INTERVAL,
+                 safety_margin: float = LEADER_SAFETY_MARGIN,
+                 owner: str = INSTANCE_ID):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.safety_margin = safety_margin
+        self.owner = owner
+
+        self.token: Optional[int] = None
+        self._valid_until = 0.0  # local monotonic deadline
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"acquired": 0, "renewed": 0, "lost": 0, "errors": 0}
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def _expiry(self):
+        return {"$add": ["$$NOW", int(self.ttl * 1000)]}
+
+    async def _renew(self) -> bool:
+        doc = await db.leader_leases.find_one_and_update(
+            {"_id": self.name, "owner": self.owner, "token": self.token},
+            [{"$set": {"expires_at": self._expiry(), "renewed_at": "$$NOW"}}],
+            return_document=ReturnDocument.AFTER
+        )
+        return doc is not None
+
+    async def _acquire(self) -> Optional[int]:
+        try:
+            doc = await db.leader_leases.find_one_and_update(
+                {"_id": self.name, "$expr": {"$lt": [{"$ifNull": ["$expires_at", _EPOCH]}, "$$NOW"]}},
+                [{"$set": {
+                    "owner": self.owner,
+                    "token": {"$add": [{"$ifNull": ["$token", 0]}, 1]},
+                    "expires_at": self._expiry(),
+                    "acquired_at": "$$NOW",
+                    "renewed_at": "$$NOW"
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The lease exists and is still held by someone else
+            return None
+        return doc["token"] if doc and doc.get("owner") == self.owner else None
+
+    async def campaign_once(self):
+        """Renew the lease if held, otherwise try to take it over"""
+        attempt_started = time.monotonic()
+        try:
+            if self.token is not None:
+                if await self._renew():
+                    self.stats["renewed"] += 1
+                    self._valid_until = attempt_started + self.ttl - self.safety_margin
+                    return
+                self._step_down()
+
+            token = await self._acquire()
+            if token is not None:
+                self.token = token
+                self._valid_until = attempt_started + self.ttl - self.safety_margin
+                self.stats["acquired"] += 1
+                print(f"👑 {self.owner} is leader for {self.name} (token {token})")
+        except PyMongoError as e:
+            # Keep the lease until the local deadline; renewal will retry
+            self.stats["errors"] += 1
+            print(f"Lease {self.name} campaign failed: {e}")
+
+    def _step_down(self):
+        if self.token is not None:
+            self.stats["lost"] += 1
+            print(f"Lost leadership for {self.name} (token {self.token})")
+        self.token = None
+        self._valid_until = 0.0
+
+    async def _run(self):
+        while True:
+            await self.campaign_once()
+            await asyncio.sleep(self.renew_interval)
+
+    def start(self):
+        """Start campaigning on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop campaigning and release the lease so another instance takes over at once"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.token is not None:
+            try:
+                await db.leader_leases.update_one(
+                    {"_id": self.name, "owner": self.owner, "token": self.token},
+                    {"$set": {"expires_at": _EPOCH}}
+                )
+            except PyMongoError as e:
+                print(f"Failed to release lease {self.name}: {e}")
+            self.token = None
+            self._valid_until = 0.0
+
+    async def validate(self, token: int):
+        """Fencing check: raise LeaseLostError unless `token` still holds the lease"""
+        if not self.is_leader or self.token != token:
+            raise LeaseLostError(f"Lease {self.name} token {token} is no longer current")
+        current = await db.leader_leases.find_one(
+            {"_id": self.name, "owner": self.owner, "token": token}, {"_id": 1}
+        )
+        if current is None:
+            self._step_down()
+            raise LeaseLostError(f"Lease {self.name} token {token} was superseded")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "leader": self.is_leader,
+            "token": self.token,
+            **self.stats
+        }
+
+
+async def ensure_fenced():
+    """Called by leader-only jobs before side effects; raises LeaseLostError when fenced out"""
+    fence = current_fence.get()
+    if fence is not None:
+        lease, token = fence
+        await lease.validate(token)
@@ -0,0 +1,146 @@
+"""
+LLM Gateway for Toria
+Bounded concurrency pool in front of every LLM-backed call, with per-request timeouts,
+queue-depth metrics and a fast fail when saturated
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Gateway configuration
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+# Callers allowed to wait for a slot; beyond this they get the fallback at once
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '32'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '2'))
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '30'))
+
+
+class LLMSaturated(Exception):
+    """Raised when no LLM slot is available within the queue limits"""
+
+
+class LLMGateway:
+    """Semaphore-limited pool shared by all LLM calls in this worker"""
+
+    def __init__(self,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 request_timeout: float = LLM_REQUEST_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.stats = {"requests": 0, "completed": 0, "rejected": 0, "queue_timeouts": 0,
+                      "timeouts": 0, "errors": 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the app's running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one concurrency slot; raises LLMSaturated instead of queueing without bound"""
+        semaphore = self._get_semaphore()
+        self.stats["requests"] += 1
+        # Admission is decided before any await, so a same-tick burst cannot overshoot the queue
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            self.stats["rejected"] += 1
+            raise LLMSaturated(f"LLM queue full ({self.waiting} waiting)")
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["queue_timeouts"] += 1
+            raise LLMSaturated(f"No LLM slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        self.total_wait += time.monotonic() - queued_at
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def run(self, call: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Run one LLM-backed call inside a slot, bounded by the request timeout"""
+        async with self.slot():
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout=timeout or self.request_timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            self.stats["completed"] += 1
+            self.total_latency += time.monotonic() - started
+            return result
+
+    async def stream(self, events: AsyncIterator[T], timeout: Optional[float] = None) -> AsyncIterator[T]:
+        """Relay a streaming call inside a slot; the timeout bounds the whole stream"""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            started = time.monotonic()
+            deadline = loop.time() + (timeout or self.request_timeout)
+            iterator = events.__aiter__()
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(iterator.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    yield item
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            self.stats["completed"] += 1
+            self.total_latency += time.monotonic() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        admitted = self.stats["requests"] - self.stats["rejected"] - self.stats["queue_timeouts"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "max_concurrency": self.max_concurrency,
+            "avg_wait_seconds": self.total_wait / admitted if admitted else None,
+            "avg_latency_seconds": self.total_latency / self.stats["completed"] if self.stats["completed"] else None
+        }
+
+
+# Global instance
+llm_gateway = LLMGateway()
+
+# Helper functions for external use
+def get_llm_gateway_stats() -> Dict[str, Any]:
+    """Get LLM pool and queue statistics"""
+    return llm_gateway.get_stats()
@@ -5,32 +5,65 @@ Handles trip reminders, recommendations, and real-time updates
 
 import os
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Set
 import json
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
 from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
-import schedule
-import time
-from threading import Thread
+from pagination import paginate, DEFAULT_PAGE_SIZE
+from scheduler import app_scheduler
+from leader import ensure_fenced, LeaseLostError
+from push import enqueue_push
+from unread import count_new_notifications
+from ratelimit import KeyedRateLimiter
+from engagement import engagement_service
 
 load_dotenv()
 
-# MongoDB connection
-MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.toria_db
+# Trip reminder job configuration
+TRIP_NOTIFICATION_INTERVAL = float(os.getenv('TRIP_NOTIFICATION_INTERVAL', '1800'))
+TRIP_NOTIFICATION_JITTER = float(os.getenv('TRIP_NOTIFICATION_JITTER', '60'))
+TRIP_NOTIFICATION_TIMEOUT = float(os.getenv('TRIP_NOTIFICATION_TIMEOUT', '900'))
+TRIP_SCAN_BATCH_SIZE = int(os.getenv('TRIP_SCAN_BATCH_SIZE', '500'))
+TRIP_SEND_CONCURRENCY = int(os.getenv('TRIP_SEND_CONCURRENCY', '20'))
+TRIP_SCAN_CHECKPOINT_ID = "trip_reminders"
+
+# Reminder -> (earliest, latest) hours before the trip
+TRIP_REMINDER_WINDOWS = {
+    "24h": (20, 28),
+    "12h": (10, 14)
+}
+
+# Per-user limits for event-driven notifications (location suggestions, feedback requests)
+NOTIFICATION_RATE_BURST = float(os.getenv('NOTIFICATION_RATE_BURST', '3'))
+NOTIFICATION_RATE_PER_HOUR = float(os.getenv('NOTIFICATION_RATE_PER_HOUR', '6'))
+# Same-type notifications arriving within this many seconds are merged into one digest
+NOTIFICATION_COALESCE_WINDOW = float(os.getenv('NOTIFICATION_COALESCE_WINDOW', '120'))
+
+# Shared MongoDB connection
+from database import db
 
 class NotificationService:
     """Handles push notifications for travel events"""
     
     def __init__(self):
-        self.notification_queue = []
+        self.rate_limiter = KeyedRateLimiter(NOTIFICATION_RATE_BURST, NOTIFICATION_RATE_PER_HOUR / 3600)
+        # (user_id, type) -> items held back while the coalescing window is open
+        self._windows: Dict[tuple, Dict[str, Any]] = {}
+        # Every window task, including those whose window closed and are delivering
+        self._window_tasks: Set[asyncio.Task] = set()
+        self.stats = {"sent_immediately": 0, "coalesced": 0, "digests_sent": 0, "suppressed": 0}
     
-    async def send_notification(self, user_id: str, title: str, body: str, data: Dict = None):
-        """Send push notification to user"""
+    async def send_notification(self, user_id: str, title: str, body: str, data: Dict = None,
+                                notification_id: Optional[ObjectId] = None):
+        """Store a notification and queue it for push delivery
+        
+        With a notification_id the store is an upsert, so retrying a send that failed
+        after the notification was stored does not store it twice.
+        """
         notification = {
             "user_id": user_id,
             "title": title,
@@ -38,16 +71,24 @@ class NotificationService:
             "data": data or {},
             "sent_at": datetime.utcnow(),
             "type": "push",
-            "status": "sent"
+            "status": "queued",
+            "read": False
         }
         
         try:
-            # Store notification in database
-            await db.notifications.insert_one(notification)
-            
-            # TODO: Integrate with FCM or push notification service
-            # For now, we'll log the notification
-            print(f"📱 Notification sent to {user_id}: {title} - {body}")
+            # Store notification, then hand it to the delivery workers via the outbox
+            if notification_id is None:
+                await db.notifications.insert_one(notification)
+                stored = True
+            else:
+                notification["_id"] = notification_id
+                result = await db.notifications.update_one(
+                    {"_id": notification_id}, {"$setOnInsert": notification}, upsert=True
+                )
+                stored = result.upserted_id is not None
+            if stored:
+                await count_new_notifications([user_id])
+            await enqueue_push([notification])
             
             return {"success": True, "notification_id": str(notification["_id"])}
             
@@ -55,43 +96,168 @@ class NotificationService:
             print(f"Failed to send notification: {e}")
             return {"success": False, "error": str(e)}
     
-    async def schedule_trip_notifications(self):
-        """Check for upcoming trips and schedule notifications"""
+    async def schedule_trip_notifications(self) -> Dict[str, int]:
+        """Scan all upcoming trips in batches and send each due reminder once
+        
+        The scan walks day_plans in (date, _id) order and checkpoints after every
+        batch, so a run cut short by a timeout, restart or failover resumes where
+        it stopped. Each reminder is claimed on the trip document before sending.
+        """
         
-        # Get trips starting in the next 48 hours
-        tomorrow = datetime.utcnow() + timedelta(days=1)
-        day_after = datetime.utcnow() + timedelta(days=2)
+        now = datetime.utcnow()
+        totals = {"scanned": 0, "sent": 0, "already_sent": 0, "failed": 0}
         
         try:
-            upcoming_trips = await db.day_plans.find({
-                "date": {
-                    "$gte": tomorrow.isoformat(),
-                    "$lte": day_after.isoformat()
-                },
-                "status": "upcoming"
-            }).to_list(length=100)
+            checkpoint = await self._load_scan_checkpoint(now)
             
-            for trip in upcoming_trips:
-                user_id = trip.get("user_id")
-                trip_date = datetime.fromisoformat(trip.get("date", ""))
-                city = trip.get("city", "your destination")
+            while True:
+                # Another replica may have taken over the lease while we were working
+                await ensure_fenced()
+                
+                batch = await self._next_trip_batch(checkpoint)
+                if not batch:
+                    break
+                
+                semaphore = asyncio.Semaphore(TRIP_SEND_CONCURRENCY)
+                results = await asyncio.gather(*(
+                    self._send_due_reminder(trip, semaphore) for trip in batch
+                ))
                 
-                # Calculate time until trip
-                time_until_trip = trip_date - datetime.utcnow()
-                hours_until = int(time_until_trip.total_seconds() / 3600)
+                totals["scanned"] += len(batch)
+                for result in results:
+                    if result in totals:
+                        totals[result] += 1
                 
-                # 24 hours before trip - Tips & Recommendations
-                if 20 <= hours_until <= 28:
-                    await self.send_trip_preparation_notification(user_id, trip, city)
+                last = batch[-1]
+                checkpoint["last_date"] = last.get("date")
+                checkpoint["last_id"] = last["_id"]
+                await self._save_scan_checkpoint(checkpoint)
                 
-                # 12 hours before trip - Last-minute suggestions
-                elif 10 <= hours_until <= 14:
-                    await self.send_trip_reminder_notification(user_id, trip, city)
+                if len(batch) < TRIP_SCAN_BATCH_SIZE:
+                    break
+            
+            checkpoint["status"] = "complete"
+            await self._save_scan_checkpoint(checkpoint)
+            print(f"📅 Trip reminder scan: {totals}")
         
+        except LeaseLostError:
+            raise
         except Exception as e:
             print(f"Error scheduling trip notifications: {e}")
+        
+        return totals
     
-    async def send_trip_preparation_notification(self, user_id: str, trip: Dict, city: str):
+    async def _load_scan_checkpoint(self, now: datetime) -> Dict[str, Any]:
+        """Resume an interrupted scan, or start a new one over the reminder window"""
+        checkpoint = await db.job_checkpoints.find_one({"_id": TRIP_SCAN_CHECKPOINT_ID})
+        resumable_since = now - timedelta(seconds=TRIP_NOTIFICATION_INTERVAL * 2)
+        if (checkpoint and checkpoint.get("status") == "in_progress"
+                and checkpoint.get("started_at", now) >= resumable_since):
+            print(f"📅 Resuming trip reminder scan after {checkpoint.get('last_date')}")
+            return checkpoint
+        
+        # Covers both the 24h (20-28h out) and 12h (10-14h out) reminders
+        checkpoint = {
+            "_id": TRIP_SCAN_CHECKPOINT_ID,
+            "status": "in_progress",
+            "window_start": now.isoformat(),
+            "window_end": (now + timedelta(hours=TRIP_REMINDER_WINDOWS["24h"][1] + 1)).isoformat(),
+            "last_date": None,
+            "last_id": None,
+            "started_at": now
+        }
+        await self._save_scan_checkpoint(checkpoint)
+        return checkpoint
+    
+    async def _save_scan_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint["updated_at"] = datetime.utcnow()
+        await db.job_checkpoints.replace_one({"_id": checkpoint["_id"]}, checkpoint, upsert=True)
+    
+    async def _next_trip_batch(self, checkpoint: Dict[str, Any]) -> List[Dict]:
+        """Next batch after the checkpoint, keyset-ordered on (date, _id)"""
+        query: Dict[str, Any] = {
+            "status": "upcoming",
+            "date": {"$gte": checkpoint["window_start"], "$lte": checkpoint["window_end"]},
+            # Trips that already got both reminders have nothing left to send
+            "reminders_sent.12h": {"$exists": False}
+        }
+        if checkpoint.get("last_id") is not None:
+            query = {"$and": [query, {"$or": [
+                {"date": {"$gt": checkpoint["last_date"]}},
+                {"date": checkpoint["last_date"], "_id": {"$gt": checkpoint["last_id"]}}
+            ]}]}
+        
+        return await db.day_plans.find(
+            query, {"id": 1, "user_id": 1, "city": 1, "focus": 1, "date": 1, "reminders_sent": 1}
+        ).sort([("date", 1), ("_id", 1)]).limit(TRIP_SCAN_BATCH_SIZE).to_list(length=TRIP_SCAN_BATCH_SIZE)
+    
+    def _due_reminder(self, trip: Dict, now: datetime) -> Optional[str]:
+        """Which reminder ('24h' or '12h') is due for a trip right now, if any"""
+        try:
+            trip_date = datetime.fromisoformat(trip.get("date", ""))
+        except (TypeError, ValueError):
+            return None
+        if trip_date.tzinfo is not None:
+            # Stored dates may carry an offset; compare in naive UTC like utcnow()
+            trip_date = trip_date.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        hours_until = (trip_date - now).total_seconds() / 3600
+        for reminder, (earliest, latest) in TRIP_REMINDER_WINDOWS.items():
+            if earliest <= hours_until <= latest:
+                return reminder
+        return None
+    
+    async def _send_due_reminder(self, trip: Dict, semaphore: asyncio.Semaphore) -> str:
+        """Claim and send the due reminder for one trip; returns the outcome"""
+        reminder = self._due_reminder(trip, datetime.utcnow())
+        if reminder is None:
+            return "not_due"
+        
+        user_id = trip.get("user_id")
+        city = trip.get("city", "your destination")
+        
+        async with semaphore:
+            # Claim first so concurrent or repeated runs never send the same reminder twice;
+            # claiming inside the semaphore leaves queued trips unclaimed if the run stops
+            claimed = await db.day_plans.update_one(
+                {"_id": trip["_id"], f"reminders_sent.{reminder}": {"$exists": False}},
+                {"$set": {f"reminders_sent.{reminder}": datetime.utcnow()}}
+            )
+            if claimed.modified_count == 0:
+                return "already_sent"
+            
+            notification_id = self._reminder_notification_id(trip, reminder)
+            try:
+                if reminder == "24h":
+                    # 24 hours before trip - Tips & Recommendations
+                    result = await self.send_trip_preparation_notification(user_id, trip, city, notification_id)
+                else:
+                    # 12 hours before trip - Last-minute suggestions
+                    result = await self.send_trip_reminder_notification(user_id, trip, city, notification_id)
+            except BaseException:
+                # Cancelled (shutdown, lost lease) or crashed mid-send: let the next run retry
+                await asyncio.shield(self._release_reminder(trip, reminder))
+                raise
+        
+        if not result or not result.get("success"):
+            await self._release_reminder(trip, reminder)
+            return "failed"
+        return "sent"
+    
+    @staticmethod
+    def _reminder_notification_id(trip: Dict, reminder: str) -> ObjectId:
+        """The same _id on every attempt at one trip's reminder, so retries upsert one notification"""
+        # Hash bytes rather than a timestamp; notifications are ordered by sent_at, not _id
+        return ObjectId(hashlib.sha1(f"{trip['_id']}:{reminder}".encode("utf-8")).digest()[:12])
+    
+    async def _release_reminder(self, trip: Dict, reminder: str):
+        """Release a reminder claim so the next run retries it"""
+        await db.day_plans.update_one(
+            {"_id": trip["_id"]}, {"$unset": {f"reminders_sent.{reminder}": ""}}
+        )
+    
+    async def send_trip_preparation_notification(self, user_id: str, trip: Dict, city: str,
+                                                 notification_id: Optional[ObjectId] = None):
         """Send preparation notification 24 hours before trip"""
         
         title = f"🎒 Trip to {city} Tomorrow!"
@@ -108,9 +274,10 @@ class NotificationService:
             ]
         }
         
-        await self.send_notification(user_id, title, body, data)
+        return await self.send_notification(user_id, title, body, data, notification_id)
     
-    async def send_trip_reminder_notification(self, user_id: str, trip: Dict, city: str):
+    async def send_trip_reminder_notification(self, user_id: str, trip: Dict, city: str,
+                                              notification_id: Optional[ObjectId] = None):
         """Send reminder notification 12 hours before trip"""
         
         title = f"⏰ {city} Trip Starting Soon!"
@@ -127,35 +294,124 @@ class NotificationService:
             ]
         }
         
-        await self.send_notification(user_id, title, body, data)
+        return await self.send_notification(user_id, title, body, data, notification_id)
     
     async def send_location_suggestions(self, user_id: str, current_location: str, suggestions: List[Dict]):
         """Send nearby alternatives when user finishes early"""
+        return await self._send_coalesced(user_id, "location_suggestions", {
+            "current_location": current_location,
+            "suggestions": suggestions
+        })
+    
+    async def send_feedback_reminder(self, user_id: str, completed_stop: str):
+        """Send feedback request after completing a stop"""
+        return await self._send_coalesced(user_id, "feedback_request", {"stop_name": completed_stop})
+    
+    def _build_location_suggestions(self, items: List[Dict]) -> tuple:
+        if len(items) == 1:
+            item = items[0]
+            title = f"🌟 Finished Early? Great Options Nearby!"
+            body = f"Found {len(item['suggestions'])} amazing places near {item['current_location']}"
+            data = {"type": "location_suggestions", **item}
+            return title, body, data
         
-        title = f"🌟 Finished Early? Great Options Nearby!"
-        body = f"Found {len(suggestions)} amazing places near {current_location}"
-        
+        locations = list(dict.fromkeys(item["current_location"] for item in items))
+        suggestions = [s for item in items for s in item["suggestions"]]
+        title = f"🌟 {len(suggestions)} Great Options Nearby!"
+        body = f"Places worth a detour near {', '.join(locations[:3])}"
         data = {
             "type": "location_suggestions",
-            "current_location": current_location,
+            "digest": True,
+            "current_location": locations[-1],
+            "locations": locations,
             "suggestions": suggestions
         }
+        return title, body, data
+    
+    def _build_feedback_request(self, items: List[Dict]) -> tuple:
+        stops = list(dict.fromkeys(item["stop_name"] for item in items))
+        actions = ["Rate experience", "Add photos", "Write review"]
+        if len(stops) == 1:
+            title = f"💭 How was {stops[0]}?"
+            body = "Share your experience to help other travelers!"
+            return title, body, {"type": "feedback_request", "stop_name": stops[0], "actions": actions}
         
+        title = f"💭 How were your last {len(stops)} stops?"
+        body = f"Rate {', '.join(stops[:2])}{' and more' if len(stops) > 2 else ''} to help other travelers!"
+        data = {"type": "feedback_request", "digest": True, "stop_names": stops, "actions": actions}
+        return title, body, data
+    
+    async def _deliver(self, user_id: str, kind: str, items: List[Dict]):
+        build = self._build_location_suggestions if kind == "location_suggestions" else self._build_feedback_request
+        title, body, data = build(items)
         return await self.send_notification(user_id, title, body, data)
     
-    async def send_feedback_reminder(self, user_id: str, completed_stop: str):
-        """Send feedback request after completing a stop"""
+    async def _send_coalesced(self, user_id: str, kind: str, item: Dict) -> Dict[str, Any]:
+        """Leading-edge send, then hold same-type notifications until the window closes
         
-        title = f"💭 How was {completed_stop}?"
-        body = "Share your experience to help other travelers!"
+        The first notification goes out at once if the user's token bucket allows it.
+        Anything of the same type arriving inside the window is merged into one digest
+        sent when the window closes; a digest the bucket refuses is suppressed.
+        """
+        key = (user_id, kind)
+        window = self._windows.get(key)
+        if window is not None:
+            window["items"].append(item)
+            self.stats["coalesced"] += 1
+            return {"success": True, "coalesced": True, "pending": len(window["items"])}
         
-        data = {
-            "type": "feedback_request",
-            "stop_name": completed_stop,
-            "actions": ["Rate experience", "Add photos", "Write review"]
-        }
+        window = {"items": []}
+        self._windows[key] = window
+        window["task"] = asyncio.create_task(self._close_window(key, NOTIFICATION_COALESCE_WINDOW))
+        self._window_tasks.add(window["task"])
+        window["task"].add_done_callback(self._window_tasks.discard)
         
-        return await self.send_notification(user_id, title, body, data)
+        if self.rate_limiter.allow(user_id):
+            self.stats["sent_immediately"] += 1
+            return await self._deliver(user_id, kind, [item])
+        
+        # Over the limit: hold it in case the bucket refills before the window closes
+        window["items"].append(item)
+        return {"success": True, "coalesced": True, "pending": 1}
+    
+    async def _close_window(self, key: tuple, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        window = self._windows.pop(key, None)
+        if not window or not window["items"]:
+            return
+        
+        user_id, kind = key
+        items = window["items"]
+        if self.rate_limiter.allow(user_id):
+            self.stats["digests_sent"] += 1
+            await self._deliver(user_id, kind, items)
+        else:
+            self.stats["suppressed"] += len(items)
+            engagement_service.counters.increment(
+                "users", "user_id", user_id, f"stats.notifications_suppressed.{kind}", len(items)
+            )
+    
+    async def flush_coalesced(self):
+        """Close every open coalescing window now and wait for digests being delivered (used on shutdown)"""
+        windows = list(self._windows.items())
+        # A window still registered means its task is asleep; one that closed is mid-delivery
+        waiting = {window["task"] for _, window in windows}
+        for task in waiting:
+            task.cancel()
+        delivering = [task for task in self._window_tasks if task not in waiting]
+        await asyncio.gather(
+            *(self._close_window(key, 0) for key, _ in windows),
+            *delivering,
+            return_exceptions=True
+        )
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "open_windows": len(self._windows),
+            "rate_limiter": self.rate_limiter.get_stats()
+        }
     
     async def get_user_notifications(self, user_id: str, limit: int = 20) -> List[Dict]:
         """Get user's notification history"""
@@ -170,10 +426,17 @@ class NotificationService:
         except Exception as e:
             print(f"Error fetching notifications: {e}")
             return []
+    
+    async def get_user_notifications_page(self, user_id: str, limit: int = DEFAULT_PAGE_SIZE,
+                                          cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get one page of notification history, newest first, keyset-paginated on (sent_at, _id)"""
+        return await paginate(db.notifications, {"user_id": user_id}, "sent_at", limit, cursor)
 
 # Notification scheduler
 class NotificationScheduler:
-    """Background scheduler for automated notifications"""
+    """Registers automated notification jobs on the app's asyncio scheduler"""
+    
+    JOB_NAME = "trip_notifications"
     
     def __init__(self):
         self.service = NotificationService()
@@ -182,30 +445,26 @@ class NotificationScheduler:
     def start_scheduler(self):
         """Start the background notification scheduler"""
         
-        # Schedule checks every 30 minutes
-        schedule.every(30).minutes.do(self._run_async_job)
+        # Check for upcoming trips every 30 minutes, on the app's event loop
+        app_scheduler.add_job(
+            self.JOB_NAME,
+            self.service.schedule_trip_notifications,
+            interval=TRIP_NOTIFICATION_INTERVAL,
+            jitter=TRIP_NOTIFICATION_JITTER,
+            initial_delay=10,
+            timeout=TRIP_NOTIFICATION_TIMEOUT,
+            leader_only=True
+        )
+        app_scheduler.start()
         
         self.running = True
-        
-        def run_scheduler():
-            while self.running:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
-        
-        # Run scheduler in background thread
-        scheduler_thread = Thread(target=run_scheduler, daemon=True)
-        scheduler_thread.start()
-        
         print("📅 Notification scheduler started")
     
     def stop_scheduler(self):
         """Stop the notification scheduler"""
+        app_scheduler.remove_job(self.JOB_NAME)
         self.running = False
         print("📅 Notification scheduler stopped")
-    
-    def _run_async_job(self):
-        """Run async notification job"""
-        asyncio.create_task(self.service.schedule_trip_notifications())
 
 # Global instances
 notification_service = NotificationService()
@@ -228,6 +487,18 @@ async def get_user_notifications(user_id: str, limit: int = 20):
     """Get user notifications"""
     return await notification_service.get_user_notifications(user_id, limit)
 
+async def get_user_notifications_page(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    """Get a page of user notifications"""
+    return await notification_service.get_user_notifications_page(user_id, limit, cursor)
+
+async def flush_coalesced_notifications():
+    """Send or suppress notifications held in coalescing windows"""
+    await notification_service.flush_coalesced()
+
+def get_notification_stats() -> Dict[str, Any]:
+    """Get coalescing and rate-limit statistics"""
+    return notification_service.get_coalescing_stats()
+
 def start_notification_scheduler():
     """Start automated notification scheduling"""
     notification_scheduler.start_scheduler()
@@ -0,0 +1,92 @@
+"""
+Keyset Pagination for Toria
+Opaque cursors over (sort_field, _id) so deep pages never need skip()
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def clamp_page_size(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Keep page sizes within [1, MAX_PAGE_SIZE]"""
+    if limit is None:
+        return default
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort_value: Any, doc_id: Any) -> str:
+    """Encode the last (sort_value, _id) of a page as an opaque URL-safe token"""
+    payload = {
+        "v": sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value,
+        "dt": isinstance(sort_value, datetime),
+        "id": str(doc_id),
+        "oid": isinstance(doc_id, ObjectId)
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """Decode a cursor from encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort_value = payload["v"]
+        if payload.get("dt"):
+            sort_value = datetime.fromisoformat(sort_value)
+        doc_id = ObjectId(payload["id"]) if payload.get("oid") else payload["id"]
+        return sort_value, doc_id
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_query(query: Dict[str, Any], sort_field: str, cursor: Optional[str]) -> Dict[str, Any]:
+    """Extend a filter so it only matches documents after the cursor (descending order)"""
+    if not cursor:
+        return query
+
+    sort_value, doc_id = decode_cursor(cursor)
+    after_cursor = {
+        "$or": [
+            {sort_field: {"$lt": sort_value}},
+            {sort_field: sort_value, "_id": {"$lt": doc_id}}
+        ]
+    }
+    return {"$and": [query, after_cursor]} if query else after_cursor
+
+
+async def paginate(collection,
+                   query: Dict[str, Any],
+                   sort_field: str,
+                   limit: int = DEFAULT_PAGE_SIZE,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Fetch one page, newest first, ordered by (sort_field, _id)"""
+    limit = clamp_page_size(limit)
+
+    # Read one extra document to know whether another page exists
+    docs = await collection.find(keyset_query(query, sort_field, cursor)).sort(
+        [(sort_field, DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    next_cursor = None
+    if has_more and docs:
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["_id"])
+
+    return {
+        "items": docs,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
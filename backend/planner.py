@@ -0,0 +1,312 @@
+"""
+Itinerary Planner for Toria
+Trip plan generation and background plan jobs whose stops stream as they are produced
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import PyMongoError
+
+from database import db
+from response_cache import trip_plan_cache
+from streaming import format_sse
+
+# Job pool configuration
+PLAN_JOB_WORKERS = int(os.getenv('PLAN_JOB_WORKERS', '4'))
+PLAN_JOB_QUEUE_SIZE = int(os.getenv('PLAN_JOB_QUEUE_SIZE', '200'))
+PLAN_JOB_TIMEOUT = float(os.getenv('PLAN_JOB_TIMEOUT', '120'))
+# How often an event stream re-reads a job that is running on another replica
+PLAN_JOB_POLL_INTERVAL = float(os.getenv('PLAN_JOB_POLL_INTERVAL', '1.0'))
+
+FINISHED_STATES = ("completed", "failed", "interrupted")
+
+# (request fields, generated plan) -> stored itinerary returned to the client
+PlanFinalizer = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class PlanQueueFull(Exception):
+    """Raised when no more plan jobs can be queued"""
+
+
+def trip_plan_params(request: Dict[str, Any]) -> Dict[str, Any]:
+    """The inputs that determine a generated plan; user, date and time do not"""
+    return {
+        "places": request.get("places", []),
+        "going_with": request.get("going_with", ""),
+        "focus": request.get("focus", ""),
+        "duration": request.get("duration"),
+        "duration_unit": request.get("duration_unit", ""),
+        "preferences": request.get("preferences", {})
+    }
+
+
+def trip_plan_overview(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything in a plan except its stops"""
+    places = params["places"]
+    going_with = params["going_with"]
+    return {
+        "title": f"{', '.join(places)} {params['focus'].title()} Adventure",
+        "city": places[0] if places else "Delhi",
+        "going_with": going_with,
+        "focus": params["focus"],
+        "duration": f"{params['duration']} {params['duration_unit']}",
+        "total_stops": 6,
+        "ai_recommendations": [
+            f"Perfect for {going_with.lower()} trips",
+            f"Great {params['focus']} experiences",
+            f"Ideal {params['duration_unit']} itinerary"
+        ],
+        "estimated_total_cost": "₹2,000 - ₹3,500"
+    }
+
+
+async def generate_trip_stops(params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield stops one at a time, as a streaming planner produces them"""
+    # Mock AI response - replace with actual LangChain integration
+    for i in range(6):
+        await asyncio.sleep(0)
+        yield {
+            "id": f"stop_{i}",
+            "name": f"Amazing {params['focus']} Spot {i}",
+            "type": "Food" if i % 2 == 0 else "Place",
+            "time_window": f"{9 + i * 2}:00 - {11 + i * 2}:00",
+            "quick_info": f"Perfect for {params['going_with'].lower()} trips. Try the signature experience!",
+            "estimated_duration": "2 hours",
+            "cost_estimate": f"₹{(i + 1) * 200}"
+        }
+
+
+async def generate_trip_plan(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate a whole plan body"""
+    return {**trip_plan_overview(params), "stops": [stop async for stop in generate_trip_stops(params)]}
+
+
+class PlanJobQueue:
+    """Bounded worker pool for plan generation; progress lives in trip_plan_jobs"""
+
+    def __init__(self, workers: int = PLAN_JOB_WORKERS, queue_size: int = PLAN_JOB_QUEUE_SIZE,
+                 timeout: float = PLAN_JOB_TIMEOUT):
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._active: Dict[str, Dict[str, Any]] = {}
+        # job_id -> event set whenever that job's document changes on this replica
+        self._updates: Dict[str, asyncio.Event] = {}
+        self._finalizer: Optional[PlanFinalizer] = None
+        # Slots held by submissions still writing their job document
+        self._reserved = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "cache_hits": 0}
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the app's running loop
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        return self.queue
+
+    def set_finalizer(self, finalizer: PlanFinalizer):
+        """Register how a finished plan is stored and turned into the client response"""
+        self._finalizer = finalizer
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a job and queue it; raises PlanQueueFull when the pool is saturated"""
+        queue = self._get_queue()
+        # Reserve the slot before awaiting the insert so a burst cannot overfill the queue
+        if queue.maxsize and queue.qsize() + self._reserved >= queue.maxsize:
+            self.stats["rejected"] += 1
+            raise PlanQueueFull(f"Plan queue full ({queue.qsize()}/{queue.maxsize})")
+
+        now = datetime.utcnow()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "user_id": request.get("user_id"),
+            "request": request,
+            "status": "queued",
+            "stops": [],
+            "stops_done": 0,
+            "total_stops": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        self._reserved += 1
+        try:
+            await db.trip_plan_jobs.insert_one(job)
+            queue.put_nowait(job)
+        finally:
+            self._reserved -= 1
+        self.stats["submitted"] += 1
+        return {"job_id": job["_id"], "status": "queued", "queue_position": queue.qsize()}
+
+    def _notify(self, job_id: str):
+        event = self._updates.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _update(self, job_id: str, update: Dict[str, Any]):
+        update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+        await db.trip_plan_jobs.update_one({"_id": job_id}, update)
+        self._notify(job_id)
+
+    async def _generate(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        params = trip_plan_params(job["request"])
+        cached = trip_plan_cache.peek(params)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            await self._update(job["_id"], {"$set": {
+                "stops": cached["stops"], "stops_done": len(cached["stops"]), "total_stops": len(cached["stops"])
+            }})
+            return cached
+
+        overview = trip_plan_overview(params)
+        await self._update(job["_id"], {"$set": {"total_stops": overview["total_stops"]}})
+        stops = []
+        async for stop in generate_trip_stops(params):
+            stops.append(stop)
+            await self._update(job["_id"], {"$push": {"stops": stop}, "$inc": {"stops_done": 1}})
+
+        plan = {**overview, "stops": stops}
+        trip_plan_cache.put(params, plan)
+        return plan
+
+    async def _process(self, job: Dict[str, Any]):
+        job_id = job["_id"]
+        self._active[job_id] = job
+        try:
+            await self._update(job_id, {"$set": {"status": "running", "started_at": datetime.utcnow()}})
+            plan = await asyncio.wait_for(self._generate(job), timeout=self.timeout)
+            result = await self._finalizer(job["request"], plan) if self._finalizer else plan
+            await self._update(job_id, {"$set": {
+                "status": "completed",
+                "itinerary_id": result.get("itinerary_id"),
+                "result": result,
+                "finished_at": datetime.utcnow()
+            }})
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            error = f"timed out after {self.timeout}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            print(f"Plan job {job_id} failed: {error}")
+            try:
+                await self._update(job_id, {"$set": {"status": "failed", "error": error, "finished_at": datetime.utcnow()}})
+            except PyMongoError:
+                pass
+        finally:
+            self._active.pop(job_id, None)
+
+    async def _worker(self):
+        queue = self._get_queue()
+        while True:
+            job = await queue.get()
+            try:
+                await self._process(job)
+            finally:
+                queue.task_done()
+
+    def start(self):
+        """Start plan workers on the running event loop"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        """Cancel workers; unfinished jobs are recorded as interrupted"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        unfinished = list(self._active)
+        queue = self._get_queue()
+        while not queue.empty():
+            unfinished.append(queue.get_nowait()["_id"])
+        self._active.clear()
+        if unfinished:
+            await db.trip_plan_jobs.update_many(
+                {"_id": {"$in": unfinished}, "status": {"$nin": list(FINISHED_STATES)}},
+                {"$set": {"status": "interrupted", "finished_at": datetime.utcnow()}}
+            )
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await db.trip_plan_jobs.find_one({"_id": job_id})
+
+    async def _wait_for_update(self, job_id: str):
+        event = self._updates.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=PLAN_JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    async def stream_events(self, job: Dict[str, Any]) -> AsyncIterator[str]:
+        """Server-sent events: one `stop` per stop as it lands, then `completed` or `failed`"""
+        job_id = job["_id"]
+        sent = 0
+        last_status = None
+        try:
+            while True:
+                if job["status"] != last_status:
+                    last_status = job["status"]
+                    yield format_sse("status", {"job_id": job_id, "status": last_status, "total_stops": job.get("total_stops")})
+
+                for stop in job.get("stops", [])[sent:]:
+                    yield format_sse("stop", {"index": sent, "stop": stop})
+                    sent += 1
+
+                if job["status"] == "completed":
+                    yield format_sse("completed", job.get("result"))
+                    return
+                if job["status"] in FINISHED_STATES:
+                    yield format_sse("failed", {"status": job["status"], "error": job.get("error")})
+                    return
+
+                await self._wait_for_update(job_id)
+                job = await self.get_job(job_id)
+                if job is None:
+                    return
+        finally:
+            # Waiters re-create the event on their next wait
+            self._updates.pop(job_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        queue = self._get_queue()
+        return {
+            **self.stats,
+            "workers": len(self._workers),
+            "running": len(self._active),
+            "queue_depth": queue.qsize(),
+            "queue_capacity": queue.maxsize
+        }
+
+
+# Global instance
+plan_jobs = PlanJobQueue()
+
+# Helper functions for external use
+async def submit_plan_job(request: Dict[str, Any]):
+    """Queue a plan generation job"""
+    return await plan_jobs.submit(request)
+
+async def get_plan_job(job_id: str):
+    """Get a plan job and its progress"""
+    return await plan_jobs.get_job(job_id)
+
+def stream_plan_job_events(job: Dict[str, Any]) -> AsyncIterator[str]:
+    """Server-sent event stream for a plan job"""
+    return plan_jobs.stream_events(job)
+
+def start_plan_workers():
+    """Start the plan generation worker pool"""
+    plan_jobs.start()
+
+async def stop_plan_workers():
+    """Stop plan workers"""
+    await plan_jobs.stop()
+
+def get_plan_job_stats() -> Dict[str, Any]:
+    """Get plan job pool statistics"""
+    return plan_jobs.get_stats()
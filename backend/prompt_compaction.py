@@ -0,0 +1,193 @@
+"""
+Prompt Compaction for Toria
+Projects itineraries and preferences down to what each chat context needs, renders
+them as compact text and trims them to a token budget before they reach the LLM
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Try to use a real BPE tokenizer for the estimate; fall back to a character heuristic
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Compaction configuration (tokens)
+CHAT_ITINERARY_TOKEN_BUDGET = int(os.getenv('CHAT_ITINERARY_TOKEN_BUDGET', '600'))
+CHAT_PREFERENCES_TOKEN_BUDGET = int(os.getenv('CHAT_PREFERENCES_TOKEN_BUDGET', '150'))
+
+CHARS_PER_TOKEN = 4
+
+# Plan and stop fields each context puts in front of the model
+PLAN_FIELDS = {
+    "start_my_day": ("title", "city", "date"),
+    "profile_dayplans": ("title", "city", "date", "status", "going_with", "focus"),
+}
+STOP_FIELDS = {
+    "start_my_day": ("time_window", "name", "type", "quick_info"),
+    "profile_dayplans": ("time_window", "name", "type"),
+}
+# Stop fields given up first when an itinerary is over budget
+OPTIONAL_STOP_FIELDS = ("quick_info",)
+
+
+class TokenEstimator:
+    """Local token count estimate; no network call to the model provider"""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._loading = False
+
+    def load(self):
+        """Load the BPE encoding; tiktoken may fetch its file once, so call this off the event loop"""
+        if self._loaded:
+            return
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                print(f"Tokenizer unavailable, estimating from characters: {e}")
+        self._loaded = True
+
+    def _get_encoding(self):
+        # Not preloaded: load in a worker thread and estimate from characters until it is ready
+        if not self._loaded and not self._loading:
+            self._loading = True
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self.load)
+            except RuntimeError:
+                # No event loop to block
+                self.load()
+        return self._encoding
+
+    @property
+    def name(self) -> str:
+        if not self._loaded:
+            return "loading" if self._loading else "not loaded"
+        return self.encoding_name if self._encoding is not None else "chars"
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def is_stop_done(stop: Dict[str, Any]) -> bool:
+    """Stops checked off in Start My Day or marked visited in My Day Plans"""
+    return bool(stop.get("completed") or stop.get("is_visited"))
+
+
+def _render_stop(index: int, stop: Dict[str, Any], fields: tuple) -> str:
+    parts = [str(stop[field]) for field in fields if field != "quick_info" and stop.get(field)]
+    line = f"{index}. " + " | ".join(parts)
+    if "quick_info" in fields and stop.get("quick_info"):
+        line += f" - {stop['quick_info']}"
+    return line
+
+
+class PromptCompactor:
+    """Builds the bounded prompt blocks the chat handlers embed"""
+
+    def __init__(self,
+                 itinerary_budget: int = CHAT_ITINERARY_TOKEN_BUDGET,
+                 preferences_budget: int = CHAT_PREFERENCES_TOKEN_BUDGET,
+                 estimator: Optional[TokenEstimator] = None):
+        self.itinerary_budget = itinerary_budget
+        self.preferences_budget = preferences_budget
+        self.estimator = estimator or TokenEstimator()
+        self.stats = {"renders": 0, "tokens": 0, "stops_dropped_done": 0, "stops_dropped_budget": 0,
+                      "details_dropped": 0, "preferences_truncated": 0}
+
+    def _fits(self, text: str, budget: int) -> bool:
+        return budget <= 0 or self.estimator.count(text) <= budget
+
+    def _render_itinerary(self, header: str, stops: List[Tuple[int, Dict[str, Any]]], fields: tuple,
+                          done_count: int, omitted: int) -> str:
+        lines = [header]
+        if done_count:
+            lines.append(f"{done_count} stop(s) already done")
+        lines.extend(_render_stop(i, stop, fields) for i, stop in stops)
+        if omitted:
+            lines.append(f"...and {omitted} more stop(s)")
+        return "\n".join(lines)
+
+    def compact_itinerary(self, itinerary: Optional[Dict[str, Any]], context_type: str) -> str:
+        """The remaining stops of an itinerary, projected and cut to the token budget"""
+        if not itinerary:
+            return "None"
+
+        plan_fields = PLAN_FIELDS.get(context_type, PLAN_FIELDS["profile_dayplans"])
+        fields = STOP_FIELDS.get(context_type, STOP_FIELDS["profile_dayplans"])
+        header = " | ".join(f"{field}: {itinerary[field]}" for field in plan_fields if itinerary.get(field))
+
+        all_stops = itinerary.get("stops") or []
+        # Stops keep their position in the full itinerary, so numbers match what the user sees
+        stops = [(i, stop) for i, stop in enumerate(all_stops, start=1) if not is_stop_done(stop)]
+        done_count = len(all_stops) - len(stops)
+        self.stats["stops_dropped_done"] += done_count
+
+        text = self._render_itinerary(header, stops, fields, done_count, 0)
+        if not self._fits(text, self.itinerary_budget):
+            # Shed per-stop detail before whole stops
+            trimmed = tuple(field for field in fields if field not in OPTIONAL_STOP_FIELDS)
+            if trimmed != fields:
+                fields = trimmed
+                self.stats["details_dropped"] += 1
+                text = self._render_itinerary(header, stops, fields, done_count, 0)
+
+        # Keep the nearest upcoming stops; later ones are summarized as a count
+        kept = len(stops)
+        while kept > 1 and not self._fits(text, self.itinerary_budget):
+            kept -= 1
+            text = self._render_itinerary(header, stops[:kept], fields, done_count, len(stops) - kept)
+        self.stats["stops_dropped_budget"] += len(stops) - kept
+        return self._record(text)
+
+    def compact_preferences(self, preferences: Optional[Dict[str, Any]]) -> str:
+        """Non-empty preferences as compact JSON, cut to the token budget"""
+        values = {key: value for key, value in (preferences or {}).items() if value not in (None, "", [], {})}
+        if not values:
+            return "None"
+
+        text = json.dumps(values, separators=(",", ":"), ensure_ascii=False, default=str)
+        if not self._fits(text, self.preferences_budget):
+            self.stats["preferences_truncated"] += 1
+            text = text[:self.preferences_budget * CHARS_PER_TOKEN]
+            while len(text) > 1 and not self._fits(text + "...", self.preferences_budget):
+                text = text[:int(len(text) * 0.9)]
+            text += "..."
+        return self._record(text)
+
+    def _record(self, text: str) -> str:
+        self.stats["renders"] += 1
+        self.stats["tokens"] += self.estimator.count(text)
+        return text
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "avg_tokens": self.stats["tokens"] / self.stats["renders"] if self.stats["renders"] else None,
+            "itinerary_budget": self.itinerary_budget,
+            "preferences_budget": self.preferences_budget,
+            "tokenizer": self.estimator.name
+        }
+
+
+# Global instance
+prompt_compactor = PromptCompactor()
+
+# Helper functions for external use
+async def preload_tokenizer():
+    """Load the tokenizer in a worker thread so no chat turn waits on it"""
+    await asyncio.to_thread(prompt_compactor.estimator.load)
+
+def get_prompt_compaction_stats() -> Dict[str, Any]:
+    """Get prompt compaction statistics"""
+    return prompt_compactor.get_stats()
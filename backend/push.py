@@ -0,0 +1,373 @@
+"""
+Push Delivery Pipeline for Toria
+Durable outbox, batched multicast workers, retries with backoff and a dead-letter state
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+import aiohttp
+from pymongo import UpdateOne, DeleteMany
+from pymongo.errors import PyMongoError
+
+from database import db
+
+# Delivery configuration
+PUSH_TRANSPORT = os.getenv('PUSH_TRANSPORT', 'log').lower()  # log | http
+PUSH_PROVIDER_URL = os.getenv('PUSH_PROVIDER_URL', 'http://localhost:9099/v1/send-multicast')
+PUSH_PROVIDER_TIMEOUT = float(os.getenv('PUSH_PROVIDER_TIMEOUT', '10'))
+PUSH_WORKERS = int(os.getenv('PUSH_WORKERS', '2'))
+PUSH_CLAIM_SIZE = int(os.getenv('PUSH_CLAIM_SIZE', '1000'))
+PUSH_POLL_INTERVAL = float(os.getenv('PUSH_POLL_INTERVAL', '1.0'))
+PUSH_CLAIM_LEASE = float(os.getenv('PUSH_CLAIM_LEASE', '60'))
+PUSH_MAX_ATTEMPTS = int(os.getenv('PUSH_MAX_ATTEMPTS', '5'))
+PUSH_RETRY_BASE_SECONDS = float(os.getenv('PUSH_RETRY_BASE_SECONDS', '5'))
+PUSH_RETRY_MAX_SECONDS = float(os.getenv('PUSH_RETRY_MAX_SECONDS', '900'))
+
+# Outbox states
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+NO_DEVICE = "no_device"
+DEAD = "dead"
+
+# Per-token result codes returned by transports
+TOKEN_OK = "ok"
+TOKEN_INVALID = "invalid_token"     # permanent: token is unregistered
+TOKEN_RETRY = "retry"               # transient: rate limited, unavailable, timeout
+
+
+class PushTransport:
+    """Sends one message to many device tokens (provider multicast)"""
+
+    name = "base"
+    max_batch_size = 500
+
+    async def send_multicast(self, message: Dict[str, Any], tokens: List[str]) -> List[str]:
+        """Return one result code per token, in order"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LogTransport(PushTransport):
+    """Development transport: logs instead of delivering"""
+
+    name = "log"
+
+    async def send_multicast(self, message: Dict[str, Any], tokens: List[str]) -> List[str]:
+        print(f"📱 Push to {len(tokens)} device(s): {message['title']} - {message['body']}")
+        return [TOKEN_OK] * len(tokens)
+
+
+class HTTPPushTransport(PushTransport):
+    """JSON-over-HTTP multicast transport (see fake_push_provider.py for the wire format)"""
+
+    name = "http"
+
+    def __init__(self, url: str = PUSH_PROVIDER_URL, timeout: float = PUSH_PROVIDER_TIMEOUT,
+                 max_batch_size: int = 500):
+        self.url = url
+        self.timeout = timeout
+        self.max_batch_size = max_batch_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def send_multicast(self, message: Dict[str, Any], tokens: List[str]) -> List[str]:
+        try:
+            async with self._get_session().post(self.url, json={"message": message, "tokens": tokens}) as response:
+                if response.status == 429 or response.status >= 500:
+                    return [TOKEN_RETRY] * len(tokens)
+                if response.status >= 400:
+                    raise ValueError(f"Provider rejected batch: HTTP {response.status}")
+                payload = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return [TOKEN_RETRY] * len(tokens)
+
+        results = [result.get("status", TOKEN_RETRY) for result in payload.get("results", [])]
+        # A short response means the provider did not process the tail
+        return results + [TOKEN_RETRY] * (len(tokens) - len(results))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def create_transport(kind: str = PUSH_TRANSPORT) -> PushTransport:
+    """Build the configured transport"""
+    if kind == "http":
+        return HTTPPushTransport()
+    return LogTransport()
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(PUSH_RETRY_MAX_SECONDS, PUSH_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return random.uniform(0, ceiling)
+
+
+def _content_key(message: Dict[str, Any]) -> str:
+    """Messages with identical content share one multicast"""
+    content = json.dumps(
+        {"title": message["title"], "body": message["body"], "data": message.get("data", {})},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class PushDeliveryService:
+    """Moves outbox messages to the transport with a pool of worker tasks"""
+
+    def __init__(self, transport: Optional[PushTransport] = None, workers: int = PUSH_WORKERS):
+        self.transport = transport or create_transport()
+        self.worker_count = workers
+        self._workers: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self.stats = defaultdict(int)
+
+    # ---------- producer side ----------
+
+    async def enqueue(self, notifications: List[Dict[str, Any]]):
+        """Write outbox entries for stored notification documents"""
+        if not notifications:
+            return
+        now = datetime.utcnow()
+        await db.push_outbox.insert_many([
+            {
+                "notification_id": notification["_id"],
+                "user_id": notification["user_id"],
+                "title": notification["title"],
+                "body": notification["body"],
+                "data": notification.get("data", {}),
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now
+            }
+            for notification in notifications
+        ], ordered=False)
+        self.stats["enqueued"] += len(notifications)
+        self._wake.set()
+
+    async def register_token(self, user_id: str, token: str, platform: Optional[str] = None):
+        """Register a device token for a user"""
+        await db.push_tokens.update_one(
+            {"token": token},
+            {"$set": {"user_id": user_id, "platform": platform, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    # ---------- worker side ----------
+
+    async def _claim(self, worker_id: str) -> List[Dict[str, Any]]:
+        """Atomically claim due messages; stale 'sending' claims are taken back"""
+        now = datetime.utcnow()
+        claimable = {"$or": [
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": SENDING, "lease_until": {"$lt": now}}
+        ]}
+
+        candidates = await db.push_outbox.find(claimable, {"_id": 1}).sort(
+            "next_attempt_at", 1
+        ).limit(PUSH_CLAIM_SIZE).to_list(length=PUSH_CLAIM_SIZE)
+        if not candidates:
+            return []
+
+        claim_id = f"{worker_id}:{uuid.uuid4().hex}"
+        await db.push_outbox.update_many(
+            {"$and": [{"_id": {"$in": [doc["_id"] for doc in candidates]}}, claimable]},
+            {"$set": {
+                "status": SENDING,
+                "claim_id": claim_id,
+                "lease_until": now + timedelta(seconds=PUSH_CLAIM_LEASE)
+            }}
+        )
+        # Only what this claim won; other workers keep what they got first
+        return await db.push_outbox.find({"claim_id": claim_id}).to_list(length=PUSH_CLAIM_SIZE)
+
+    async def _tokens_for(self, user_ids: List[str]) -> Dict[str, List[str]]:
+        tokens: Dict[str, List[str]] = defaultdict(list)
+        async for doc in db.push_tokens.find({"user_id": {"$in": user_ids}}, {"user_id": 1, "token": 1}):
+            tokens[doc["user_id"]].append(doc["token"])
+        return tokens
+
+    async def _deliver(self, messages: List[Dict[str, Any]]):
+        """Group messages by content, send provider-sized multicasts, record outcomes"""
+        tokens_by_user = await self._tokens_for(list({m["user_id"] for m in messages}))
+
+        # message _id -> per-token results
+        outcomes: Dict[Any, List[str]] = {m["_id"]: [] for m in messages}
+        groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for message in messages:
+            groups[_content_key(message)].append(message)
+
+        invalid_tokens: List[str] = []
+        for group in groups.values():
+            # Flatten (message, token) pairs so one multicast can serve many users
+            targets = [(m["_id"], token) for m in group for token in tokens_by_user.get(m["user_id"], [])]
+            payload = {"title": group[0]["title"], "body": group[0]["body"], "data": group[0].get("data", {})}
+
+            for start in range(0, len(targets), self.transport.max_batch_size):
+                chunk = targets[start:start + self.transport.max_batch_size]
+                try:
+                    results = await self.transport.send_multicast(payload, [token for _, token in chunk])
+                    self.stats["multicasts"] += 1
+                except Exception as e:
+                    print(f"Push transport error: {e}")
+                    results = [TOKEN_RETRY] * len(chunk)
+                for (message_id, token), result in zip(chunk, results):
+                    outcomes[message_id].append(result)
+                    if result == TOKEN_INVALID:
+                        invalid_tokens.append(token)
+
+        await self._record(messages, outcomes, invalid_tokens)
+
+    async def _record(self, messages: List[Dict[str, Any]], outcomes: Dict[Any, List[str]],
+                      invalid_tokens: List[str]):
+        now = datetime.utcnow()
+        outbox_ops, notification_ops = [], []
+
+        for message in messages:
+            results = outcomes[message["_id"]]
+            attempts = message.get("attempts", 0) + 1
+            update: Dict[str, Any] = {"attempts": attempts, "updated_at": now}
+            unset = {"claim_id": "", "lease_until": ""}
+
+            if not results:
+                status = NO_DEVICE
+            elif TOKEN_OK in results:
+                status = SENT
+            elif TOKEN_RETRY in results and attempts < PUSH_MAX_ATTEMPTS:
+                status = PENDING
+                update["next_attempt_at"] = now + timedelta(seconds=retry_delay(attempts))
+                update["last_error"] = "transient provider failure"
+            else:
+                # Out of attempts, or every device token is gone
+                status = DEAD
+                update["last_error"] = "all tokens invalid" if TOKEN_RETRY not in results else "max attempts reached"
+
+            update["status"] = status
+            self.stats[status] += 1
+            # Scoped to our claim: if the lease lapsed and another worker re-claimed the
+            # message, its outcome wins and ours is dropped
+            outbox_ops.append(UpdateOne(
+                {"_id": message["_id"], "claim_id": message["claim_id"]},
+                {"$set": update, "$unset": unset}
+            ))
+            if status != PENDING:
+                notification_ops.append(UpdateOne(
+                    {"_id": message["notification_id"]},
+                    {"$set": {"status": status, "delivered_at": now}}
+                ))
+
+        try:
+            await db.push_outbox.bulk_write(outbox_ops, ordered=False)
+            if notification_ops:
+                await db.notifications.bulk_write(notification_ops, ordered=False)
+            if invalid_tokens:
+                await db.push_tokens.bulk_write([DeleteMany({"token": {"$in": invalid_tokens}})])
+        except PyMongoError as e:
+            # Claims expire after PUSH_CLAIM_LEASE and the messages are retried
+            print(f"Failed to record push outcomes: {e}")
+
+    async def _renew_claim(self, claim_id: str):
+        """Extend a claim's lease while its messages are being delivered"""
+        while True:
+            await asyncio.sleep(PUSH_CLAIM_LEASE / 3)
+            try:
+                await db.push_outbox.update_many(
+                    {"claim_id": claim_id, "status": SENDING},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=PUSH_CLAIM_LEASE)}}
+                )
+            except PyMongoError as e:
+                print(f"Failed to renew push claim {claim_id}: {e}")
+
+    async def _deliver_claimed(self, messages: List[Dict[str, Any]]):
+        """Deliver one claim, keeping its lease alive however long the provider takes"""
+        renewal = asyncio.create_task(self._renew_claim(messages[0]["claim_id"]))
+        try:
+            await self._deliver(messages)
+        finally:
+            renewal.cancel()
+
+    async def _worker(self, worker_id: str):
+        failures = 0
+        while True:
+            try:
+                messages = await self._claim(worker_id)
+                if messages:
+                    await self._deliver_claimed(messages)
+                    failures = 0
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the worker alive; claimed messages are retried after their lease
+                failures += 1
+                self.stats["worker_errors"] += 1
+                print(f"Push worker {worker_id} failed: {e}")
+                await asyncio.sleep(min(PUSH_POLL_INTERVAL * (2 ** min(failures, 6)), PUSH_RETRY_MAX_SECONDS))
+                continue
+            failures = 0
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=PUSH_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Start delivery workers on the running event loop"""
+        if self._workers:
+            return
+        for i in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(f"{os.getpid()}-{i}")))
+
+    async def stop(self):
+        """Stop workers; unfinished claims are picked up again after their lease"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.transport.close()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        backlog = await db.push_outbox.count_documents({"status": {"$in": [PENDING, SENDING]}})
+        return {"transport": self.transport.name, "workers": len(self._workers), "backlog": backlog, **self.stats}
+
+
+# Global instance
+push_service = PushDeliveryService()
+
+# Helper functions for external use
+async def enqueue_push(notifications: List[Dict[str, Any]]):
+    """Queue stored notifications for delivery"""
+    await push_service.enqueue(notifications)
+
+async def register_push_token(user_id: str, token: str, platform: Optional[str] = None):
+    """Register a device token"""
+    await push_service.register_token(user_id, token, platform)
+
+def start_push_workers():
+    """Start push delivery workers"""
+    push_service.start()
+
+async def stop_push_workers():
+    """Stop push delivery workers"""
+    await push_service.stop()
+
+async def get_push_stats():
+    """Get delivery statistics"""
+    return await push_service.get_stats()
@@ -0,0 +1,167 @@
+"""
+Reel Feed Ranking Engine for Toria
+Vectorized NumPy scoring of candidate reels by engagement, recency and tag affinity
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# Ranking weights
+FEED_WEIGHT_UPVOTES = float(os.getenv('FEED_WEIGHT_UPVOTES', '1.0'))
+FEED_WEIGHT_SAVES = float(os.getenv('FEED_WEIGHT_SAVES', '1.5'))
+FEED_WEIGHT_RECENCY = float(os.getenv('FEED_WEIGHT_RECENCY', '1.0'))
+FEED_WEIGHT_TAGS = float(os.getenv('FEED_WEIGHT_TAGS', '2.0'))
+FEED_RECENCY_HALF_LIFE_HOURS = float(os.getenv('FEED_RECENCY_HALF_LIFE_HOURS', '72'))
+
+# Preference keys that carry tag-like interests
+PREFERENCE_TAG_KEYS = ("interests", "tags", "focus", "favorite_types", "cuisines")
+
+
+def _timestamp(value: Any) -> float:
+    """Epoch seconds for an ISO string or datetime (naive means UTC); NaN when unknown"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return float("nan")
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float("nan")
+
+
+def preference_tags(preferences: Optional[Dict[str, Any]]) -> List[str]:
+    """Lowercased tags a user cares about, pulled from their preferences document"""
+    tags = []
+    for key in PREFERENCE_TAG_KEYS:
+        value = (preferences or {}).get(key)
+        if isinstance(value, str):
+            tags.append(value)
+        elif isinstance(value, (list, tuple)):
+            tags.extend(v for v in value if isinstance(v, str))
+    return sorted({tag.strip().lower() for tag in tags if tag.strip()})
+
+
+class CandidateSet:
+    """Candidate reels with their ranking features precomputed as arrays"""
+
+    def __init__(self, reels: List[Dict[str, Any]]):
+        self.reels = reels
+        n = len(reels)
+        self.rows: Dict[str, int] = {reel.get("id"): row for row, reel in enumerate(reels)}
+
+        self.upvotes = np.fromiter((reel.get("upvotes", 0) for reel in reels), dtype=np.float64, count=n)
+        self.saves = np.fromiter((reel.get("saves", 0) for reel in reels), dtype=np.float64, count=n)
+        self.created_ts = np.fromiter((_timestamp(reel.get("created_at")) for reel in reels), dtype=np.float64, count=n)
+
+        # Binary reel x tag matrix over the candidates' own vocabulary
+        self.vocabulary: Dict[str, int] = {}
+        rows, cols = [], []
+        for row, reel in enumerate(reels):
+            for tag in {str(tag).lower() for tag in reel.get("tags", [])}:
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(tag, len(self.vocabulary)))
+
+        self.tag_matrix = np.zeros((n, max(len(self.vocabulary), 1)), dtype=np.float32)
+        self.tag_matrix[rows, cols] = 1.0
+        self.tag_counts = self.tag_matrix.sum(axis=1)
+
+        # Engagement features are log-scaled and normalized within the candidate set
+        self.upvote_feature = self._normalized_log(self.upvotes)
+        self.save_feature = self._normalized_log(self.saves)
+
+    def __len__(self) -> int:
+        return len(self.reels)
+
+    def apply_counts(self, deltas: Dict[str, Dict[str, int]]):
+        """Add flushed upvote/save deltas to the candidates and refresh the engagement features"""
+        changed = False
+        for reel_id, counts in deltas.items():
+            row = self.rows.get(reel_id)
+            if row is None:
+                continue
+            reel = self.reels[row]
+            upvotes = reel.get("upvotes", 0) + counts.get("upvotes", 0)
+            saves = reel.get("saves", 0) + counts.get("saves", 0)
+            # Replaced, not mutated: the old dict may still be referenced by a response
+            self.reels[row] = {**reel, "upvotes": upvotes, "saves": saves}
+            self.upvotes[row] = upvotes
+            self.saves[row] = saves
+            changed = True
+        if changed:
+            self.upvote_feature = self._normalized_log(self.upvotes)
+            self.save_feature = self._normalized_log(self.saves)
+
+    @staticmethod
+    def _normalized_log(values: np.ndarray) -> np.ndarray:
+        logged = np.log1p(np.maximum(values, 0))
+        peak = logged.max() if logged.size else 0.0
+        return logged / peak if peak > 0 else logged
+
+    def tag_affinity(self, tags: List[str]) -> np.ndarray:
+        """Cosine similarity between each reel's tags and the user's tags"""
+        columns = [self.vocabulary[tag] for tag in tags if tag in self.vocabulary]
+        if not columns:
+            return np.zeros(len(self.reels), dtype=np.float64)
+
+        matches = self.tag_matrix[:, columns].sum(axis=1)
+        denominator = np.sqrt(self.tag_counts * len(tags))
+        return np.divide(matches, denominator, out=np.zeros_like(matches), where=denominator > 0)
+
+
+class FeedRanker:
+    """Scores a CandidateSet and returns the top reels"""
+
+    def __init__(self,
+                 upvote_weight: float = FEED_WEIGHT_UPVOTES,
+                 save_weight: float = FEED_WEIGHT_SAVES,
+                 recency_weight: float = FEED_WEIGHT_RECENCY,
+                 tag_weight: float = FEED_WEIGHT_TAGS,
+                 half_life_hours: float = FEED_RECENCY_HALF_LIFE_HOURS):
+        self.upvote_weight = upvote_weight
+        self.save_weight = save_weight
+        self.recency_weight = recency_weight
+        self.tag_weight = tag_weight
+        self.decay_rate = np.log(2) / (half_life_hours * 3600.0)
+
+    def score(self, candidates: CandidateSet, tags: List[str], now: Optional[float] = None) -> np.ndarray:
+        """Score every candidate in one vectorized pass"""
+        now = time.time() if now is None else now
+
+        age = np.maximum(now - candidates.created_ts, 0.0)
+        # Reels without a timestamp get no recency boost
+        recency = np.where(np.isnan(age), 0.0, np.exp(-self.decay_rate * np.nan_to_num(age)))
+
+        scores = (
+            self.upvote_weight * candidates.upvote_feature
+            + self.save_weight * candidates.save_feature
+            + self.recency_weight * recency
+        )
+        if tags:
+            scores = scores + self.tag_weight * candidates.tag_affinity(tags)
+        return scores
+
+    def rank(self, candidates: CandidateSet, tags: List[str], limit: int,
+             now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top `limit` reels by score, best first"""
+        n = len(candidates)
+        if n == 0:
+            return []
+
+        scores = self.score(candidates, tags, now)
+        k = min(limit, n)
+
+        # Partial selection first, then sort only the winners
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [candidates.reels[i] for i in top]
+
+
+# Global instance
+feed_ranker = FeedRanker()
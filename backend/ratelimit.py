@@ -0,0 +1,56 @@
+"""
+Token-Bucket Rate Limiting for Toria
+Per-key buckets kept in a bounded TTL cache
+"""
+
+import time
+from typing import Dict, Any
+
+from cachetools import TTLCache
+
+
+class TokenBucket:
+    """Allows `capacity` events at once, refilled at `rate` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float = 1.0) -> bool:
+        """Consume tokens if available"""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+
+class KeyedRateLimiter:
+    """One TokenBucket per key; idle buckets expire once they would be full again"""
+
+    def __init__(self, capacity: float, rate: float, maxsize: int = 100000):
+        self.capacity = capacity
+        self.rate = rate
+        # A bucket untouched for capacity/rate seconds has fully refilled, so dropping it is lossless
+        self.buckets: TTLCache = TTLCache(maxsize=maxsize, ttl=capacity / rate if rate > 0 else 3600)
+        self.stats = {"allowed": 0, "limited": 0}
+
+    def allow(self, key: str, amount: float = 1.0) -> bool:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, self.rate)
+        allowed = bucket.take(amount)
+        # Re-insert to extend the TTL while the key is active
+        self.buckets[key] = bucket
+        self.stats["allowed" if allowed else "limited"] += 1
+        return allowed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "tracked_keys": len(self.buckets)}
@@ -0,0 +1,293 @@
+"""
+Reel Catalog and Feed Cache for Toria
+Persisted reels per location, cached as ranked candidate sets for the Discover feed
+"""
+
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
+
+from cachetools import TTLCache
+from pymongo import ASCENDING, UpdateOne
+
+from database import db
+from engagement import engagement_service
+from ranking import CandidateSet, feed_ranker, preference_tags
+
+# Feed cache configuration
+REEL_FEED_CACHE_SIZE = int(os.getenv('REEL_FEED_CACHE_SIZE', '512'))
+REEL_FEED_CACHE_TTL = float(os.getenv('REEL_FEED_CACHE_TTL', '60'))
+REEL_SEED_COUNT = int(os.getenv('REEL_SEED_COUNT', '100'))
+# Only these cities get a mock catalog; other locations return an empty feed
+REEL_SEED_LOCATIONS = os.getenv('REEL_SEED_LOCATIONS', ','.join([
+    'Delhi', 'Mumbai', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad',
+    'Pune', 'Ahmedabad', 'Jaipur', 'Surat', 'Lucknow', 'Kanpur',
+    'Nagpur', 'Indore', 'Thane', 'Bhopal', 'Visakhapatnam', 'Pimpri-Chinchwad',
+    'Goa', 'Udaipur', 'Jodhpur', 'Varanasi', 'Rishikesh', 'Manali'
+]))
+FEED_MAX_CANDIDATES = int(os.getenv('FEED_MAX_CANDIDATES', '2000'))
+PREFERENCE_CACHE_TTL = float(os.getenv('PREFERENCE_CACHE_TTL', '60'))
+MAX_FEED_LIMIT = 100
+
+REEL_TYPES = ("Food", "Place")
+
+# (location, type)
+FeedKey = Tuple[str, Optional[str]]
+
+
+def normalize_location(location: str) -> str:
+    """Canonical city name, e.g. ' new delhi ' -> 'New Delhi'"""
+    return " ".join(location.split()).title() or "Delhi"
+
+
+SEEDABLE_LOCATIONS = {normalize_location(city) for city in REEL_SEED_LOCATIONS.split(',') if city.strip()}
+
+
+def normalize_type(reel_type: Optional[str]) -> Optional[str]:
+    """Canonical reel type ('Food'/'Place'), or None for all types"""
+    if not reel_type or reel_type.lower() in ("all", "both"):
+        return None
+    return reel_type.strip().title()
+
+
+def _slug(location: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", location.lower()).strip("-")
+
+
+def build_mock_reels(location: str, count: int = REEL_SEED_COUNT) -> List[Dict[str, Any]]:
+    """Mock catalog for a location - replace with actual Instagram API integration"""
+    slug = _slug(location)
+    now = datetime.utcnow()
+    return [
+        {
+            "id": f"reel_{slug}_{i}",
+            "instagram_url": f"https://instagram.com/p/mock{i}",
+            "embed_code": f"<iframe src='https://instagram.com/p/mock{i}/embed'></iframe>",
+            "title": f"Amazing {location} Experience #{i}",
+            "description": f"Discover the best of {location} with this incredible {['food', 'place'][i % 2]} experience!",
+            "location": location,
+            "type": REEL_TYPES[i % 2],
+            "creator_handle": f"@traveler{i}",
+            "tags": [location.lower(), ["food", "place"][i % 2], "travel"],
+            "metadata": {
+                "price": f"₹{(i + 1) * 100}-{(i + 1) * 200}",
+                "hygiene": "Excellent",
+                "timing": f"{9 + i % 12}:00 AM - {6 + i % 12}:00 PM"
+            },
+            "position": i,
+            "created_at": (now - timedelta(hours=i * 6)).isoformat(),
+            "upvotes": (i + 1) * 10,
+            "saves": (i + 1) * 5
+        }
+        for i in range(count)
+    ]
+
+
+class _RemovalTTLCache(TTLCache):
+    """TTLCache that reports every entry leaving it: expiry, eviction or explicit removal"""
+
+    def __init__(self, maxsize: int, ttl: float, on_remove: Callable[[Any, Any], None]):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_remove = on_remove
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, value in expired:
+            self._on_remove(key, value)
+        return expired
+
+    def __delitem__(self, key):
+        value = self[key] if key in self else None
+        super().__delitem__(key)
+        if value is not None:
+            self._on_remove(key, value)
+
+
+class ReelFeedCache:
+    """TTL/LRU cache of candidate sets, kept current as reel counters are flushed"""
+
+    def __init__(self, maxsize: int = REEL_FEED_CACHE_SIZE, ttl: float = REEL_FEED_CACHE_TTL):
+        self.cache: TTLCache = _RemovalTTLCache(maxsize=maxsize, ttl=ttl, on_remove=self._forget)
+        # reel_id -> feed keys that contain it
+        self.reel_keys: Dict[str, Set[FeedKey]] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "counter_updates": 0}
+
+    def _forget(self, key: FeedKey, candidates: CandidateSet):
+        """Drop a removed feed from the reverse index so it does not outlive the cache"""
+        for reel in candidates.reels:
+            keys = self.reel_keys.get(reel["id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.reel_keys[reel["id"]]
+
+    def get(self, key: FeedKey) -> Optional[CandidateSet]:
+        candidates = self.cache.get(key)
+        if candidates is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return candidates
+
+    def put(self, key: FeedKey, candidates: CandidateSet):
+        # Replacing an entry must release the reels of the old candidate set
+        self.cache.pop(key, None)
+        self.cache[key] = candidates
+        for reel in candidates.reels:
+            self.reel_keys.setdefault(reel["id"], set()).add(key)
+
+    def invalidate_reel(self, reel_id: str):
+        """Drop every cached feed containing the reel"""
+        for key in self.reel_keys.pop(reel_id, set()):
+            if self.cache.pop(key, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def invalidate_location(self, location: str):
+        """Drop every cached feed for a location"""
+        for key in [key for key in list(self.cache.keys()) if key[0] == location]:
+            self.cache.pop(key, None)
+            self.stats["invalidations"] += 1
+
+    def apply_counts(self, deltas: Dict[str, Dict[str, int]]):
+        """Add flushed counter deltas to every cached feed holding those reels"""
+        per_key: Dict[FeedKey, Dict[str, Dict[str, int]]] = {}
+        for reel_id, counts in deltas.items():
+            for key in self.reel_keys.get(reel_id, ()):
+                per_key.setdefault(key, {})[reel_id] = counts
+        for key, key_deltas in per_key.items():
+            candidates = self.cache.get(key)
+            if candidates is not None:
+                candidates.apply_counts(key_deltas)
+                self.stats["counter_updates"] += 1
+
+    def on_counters_flushed(self, flushed):
+        """Flush listener: patch cached feeds in place rather than rebuilding them from Mongo"""
+        self.apply_counts({
+            reel_id: deltas for (collection, _, reel_id, _), deltas in flushed if collection == "reels"
+        })
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.cache),
+            "indexed_reels": len(self.reel_keys),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+class ReelCatalog:
+    """Reads reels from the `reels` collection behind the feed cache"""
+
+    def __init__(self):
+        self.feed_cache = ReelFeedCache()
+        self.preference_cache: TTLCache = TTLCache(maxsize=10000, ttl=PREFERENCE_CACHE_TTL)
+        # Invalidate at most once per counter flush, not once per tap
+        engagement_service.counters.add_flush_listener(self.feed_cache.on_counters_flushed)
+
+    async def seed_location(self, location: str):
+        """Populate the catalog for a location; existing reels and counters are kept"""
+        operations = []
+        for reel in build_mock_reels(location):
+            counters = {"upvotes": reel.pop("upvotes"), "saves": reel.pop("saves")}
+            operations.append(UpdateOne(
+                {"id": reel["id"]},
+                {"$set": reel, "$setOnInsert": counters},
+                upsert=True
+            ))
+        await db.reels.bulk_write(operations, ordered=False)
+        self.feed_cache.invalidate_location(location)
+
+    async def _load_candidates(self, location: str, reel_type: Optional[str]) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"location": location}
+        if reel_type:
+            query["type"] = reel_type
+
+        return await db.reels.find(query, {"_id": 0, "position": 0}).sort(
+            "position", ASCENDING
+        ).limit(FEED_MAX_CANDIDATES).to_list(length=FEED_MAX_CANDIDATES)
+
+    async def get_candidates(self, location: str, reel_type: Optional[str]) -> CandidateSet:
+        """Candidate set for (location, type), served from memory when cached"""
+        key = (location, reel_type)
+
+        candidates = self.feed_cache.get(key)
+        if candidates is None:
+            reels = await self._load_candidates(location, reel_type)
+            if (not reels and location in SEEDABLE_LOCATIONS
+                    and not await db.reels.find_one({"location": location}, {"_id": 1})):
+                await self.seed_location(location)
+                reels = await self._load_candidates(location, reel_type)
+            candidates = CandidateSet(reels)
+            self.feed_cache.put(key, candidates)
+
+        return candidates
+
+    async def get_user_tags(self, user_id: Optional[str]) -> List[str]:
+        """Preference tags for personalization, cached briefly per user"""
+        if not user_id:
+            return []
+
+        tags = self.preference_cache.get(user_id)
+        if tags is None:
+            user_doc = await db.users.find_one({"user_id": user_id}, {"preferences": 1})
+            tags = preference_tags(user_doc.get("preferences") if user_doc else None)
+            self.preference_cache[user_id] = tags
+        return tags
+
+    def invalidate_user(self, user_id: str):
+        """Forget cached preference tags after a preferences update"""
+        self.preference_cache.pop(user_id, None)
+
+    async def get_feed(self, location: str, reel_type: Optional[str] = None, limit: int = 20,
+                       user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ranked feed for a location, optionally personalized with the user's preference tags"""
+        location = normalize_location(location)
+        reel_type = normalize_type(reel_type)
+        limit = max(1, min(limit, MAX_FEED_LIMIT))
+
+        candidates = await self.get_candidates(location, reel_type)
+        tags = await self.get_user_tags(user_id)
+
+        return [self._with_pending_counts(reel) for reel in feed_ranker.rank(candidates, tags, limit)]
+
+    async def get_by_ids(self, reel_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Catalog entries for a set of reel ids, keyed by id"""
+        if not reel_ids:
+            return {}
+        docs = await db.reels.find({"id": {"$in": reel_ids}}, {"_id": 0, "position": 0}).to_list(length=len(reel_ids))
+        return {doc["id"]: doc for doc in docs}
+
+    def _with_pending_counts(self, reel: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a cached reel with not-yet-flushed upvotes/saves added"""
+        pending = engagement_service.pending_counts(reel["id"])
+        if not pending["upvotes"] and not pending["saves"]:
+            return reel
+        return {
+            **reel,
+            "upvotes": reel.get("upvotes", 0) + pending["upvotes"],
+            "saves": reel.get("saves", 0) + pending["saves"]
+        }
+
+
+# Global instance
+reel_catalog = ReelCatalog()
+
+# Helper functions for external use
+async def get_reel_feed(location: str, reel_type: Optional[str] = None, limit: int = 20,
+                        user_id: Optional[str] = None):
+    """Get the ranked Discover feed for a location"""
+    return await reel_catalog.get_feed(location, reel_type, limit, user_id)
+
+def invalidate_user_feed_preferences(user_id: str):
+    """Drop cached feed personalization for a user"""
+    reel_catalog.invalidate_user(user_id)
+
+async def get_reels_by_ids(reel_ids: List[str]):
+    """Get catalog entries keyed by reel id"""
+    return await reel_catalog.get_by_ids(reel_ids)
+
+def get_feed_cache_stats() -> Dict[str, Any]:
+    """Get feed cache statistics"""
+    return reel_catalog.feed_cache.get_stats()
@@ -0,0 +1,151 @@
+"""
+Response Cache for Toria
+TTL + LRU cache keyed by normalized request parameters, with single-flight misses
+and optional MongoDB persistence shared across replicas
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+from pymongo.errors import PyMongoError
+
+from database import db
+
+# Cache configuration
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '2048'))
+RESPONSE_CACHE_PERSIST = os.getenv('RESPONSE_CACHE_PERSIST', 'false').lower() in ('1', 'true', 'yes')
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_params(value: Any) -> Any:
+    """Case- and whitespace-insensitive form of request parameters; list order is kept"""
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip().casefold()
+    if isinstance(value, dict):
+        return {str(k): normalize_params(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize_params(v) for v in value]
+    return value
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    encoded = json.dumps(normalize_params(params), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Caches computed responses for one endpoint
+
+    Cached values are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, namespace: str,
+                 ttl: float = RESPONSE_CACHE_TTL,
+                 maxsize: int = RESPONSE_CACHE_SIZE,
+                 persist: bool = RESPONSE_CACHE_PERSIST):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.persist = persist
+        # TTLCache evicts the least recently used entry once full
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    async def _load(self, key: str) -> Optional[Any]:
+        try:
+            doc = await db.response_cache.find_one(
+                {"_id": f"{self.namespace}:{key}", "expires_at": {"$gt": datetime.utcnow()}}
+            )
+        except PyMongoError as e:
+            self.stats["errors"] += 1
+            print(f"Response cache read failed ({self.namespace}): {e}")
+            return None
+        return doc["value"] if doc else None
+
+    async def _store(self, key: str, value: Any):
+        try:
+            await db.response_cache.replace_one(
+                {"_id": f"{self.namespace}:{key}"},
+                {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)},
+                upsert=True
+            )
+        except PyMongoError as e:
+            self.stats["errors"] += 1
+            print(f"Response cache write failed ({self.namespace}): {e}")
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            if self.persist:
+                value = await self._load(key)
+                if value is not None:
+                    self.stats["persistent_hits"] += 1
+                    self.cache[key] = value
+                    return value
+
+            self.stats["misses"] += 1
+            value = await compute()
+            self.cache[key] = value
+            if self.persist:
+                await self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_compute(self, params: Dict[str, Any], compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached response for params, computing it at most once at a time"""
+        key = cache_key(params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # A task of its own, so one disconnecting client cannot cancel it for the others
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def peek(self, params: Dict[str, Any]) -> Optional[Any]:
+        """Cached response for params, if any, without computing it"""
+        value = self.cache.get(cache_key(params))
+        if value is not None:
+            self.stats["hits"] += 1
+        return value
+
+    def put(self, params: Dict[str, Any], value: Any):
+        """Store a response computed outside get_or_compute (e.g. by a streaming job)"""
+        self.cache[cache_key(params)] = value
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["persistent_hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "size": len(self.cache),
+            "capacity": self.cache.maxsize,
+            "hit_rate": (lookups - self.stats["misses"]) / lookups if lookups else None,
+            "persistent": self.persist
+        }
+
+
+# Global instances
+top_places_cache = ResponseCache("top_places")
+trip_plan_cache = ResponseCache("plan_my_trip")
+
+# Helper functions for external use
+def get_response_cache_stats() -> Dict[str, Any]:
+    """Get hit/miss statistics per cached endpoint"""
+    return {cache.namespace: cache.get_stats() for cache in (top_places_cache, trip_plan_cache)}
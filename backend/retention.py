@@ -0,0 +1,293 @@
+"""
+Retention and Archival for Toria
+TTL indexes bound notifications, analytics_events and idle chat threads, an expiry sweep
+removes the unread notifications TTL leaves behind, and an optional archiver streams
+expired documents into gzip JSONL segments before deleting them
+"""
+
+import asyncio
+import gzip
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from database import db
+from scheduler import app_scheduler
+from leader import ensure_fenced
+from rollups import rollup_job
+
+# Retention configuration (days; 0 keeps documents forever)
+NOTIFICATION_RETENTION_DAYS = float(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+ANALYTICS_RETENTION_DAYS = float(os.getenv('ANALYTICS_RETENTION_DAYS', '30'))
+# Chat threads untouched for this long are forgotten
+CHAT_THREAD_TTL_DAYS = float(os.getenv('CHAT_THREAD_TTL_DAYS', '30'))
+# How often expired unread notifications are swept (seconds)
+RETENTION_SWEEP_INTERVAL = float(os.getenv('RETENTION_SWEEP_INTERVAL', '3600'))
+
+# Archival configuration
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+ARCHIVE_SEGMENT_SIZE = int(os.getenv('ARCHIVE_SEGMENT_SIZE', '10000'))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', '3600'))
+# With archival on, the TTL index waits this much longer so the archiver gets there first
+ARCHIVE_TTL_GRACE_DAYS = float(os.getenv('ARCHIVE_TTL_GRACE_DAYS', '2'))
+
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+
+class RetentionPolicy:
+    """How long one collection keeps documents, keyed on a BSON date field"""
+
+    def __init__(self, collection: str, date_field: str, retention_days: float, archive: bool = True,
+                 ttl_filter: Optional[Dict[str, Any]] = None):
+        self.collection = collection
+        self.date_field = date_field
+        self.retention_days = retention_days
+        # Whether the archiver keeps a copy before deletion; otherwise only the TTL index applies
+        self.archive = archive
+        # Restricts what the TTL index may delete (partialFilterExpression)
+        self.ttl_filter = ttl_filter
+        self.index_name = f"{date_field}_ttl"
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        return (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+
+    def ttl_seconds(self, archiving: bool) -> int:
+        days = self.retention_days + (ARCHIVE_TTL_GRACE_DAYS if archiving and self.archive else 0)
+        return int(days * 86400)
+
+
+RETENTION_POLICIES = [
+    # The TTL monitor cannot decrement unread counters, so it only removes read notifications;
+    # unread ones are removed by the expiry sweep (or the archiver), which adjusts the counters
+    RetentionPolicy("notifications", "sent_at", NOTIFICATION_RETENTION_DAYS, ttl_filter={"read": True}),
+    # received_at is the BSON date twin of the ISO `timestamp` string the rollups read
+    RetentionPolicy("analytics_events", "received_at", ANALYTICS_RETENTION_DAYS),
+    # Conversation checkpoints are working state, not history worth archiving
+    RetentionPolicy("chat_threads", "updated_at", CHAT_THREAD_TTL_DAYS, archive=False),
+]
+
+
+async def ensure_retention_indexes(archiving: bool = ARCHIVE_ENABLED):
+    """Create, retune (collMod) or drop the TTL index of each policy"""
+    for policy in RETENTION_POLICIES:
+        collection = db[policy.collection]
+        try:
+            if not policy.enabled:
+                try:
+                    await collection.drop_index(policy.index_name)
+                except OperationFailure:
+                    pass
+                continue
+
+            ttl = policy.ttl_seconds(archiving)
+            options: Dict[str, Any] = {"name": policy.index_name, "expireAfterSeconds": ttl}
+            if policy.ttl_filter:
+                options["partialFilterExpression"] = policy.ttl_filter
+            model = IndexModel([(policy.date_field, ASCENDING)], **options)
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                    raise
+                existing = (await collection.index_information()).get(policy.index_name, {})
+                if existing.get("partialFilterExpression") != policy.ttl_filter:
+                    # collMod cannot change the filter; rebuild the index
+                    await collection.drop_index(policy.index_name)
+                    await collection.create_indexes([model])
+                else:
+                    # Same key, different expiry: change it in place instead of rebuilding
+                    await db.command({
+                        "collMod": policy.collection,
+                        "index": {"name": policy.index_name, "expireAfterSeconds": ttl}
+                    })
+        except PyMongoError as e:
+            print(f"Failed to ensure TTL index on {policy.collection}: {e}")
+
+
+class Archiver:
+    """Moves expired documents into compressed segment files, then deletes them"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_size: int = ARCHIVE_SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.stats = {"runs": 0, "segments_written": 0, "documents_archived": 0, "errors": 0,
+                      "unread_expired": 0}
+
+    async def _expired_query(self, policy: RetentionPolicy) -> Optional[Dict[str, Any]]:
+        cutoff = policy.cutoff()
+        if policy.collection != "analytics_events":
+            return {policy.date_field: {"$lt": cutoff}}
+
+        # Events are ordered by _id, which also covers events stored before received_at existed.
+        # Never delete events the rollup has not counted yet.
+        upper = ObjectId.from_datetime(cutoff)
+        watermark = await rollup_job.get_watermark()
+        if watermark is None:
+            return None
+        if watermark < upper:
+            return {"_id": {"$lte": watermark}}
+        return {"_id": {"$lt": upper}}
+
+    def _write_segment(self, collection: str, documents: List[Dict[str, Any]]) -> str:
+        """Write one gzip JSONL segment atomically; runs in a worker thread"""
+        folder = os.path.join(self.directory, collection)
+        os.makedirs(folder, exist_ok=True)
+        name = f"{collection}-{documents[0]['_id']}-{documents[-1]['_id']}.jsonl.gz"
+        path = os.path.join(folder, name)
+        temp_path = f"{path}.tmp"
+
+        with gzip.open(temp_path, "wt", encoding="utf-8") as segment:
+            for document in documents:
+                segment.write(json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS))
+                segment.write("\n")
+        with open(temp_path, "rb") as written:
+            os.fsync(written.fileno())
+        os.replace(temp_path, path)
+        return path
+
+    async def _adjust_unread(self, documents: List[Dict[str, Any]]):
+        """Keep unread counters in step when unread notifications are removed"""
+        unread = Counter(doc["user_id"] for doc in documents if not doc.get("read") and doc.get("user_id"))
+        if unread:
+            await db.notification_counters.bulk_write([
+                UpdateOne({"_id": user_id}, {"$inc": {"unread": -count}})
+                for user_id, count in unread.items()
+            ], ordered=False)
+
+    async def archive_policy(self, policy: RetentionPolicy) -> int:
+        """Archive and delete every expired document of one collection, a segment at a time"""
+        if not policy.enabled or not policy.archive:
+            return 0
+
+        query = await self._expired_query(policy)
+        if query is None:
+            return 0
+        # Walk the index the expiry filter uses, so each segment is a bounded index scan
+        sort_field = "_id" if "_id" in query else policy.date_field
+        archived = 0
+        while True:
+            documents = await db[policy.collection].find(query).sort(sort_field, ASCENDING).limit(
+                self.segment_size
+            ).to_list(length=self.segment_size)
+            if not documents:
+                break
+
+            path = await asyncio.to_thread(self._write_segment, policy.collection, documents)
+            self.stats["segments_written"] += 1
+
+            # Only the current leader deletes; the segment on disk is harmless if we stop here
+            await ensure_fenced()
+            ids = [doc["_id"] for doc in documents]
+            await db[policy.collection].delete_many({"_id": {"$in": ids}})
+            if policy.collection == "notifications":
+                await self._adjust_unread(documents)
+
+            archived += len(documents)
+            self.stats["documents_archived"] += len(documents)
+            print(f"🗄️ Archived {len(documents)} {policy.collection} documents to {path}")
+
+            if len(documents) < self.segment_size:
+                break
+        return archived
+
+    async def run_once(self) -> Dict[str, int]:
+        """Archive every collection with a retention policy"""
+        results = {}
+        for policy in RETENTION_POLICIES:
+            try:
+                results[policy.collection] = await self.archive_policy(policy)
+            except (PyMongoError, OSError) as e:
+                self.stats["errors"] += 1
+                print(f"Archiving {policy.collection} failed: {e}")
+        self.stats["runs"] += 1
+        return results
+
+    async def expire_unread(self, archiving: bool = ARCHIVE_ENABLED) -> int:
+        """Delete unread notifications past retention without archiving them
+
+        Does for unread notifications what the TTL index does for read ones, on the same
+        schedule: with archiving on it waits the grace period, so the archiver goes first.
+        """
+        policy = next(p for p in RETENTION_POLICIES if p.collection == "notifications")
+        if not policy.enabled:
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(seconds=policy.ttl_seconds(archiving))
+        query = {policy.date_field: {"$lt": cutoff}, "read": {"$ne": True}}
+        expired = 0
+        while True:
+            documents = await db.notifications.find(query, {"_id": 1, "user_id": 1}).sort(
+                policy.date_field, ASCENDING
+            ).limit(self.segment_size).to_list(length=self.segment_size)
+            if not documents:
+                break
+
+            await ensure_fenced()
+            ids = [doc["_id"] for doc in documents]
+            result = await db.notifications.delete_many({"_id": {"$in": ids}, **query})
+            if result.deleted_count < len(documents):
+                # Marked read since the find: mark_read already decremented them, TTL removes them
+                kept = {doc["_id"] async for doc in db.notifications.find({"_id": {"$in": ids}}, {"_id": 1})}
+                documents = [doc for doc in documents if doc["_id"] not in kept]
+            await self._adjust_unread(documents)
+
+            expired += len(documents)
+            self.stats["unread_expired"] += len(documents)
+            if len(ids) < self.segment_size:
+                break
+
+        if expired:
+            print(f"🗑️ Expired {expired} unread notifications")
+        return expired
+
+    async def run_expiry(self) -> int:
+        """Scheduled expiry sweep"""
+        try:
+            return await self.expire_unread()
+        except PyMongoError as e:
+            self.stats["errors"] += 1
+            print(f"Expiring unread notifications failed: {e}")
+            return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ARCHIVE_ENABLED,
+            "directory": self.directory,
+            "retention_days": {p.collection: p.retention_days for p in RETENTION_POLICIES},
+            **self.stats
+        }
+
+
+# Global instance
+archiver = Archiver()
+
+# Helper functions for external use
+async def start_retention():
+    """Ensure TTL indexes, schedule the unread expiry sweep and, when enabled, the archiver"""
+    await ensure_retention_indexes()
+    app_scheduler.add_job("retention_expiry", archiver.run_expiry, interval=RETENTION_SWEEP_INTERVAL,
+                          jitter=RETENTION_SWEEP_INTERVAL * 0.1, initial_delay=60, leader_only=True)
+    if ARCHIVE_ENABLED:
+        app_scheduler.add_job("retention_archive", archiver.run_once, interval=ARCHIVE_INTERVAL,
+                              jitter=ARCHIVE_INTERVAL * 0.1, initial_delay=60, leader_only=True)
+    app_scheduler.start()
+
+def stop_retention():
+    """Stop the expiry sweep and the periodic archiver"""
+    app_scheduler.remove_job("retention_expiry")
+    app_scheduler.remove_job("retention_archive")
+
+def get_retention_stats() -> Dict[str, Any]:
+    """Get retention and archival statistics"""
+    return archiver.get_stats()
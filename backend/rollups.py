@@ -0,0 +1,294 @@
+"""
+Analytics Rollup Pipeline for Toria
+Folds raw analytics_events into hourly and daily counters behind a watermark
+"""
+
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from database import db
+from scheduler import app_scheduler
+from leader import ensure_fenced
+
+# Rollup configuration
+ROLLUP_INTERVAL = float(os.getenv('ROLLUP_INTERVAL', '60'))
+ROLLUP_BATCH_SIZE = int(os.getenv('ROLLUP_BATCH_SIZE', '50000'))
+# Events younger than this may still be in flight from the buffered writer
+ROLLUP_SAFETY_LAG = float(os.getenv('ROLLUP_SAFETY_LAG', '30'))
+# A batch claim older than this is treated as abandoned by a crashed run
+ROLLUP_CLAIM_TIMEOUT = float(os.getenv('ROLLUP_CLAIM_TIMEOUT', '300'))
+
+# Recent batch ids kept on each bucket so a re-run batch is not counted twice
+ROLLUP_BATCH_HISTORY = 8
+DUPLICATE_KEY = 11000
+
+ALL_USERS = "*"
+GRANULARITIES = {"hour": 13, "day": 10}  # ISO timestamp prefix lengths
+WATERMARK_ID = "analytics_events"
+
+# (granularity, bucket, event_name, user_id)
+RollupKey = Tuple[str, str, str, str]
+
+
+class AnalyticsRollupJob:
+    """Incrementally aggregates new events into analytics_rollups
+
+    Each batch is claimed with a compare-and-set on the watermark before its counters
+    are written, and the watermark only advances after they are. A claim that expires
+    (a crashed or stalled run) is taken over with the same event range, and every
+    bucket records the ids of the batches it has counted, so a batch written by two
+    runs is still counted once, with or without the leader lease.
+    """
+
+    def __init__(self, batch_size: int = ROLLUP_BATCH_SIZE, safety_lag: float = ROLLUP_SAFETY_LAG):
+        self.batch_size = batch_size
+        self.safety_lag = safety_lag
+        self.stats = {"runs": 0, "events_processed": 0, "buckets_written": 0, "errors": 0,
+                      "claims_lost": 0}
+        self._lock = asyncio.Lock()
+
+    async def get_watermark(self) -> Optional[ObjectId]:
+        state = await db.analytics_rollup_state.find_one({"_id": WATERMARK_ID})
+        return state.get("last_id") if state else None
+
+    async def _holds_claim(self, claim_id: str) -> bool:
+        return await db.analytics_rollup_state.find_one(
+            {"_id": WATERMARK_ID, "claim.id": claim_id, "claim.expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 1}
+        ) is not None
+
+    async def _write_counts(self, counts: Dict[RollupKey, int], batch_id: str, now: datetime) -> int:
+        """Add one batch's counts; buckets that already list the batch are left alone"""
+        operations = [
+            UpdateOne(
+                {"granularity": granularity, "bucket": bucket, "event_name": event_name, "user_id": user_id,
+                 "batches": {"$ne": batch_id}},
+                {
+                    "$inc": {"count": count},
+                    "$set": {"updated_at": now},
+                    "$push": {"batches": {"$each": [batch_id], "$slice": -ROLLUP_BATCH_HISTORY}}
+                },
+                upsert=True
+            )
+            for (granularity, bucket, event_name, user_id), count in counts.items()
+        ]
+        if not operations:
+            return 0
+        try:
+            await db.analytics_rollups.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A bucket that already counted this batch fails the filter, and its upsert then
+            # hits the unique bucket index; anything else is a real failure
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+        return len(operations)
+
+    async def _claim(self, after: Optional[ObjectId], upper: ObjectId, now: datetime) -> Optional[str]:
+        """Claim (after, upper] if the watermark is still at `after` and no live claim exists"""
+        claim_id = uuid.uuid4().hex
+        try:
+            result = await db.analytics_rollup_state.update_one(
+                {
+                    "_id": WATERMARK_ID,
+                    "last_id": after,
+                    "$or": [{"claim": None}, {"claim.expires_at": {"$lt": now}}]
+                },
+                {"$set": {"claim": {
+                    "id": claim_id,
+                    "upper": upper,
+                    "expires_at": now + timedelta(seconds=ROLLUP_CLAIM_TIMEOUT)
+                }}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The state document exists but moved on or is claimed; the upsert lost
+            return None
+        return claim_id if result.matched_count or result.upserted_id is not None else None
+
+    async def _batch_upper_bound(self, after: Optional[ObjectId], cutoff: ObjectId) -> Optional[ObjectId]:
+        """_id of the last event in the next batch, or None when nothing is ready"""
+        id_range: Dict[str, Any] = {"$lt": cutoff}
+        if after is not None:
+            id_range["$gt"] = after
+
+        # Index-only walk of the _id index, bounded by batch_size
+        last = await db.analytics_events.find({"_id": id_range}, {"_id": 1}).sort(
+            "_id", ASCENDING
+        ).skip(self.batch_size - 1).limit(1).to_list(length=1)
+        if last:
+            return last[0]["_id"]
+
+        newest = await db.analytics_events.find({"_id": id_range}, {"_id": 1}).sort(
+            "_id", -1
+        ).limit(1).to_list(length=1)
+        return newest[0]["_id"] if newest else None
+
+    async def _aggregate(self, after: Optional[ObjectId], upper: ObjectId) -> Tuple[Dict[RollupKey, int], int]:
+        """Hourly counts per (event_name, user_id) for events in (after, upper]"""
+        id_range: Dict[str, Any] = {"$lte": upper}
+        if after is not None:
+            id_range["$gt"] = after
+
+        pipeline = [
+            {"$match": {"_id": id_range}},
+            {"$group": {
+                "_id": {
+                    "hour": {"$substrBytes": [{"$ifNull": ["$timestamp", ""]}, 0, GRANULARITIES["hour"]]},
+                    "event_name": {"$ifNull": ["$event_name", "unknown"]},
+                    "user_id": {"$ifNull": ["$user_id", "anonymous"]}
+                },
+                "count": {"$sum": 1}
+            }}
+        ]
+
+        counts: Dict[RollupKey, int] = defaultdict(int)
+        total = 0
+        async for group in db.analytics_events.aggregate(pipeline):
+            hour = group["_id"]["hour"]
+            if not hour:
+                continue
+            event_name = str(group["_id"]["event_name"])
+            user_id = str(group["_id"]["user_id"])
+            count = group["count"]
+            total += count
+
+            day = hour[:GRANULARITIES["day"]]
+            for granularity, bucket in (("hour", hour), ("day", day)):
+                counts[(granularity, bucket, event_name, user_id)] += count
+                counts[(granularity, bucket, event_name, ALL_USERS)] += count
+
+        return counts, total
+
+    async def run_once(self) -> Dict[str, int]:
+        """Process one batch of events past the watermark"""
+        async with self._lock:
+            cutoff = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=self.safety_lag))
+            state = await db.analytics_rollup_state.find_one({"_id": WATERMARK_ID}) or {}
+            after = state.get("last_id")
+            now = datetime.utcnow()
+
+            claim = state.get("claim")
+            if claim and claim["expires_at"] < now:
+                # Take over an abandoned batch with its original range, so its id matches
+                upper = claim["upper"]
+            else:
+                upper = await self._batch_upper_bound(after, cutoff)
+            if upper is None:
+                return {"events": 0, "buckets": 0}
+
+            claim_id = await self._claim(after, upper, now)
+            if claim_id is None:
+                self.stats["claims_lost"] += 1
+                return {"events": 0, "buckets": 0}
+
+            counts, total = await self._aggregate(after, upper)
+            await ensure_fenced()
+            if not await self._holds_claim(claim_id):
+                self.stats["claims_lost"] += 1
+                print(f"Analytics rollup claim {claim_id} expired before its counters were written")
+                return {"events": 0, "buckets": 0}
+            written = await self._write_counts(counts, str(upper), now)
+
+            advanced = await db.analytics_rollup_state.update_one(
+                {"_id": WATERMARK_ID, "last_id": after, "claim.id": claim_id},
+                {"$set": {"last_id": upper, "updated_at": datetime.utcnow()}, "$unset": {"claim": ""}}
+            )
+            if advanced.modified_count == 0:
+                # Our claim expired and another run took the batch over
+                self.stats["claims_lost"] += 1
+                print(f"Analytics rollup claim {claim_id} expired before the watermark advanced")
+
+            self.stats["runs"] += 1
+            self.stats["events_processed"] += total
+            self.stats["buckets_written"] += written
+            return {"events": total, "buckets": written}
+
+    async def run_until_caught_up(self) -> Dict[str, int]:
+        """Process batches until the watermark reaches the safety cutoff"""
+        totals = {"events": 0, "buckets": 0}
+        try:
+            while True:
+                result = await self.run_once()
+                totals["events"] += result["events"]
+                totals["buckets"] += result["buckets"]
+                if result["events"] < self.batch_size:
+                    break
+        except PyMongoError as e:
+            self.stats["errors"] += 1
+            print(f"Analytics rollup failed: {e}")
+        return totals
+
+    async def get_summary(self,
+                          granularity: str = "day",
+                          event_name: Optional[str] = None,
+                          user_id: Optional[str] = None,
+                          start: Optional[str] = None,
+                          end: Optional[str] = None,
+                          limit: int = 500) -> Dict[str, Any]:
+        """Read pre-aggregated buckets; start/end are ISO bucket prefixes (inclusive)"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {sorted(GRANULARITIES)}")
+
+        query: Dict[str, Any] = {"granularity": granularity, "user_id": user_id or ALL_USERS}
+        if start or end:
+            query["bucket"] = {}
+            if start:
+                query["bucket"]["$gte"] = start[:GRANULARITIES[granularity]]
+            if end:
+                query["bucket"]["$lte"] = end[:GRANULARITIES[granularity]]
+        if event_name:
+            query["event_name"] = event_name
+
+        buckets = await db.analytics_rollups.find(
+            query, {"_id": 0, "bucket": 1, "event_name": 1, "count": 1}
+        ).sort("bucket", ASCENDING).limit(limit).to_list(length=limit)
+
+        totals: Dict[str, int] = defaultdict(int)
+        for bucket in buckets:
+            totals[bucket["event_name"]] += bucket["count"]
+
+        watermark = await self.get_watermark()
+        return {
+            "granularity": granularity,
+            "user_id": user_id or ALL_USERS,
+            "buckets": buckets,
+            "totals": dict(totals),
+            "processed_through": watermark.generation_time.isoformat() if watermark else None
+        }
+
+
+# Global instance
+rollup_job = AnalyticsRollupJob()
+
+# Helper functions for external use
+async def run_analytics_rollup():
+    """Fold new analytics events into hourly/daily buckets"""
+    return await rollup_job.run_until_caught_up()
+
+async def get_analytics_summary(granularity: str = "day", event_name: Optional[str] = None,
+                                user_id: Optional[str] = None, start: Optional[str] = None,
+                                end: Optional[str] = None):
+    """Get pre-aggregated analytics counters"""
+    return await rollup_job.get_summary(granularity, event_name, user_id, start, end)
+
+def start_analytics_rollup():
+    """Run the analytics rollup periodically on the app scheduler"""
+    app_scheduler.add_job("analytics_rollup", rollup_job.run_until_caught_up,
+                          interval=ROLLUP_INTERVAL, jitter=ROLLUP_INTERVAL * 0.1, leader_only=True)
+    app_scheduler.start()
+
+def stop_analytics_rollup():
+    """Stop the periodic analytics rollup"""
+    app_scheduler.remove_job("analytics_rollup")
+
+def get_rollup_stats() -> Dict[str, Any]:
+    """Get rollup job statistics"""
+    return dict(rollup_job.stats)
@@ -0,0 +1,221 @@
+"""
+Asyncio Job Scheduler for Toria
+Periodic background jobs on the app's event loop with jitter, overlap protection,
+leader election and metrics
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Any, Optional
+
+from leader import MongoLease, LeaseLostError, current_fence
+
+JobFunc = Callable[[], Awaitable[Any]]
+
+
+class ScheduledJob:
+    """A periodic coroutine job and its run metrics"""
+
+    def __init__(self, name: str, func: JobFunc, interval: float,
+                 jitter: float = 0.0, initial_delay: float = 0.0, timeout: Optional[float] = None,
+                 leader_only: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.timeout = timeout
+        # Leader-only jobs run only on the instance holding this job's lease
+        self.lease: Optional[MongoLease] = MongoLease(f"scheduler:{name}") if leader_only else None
+
+        self.loop_task: Optional[asyncio.Task] = None
+        self.run_task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped_overlaps = 0
+        self.skipped_not_leader = 0
+        self.fenced_out = 0
+        self.last_started_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.run_task is not None and not self.run_task.done()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "running": self.is_running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped_overlaps": self.skipped_overlaps,
+            "skipped_not_leader": self.skipped_not_leader,
+            "fenced_out": self.fenced_out,
+            "lease": self.lease.get_stats() if self.lease else None,
+            "last_started_at": self.last_started_at,
+            "last_duration_seconds": self.last_duration,
+            "avg_duration_seconds": self.total_duration / self.runs if self.runs else None,
+            "max_duration_seconds": self.max_duration,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+            "last_error": self.last_error
+        }
+
+
+class AsyncScheduler:
+    """Runs ScheduledJobs as tasks on the running event loop"""
+
+    def __init__(self):
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self.running = False
+
+    def add_job(self, name: str, func: JobFunc, interval: float,
+                jitter: float = 0.0, initial_delay: float = 0.0, timeout: Optional[float] = None,
+                leader_only: bool = False) -> ScheduledJob:
+        """Register a job; it starts right away if the scheduler is already running"""
+        self.remove_job(name)
+        job = ScheduledJob(name, func, interval, jitter, initial_delay, timeout, leader_only)
+        self.jobs[name] = job
+        if self.running:
+            self._start_job(job)
+        return job
+
+    def remove_job(self, name: str):
+        """Unregister a job and cancel its loop and any run in progress"""
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return
+        for task in (job.loop_task, job.run_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if job.lease is not None and self.running:
+            asyncio.create_task(job.lease.stop())
+
+    def _start_job(self, job: ScheduledJob):
+        if job.lease is not None:
+            job.lease.start()
+        job.loop_task = asyncio.create_task(self._job_loop(job))
+
+    async def _execute(self, job: ScheduledJob):
+        started = time.monotonic()
+        job.last_started_at = time.time()
+        if job.lease is not None:
+            # Lets the job call leader.ensure_fenced() before side effects
+            current_fence.set((job.lease, job.lease.token))
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.func(), timeout=job.timeout)
+            else:
+                await job.func()
+            job.last_error = None
+        except asyncio.TimeoutError:
+            job.timeouts += 1
+            job.failures += 1
+            job.last_error = f"timed out after {job.timeout}s"
+            print(f"⏱️ Job {job.name} timed out after {job.timeout}s")
+        except LeaseLostError as e:
+            job.fenced_out += 1
+            job.last_error = str(e)
+            print(f"Job {job.name} stopped: {e}")
+        except asyncio.CancelledError:
+            # Interrupted by shutdown; not a completed run
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            print(f"Job {job.name} failed: {e}")
+
+        duration = time.monotonic() - started
+        job.runs += 1
+        job.last_duration = duration
+        job.total_duration += duration
+        job.max_duration = max(job.max_duration, duration)
+
+    async def _job_loop(self, job: ScheduledJob):
+        loop = asyncio.get_running_loop()
+        base = loop.time() + job.initial_delay
+
+        while True:
+            # Jitter spreads workers and replicas apart without drifting the base schedule
+            due = base + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(0.0, due - loop.time()))
+
+            lag = loop.time() - due
+            job.last_lag = lag
+            job.max_lag = max(job.max_lag, lag)
+
+            if job.lease is not None and not job.lease.is_leader:
+                job.skipped_not_leader += 1
+            elif job.is_running:
+                job.skipped_overlaps += 1
+                print(f"Job {job.name} still running, skipping this tick")
+            else:
+                job.run_task = asyncio.create_task(self._execute(job))
+
+            base += job.interval
+            # After a long stall, resume from now instead of firing a burst of catch-up runs
+            if base < loop.time():
+                base = loop.time() + job.interval
+
+    def start(self):
+        """Start every registered job on the running event loop"""
+        if self.running:
+            return
+        self.running = True
+        for job in self.jobs.values():
+            self._start_job(job)
+
+    async def stop(self, grace_period: float = 5.0):
+        """Stop scheduling, give in-flight runs a grace period, then cancel them"""
+        self.running = False
+
+        loops = [job.loop_task for job in self.jobs.values() if job.loop_task]
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+
+        runs = [job.run_task for job in self.jobs.values() if job.is_running]
+        if runs:
+            _, pending = await asyncio.wait(runs, timeout=grace_period)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # Release leases only once runs are over, so a successor cannot overlap them
+        await asyncio.gather(*(job.lease.stop() for job in self.jobs.values() if job.lease))
+
+        for job in self.jobs.values():
+            job.loop_task = None
+            job.run_task = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "jobs": {name: job.metrics() for name, job in self.jobs.items()}
+        }
+
+
+# Global instance
+app_scheduler = AsyncScheduler()
+
+# Helper functions for external use
+def start_scheduler():
+    """Start all registered background jobs"""
+    app_scheduler.start()
+
+async def stop_scheduler():
+    """Stop all background jobs"""
+    await app_scheduler.stop()
+
+def get_scheduler_metrics() -> Dict[str, Any]:
+    """Get per-job duration and lag metrics"""
+    return app_scheduler.get_metrics()
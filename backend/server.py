@@ -3,7 +3,6 @@ Toria Backend API - Complete Travel Planning Platform
 FastAPI + MongoDB + LangChain AI Integration
 """
 
-import os
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import json
@@ -11,16 +10,45 @@ import asyncio
 
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 
 # Import our modules
-from chatbot import chat_from_profile_dayplans, chat_from_start_my_day, general_travel_chat
+from database import db, connect_to_mongo, close_mongo_connection, get_pool_stats
+from indexes import ensure_indexes, explain_hot_queries
+from pagination import paginate, decode_cursor
+from engagement import (
+    upvote_reel as record_upvote, save_reel as record_save,
+    start_engagement_flusher, stop_engagement_flusher, get_engagement_stats
+)
+from analytics import (
+    track_events, AnalyticsQueueFull, MAX_EVENTS_PER_BATCH,
+    start_analytics_writer, stop_analytics_writer, get_analytics_stats
+)
+from rollups import get_analytics_summary, start_analytics_rollup, stop_analytics_rollup, get_rollup_stats
+from response_cache import normalize_params, top_places_cache, trip_plan_cache, get_response_cache_stats
+from planner import (
+    trip_plan_params, trip_plan_overview, generate_trip_plan, plan_jobs, PlanQueueFull, submit_plan_job,
+    get_plan_job, stream_plan_job_events, start_plan_workers, stop_plan_workers, get_plan_job_stats
+)
+from retention import start_retention, stop_retention, get_retention_stats
+from scheduler import stop_scheduler, get_scheduler_metrics
+from broadcast import broadcast_notification, get_broadcast_job, stop_broadcasts
+from unread import get_unread_count, mark_notifications_read, get_unread_stats
+from push import register_push_token, start_push_workers, stop_push_workers, get_push_stats
+from reels import get_reel_feed, get_reels_by_ids, get_feed_cache_stats, invalidate_user_feed_preferences
+from chatbot_loader import load_chatbot, warm_up_chatbot, get_chatbot_warmup_stats, get_chat_memory_stats
+from streaming import format_sse
+from llm_gateway import get_llm_gateway_stats
+from chat_context import invalidate_chat_context, get_chat_context_stats
+from prompt_compaction import get_prompt_compaction_stats
+from chat_cache import get_chat_cache_stats
 from notifications import (
     send_notification, send_location_suggestions, send_feedback_reminder,
-    get_user_notifications, start_notification_scheduler
+    get_user_notifications_page, start_notification_scheduler, stop_notification_scheduler,
+    flush_coalesced_notifications, get_notification_stats
 )
 
 load_dotenv()
@@ -41,20 +69,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB setup
-MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.toria_db
-
-# Start notification scheduler on startup
+# Open shared MongoDB pool and start notification scheduler on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
+    await connect_to_mongo()
+    await ensure_indexes()
+    await start_retention()
+    start_engagement_flusher()
+    start_analytics_writer()
+    start_analytics_rollup()
     start_notification_scheduler()
+    start_push_workers()
+    start_plan_workers()
+    await warm_up_chatbot()
     print("🚀 Toria API started successfully")
     print("📱 Notification scheduler active")
     print("🤖 Travel Buddy chatbot ready")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release services on shutdown"""
+    await stop_scheduler()
+    stop_notification_scheduler()
+    stop_analytics_rollup()
+    stop_retention()
+    await flush_coalesced_notifications()
+    await stop_broadcasts()
+    await stop_push_workers()
+    await stop_plan_workers()
+    await stop_engagement_flusher()
+    await stop_analytics_writer()
+    await close_mongo_connection()
+
 # Pydantic models
 class ReelResponse(BaseModel):
     id: str
@@ -100,12 +147,31 @@ class ChatRequest(BaseModel):
     context_type: str = "general"
     itinerary_id: Optional[str] = None
 
+class AnalyticsBatchRequest(BaseModel):
+    events: List[Dict[str, Any]]
+    user_id: Optional[str] = None
+
 class NotificationRequest(BaseModel):
     user_id: str
     title: str
     body: str
     data: Optional[Dict[str, Any]] = None
 
+class BroadcastRequest(BaseModel):
+    segment: Dict[str, Any]
+    title: str
+    body: str
+    data: Optional[Dict[str, Any]] = None
+
+class MarkReadRequest(BaseModel):
+    # None marks every notification read
+    notification_ids: Optional[List[str]] = None
+
+class PushTokenRequest(BaseModel):
+    user_id: str
+    push_token: str
+    platform: Optional[str] = None
+
 # ======================================
 # HEALTH & STATUS ENDPOINTS
 # ======================================
@@ -120,6 +186,12 @@ async def root():
         "features": ["travel_planning", "reel_discovery", "chatbot", "notifications"]
     }
 
+async def _safe_push_stats():
+    try:
+        return await get_push_stats()
+    except PyMongoError as e:
+        return {"error": str(e)}
+
 @app.get("/api/health")
 async def health_check():
     """Detailed health check"""
@@ -134,6 +206,24 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "database": db_status,
+        "database_pool": get_pool_stats(),
+        "engagement_counters": get_engagement_stats(),
+        "reel_feed_cache": get_feed_cache_stats(),
+        "analytics_queue": get_analytics_stats(),
+        "analytics_rollup": get_rollup_stats(),
+        "scheduler": get_scheduler_metrics(),
+        "push_delivery": await _safe_push_stats(),
+        "notification_coalescing": get_notification_stats(),
+        "unread_counts": get_unread_stats(),
+        "retention": get_retention_stats(),
+        "response_cache": get_response_cache_stats(),
+        "plan_jobs": get_plan_job_stats(),
+        "llm_gateway": get_llm_gateway_stats(),
+        "chatbot_warmup": get_chatbot_warmup_stats(),
+        "chat_memory": get_chat_memory_stats(),
+        "chat_context": get_chat_context_stats(),
+        "prompt_compaction": get_prompt_compaction_stats(),
+        "chat_response_cache": get_chat_cache_stats(),
         "services": {
             "chatbot": "active",
             "notifications": "active",
@@ -141,64 +231,59 @@ async def health_check():
         }
     }
 
+@app.get("/api/diagnostics/query-plans")
+async def query_plan_diagnostics():
+    """Explain the hot queries and flag collection scans"""
+    try:
+        reports = await explain_hot_queries()
+        return {
+            "healthy": all(report.get("ok") for report in reports),
+            "collection_scans": [r["query"] for r in reports if r.get("collection_scan")],
+            "queries": reports
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Diagnostics error: {str(e)}")
+
 # ======================================
 # REEL DISCOVERY ENDPOINTS
 # ======================================
 
 @app.get("/api/reels", response_model=List[ReelResponse])
-async def get_reels(location: str = "Delhi", limit: int = 20):
-    """Get Instagram reels filtered by location"""
+async def get_reels(location: str = "Delhi", type: Optional[str] = None, limit: int = 20,
+                    user_id: Optional[str] = None):
+    """Get ranked Instagram reels for a location, optionally by type and personalized per user"""
     try:
-        # Mock data for now - replace with actual Instagram API integration
-        mock_reels = [
-            {
-                "id": f"reel_{i}",
-                "instagram_url": f"https://instagram.com/p/mock{i}",
-                "embed_code": f"<iframe src='https://instagram.com/p/mock{i}/embed'></iframe>",
-                "title": f"Amazing {location} Experience #{i}",
-                "description": f"Discover the best of {location} with this incredible {['food', 'place'][i % 2]} experience!",
-                "location": location,
-                "type": ["Food", "Place"][i % 2],
-                "creator_handle": f"@traveler{i}",
-                "tags": [location.lower(), ["food", "place"][i % 2], "travel"],
-                "metadata": {
-                    "price": f"₹{(i + 1) * 100}-{(i + 1) * 200}",
-                    "hygiene": "Excellent",
-                    "timing": f"{9 + i}:00 AM - {6 + i}:00 PM"
-                },
-                "upvotes": (i + 1) * 10,
-                "saves": (i + 1) * 5
-            }
-            for i in range(limit)
-        ]
-        
-        return mock_reels
+        return await get_reel_feed(location, type, limit, user_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching reels: {str(e)}")
 
 @app.post("/api/reels/{reel_id}/upvote")
-async def upvote_reel(reel_id: str):
-    """Upvote a reel"""
+async def upvote_reel(reel_id: str, user_id: str):
+    """Upvote a reel (once per user)"""
     try:
-        # Mock implementation - replace with actual database update
-        return {"success": True, "message": "Reel upvoted successfully", "reel_id": reel_id}
+        created = await record_upvote(reel_id, user_id)
+        return {
+            "success": True,
+            "message": "Reel upvoted successfully" if created else "Reel already upvoted",
+            "reel_id": reel_id,
+            "already_upvoted": not created
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error upvoting reel: {str(e)}")
 
 @app.post("/api/reels/{reel_id}/save")
 async def save_reel(reel_id: str, user_id: str):
-    """Save a reel to user's favorites"""
+    """Save a reel to user's favorites (once per user)"""
     try:
-        saved_reel = {
-            "user_id": user_id,
-            "reel_id": reel_id,
-            "saved_at": datetime.utcnow().isoformat()
+        created = await record_save(reel_id, user_id)
+        return {
+            "success": True,
+            "message": "Reel saved successfully" if created else "Reel already saved",
+            "already_saved": not created
         }
         
-        await db.saved_reels.insert_one(saved_reel)
-        return {"success": True, "message": "Reel saved successfully"}
-        
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving reel: {str(e)}")
 
@@ -206,82 +291,123 @@ async def save_reel(reel_id: str, user_id: str):
 # AI TRAVEL PLANNING ENDPOINTS
 # ======================================
 
+async def _save_trip_plan(request: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Give a generated plan its own itinerary id and store it as a day plan"""
+    # A cached plan may come from a request that spelled the inputs differently;
+    # title, city and the other overview fields always follow this request
+    ai_plan = {
+        "itinerary_id": f"plan_{request['user_id']}_{int(datetime.utcnow().timestamp())}",
+        **plan,
+        **trip_plan_overview(trip_plan_params(request)),
+        "stops": [dict(stop) for stop in plan["stops"]],
+        "created_at": datetime.utcnow().isoformat()
+    }
+    
+    # Save to database
+    day_plan = DayPlan(
+        id=ai_plan["itinerary_id"],
+        user_id=request["user_id"],
+        title=ai_plan["title"],
+        city=ai_plan["city"],
+        going_with=request["going_with"],
+        focus=request["focus"],
+        date=request["date"],
+        stops=ai_plan["stops"],
+        items_count=len(ai_plan["stops"])
+    )
+    
+    await db.day_plans.insert_one(day_plan.dict())
+    invalidate_chat_context(request["user_id"], day_plan.id)
+    
+    return ai_plan
+
+plan_jobs.set_finalizer(_save_trip_plan)
+
 @app.post("/api/plan-my-trip")
 async def plan_my_trip(request: TripPlanRequest):
     """Generate AI-powered travel itinerary"""
     try:
-        # Mock AI response - replace with actual LangChain integration
-        ai_plan = {
-            "itinerary_id": f"plan_{request.user_id}_{int(datetime.utcnow().timestamp())}",
-            "title": f"{', '.join(request.places)} {request.focus.title()} Adventure",
-            "city": request.places[0] if request.places else "Delhi",
-            "going_with": request.going_with,
-            "focus": request.focus,
-            "duration": f"{request.duration} {request.duration_unit}",
-            "total_stops": 6,
-            "stops": [
-                {
-                    "id": f"stop_{i}",
-                    "name": f"Amazing {request.focus} Spot {i}",
-                    "type": "Food" if i % 2 == 0 else "Place",
-                    "time_window": f"{9 + i * 2}:00 - {11 + i * 2}:00",
-                    "quick_info": f"Perfect for {request.going_with.lower()} trips. Try the signature experience!",
-                    "estimated_duration": "2 hours",
-                    "cost_estimate": f"₹{(i + 1) * 200}"
-                }
-                for i in range(6)
-            ],
-            "ai_recommendations": [
-                f"Perfect for {request.going_with.lower()} trips",
-                f"Great {request.focus} experiences",
-                f"Ideal {request.duration_unit} itinerary"
-            ],
-            "estimated_total_cost": "₹2,000 - ₹3,500",
-            "created_at": datetime.utcnow().isoformat()
-        }
+        # Identical inputs share one generated plan; each request still gets its own itinerary
+        params = trip_plan_params(request.dict())
+        plan = await trip_plan_cache.get_or_compute(params, lambda: generate_trip_plan(params))
         
-        # Save to database
-        day_plan = DayPlan(
-            id=ai_plan["itinerary_id"],
-            user_id=request.user_id,
-            title=ai_plan["title"],
-            city=ai_plan["city"],
-            going_with=request.going_with,
-            focus=request.focus,
-            date=request.date,
-            stops=ai_plan["stops"],
-            items_count=len(ai_plan["stops"])
-        )
-        
-        await db.day_plans.insert_one(day_plan.dict())
-        
-        return ai_plan
+        return await _save_trip_plan(request.dict(), plan)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error planning trip: {str(e)}")
 
+@app.post("/api/plan-my-trip/jobs", status_code=202)
+async def submit_trip_plan_job(request: TripPlanRequest):
+    """Queue itinerary generation; poll the job or stream its stops from /events"""
+    try:
+        job = await submit_plan_job(request.dict())
+        job["events_url"] = f"/api/plan-my-trip/jobs/{job['job_id']}/events"
+        return job
+        
+    except PlanQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queueing trip plan: {str(e)}")
+
+async def _find_plan_job(job_id: str) -> Dict[str, Any]:
+    try:
+        job = await get_plan_job(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching trip plan job: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trip plan job not found")
+    return job
+
+@app.get("/api/plan-my-trip/jobs/{job_id}")
+async def get_trip_plan_job(job_id: str):
+    """Get a plan job's status, the stops generated so far and, once done, the itinerary"""
+    job = await _find_plan_job(job_id)
+    job["job_id"] = job.pop("_id")
+    return job
+
+@app.get("/api/plan-my-trip/jobs/{job_id}/events")
+async def stream_trip_plan_job(job_id: str):
+    """Server-sent events for a plan job: status, each stop as it is generated, then the itinerary"""
+    job = await _find_plan_job(job_id)
+    return StreamingResponse(
+        stream_plan_job_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _build_top_places(places: List[str], focus: str) -> List[Dict[str, Any]]:
+    """Top places for a location and focus"""
+    # Mock top places - replace with actual AI recommendations
+    return [
+        {
+            "id": f"place_{i}",
+            "name": f"Top {focus.title()} Destination {i}",
+            "type": "Food" if i % 2 == 0 else "Place",
+            "location": places[0] if places else "Delhi",
+            "rating": 4.5 + (i * 0.1),
+            "image_url": f"https://example.com/image{i}.jpg",
+            "quick_info": f"Must-visit {focus} spot with amazing reviews",
+            "estimated_time": f"{1 + i} hours",
+            "cost_range": f"₹{i * 100} - ₹{(i + 1) * 200}"
+        }
+        for i in range(12)
+    ]
+
 @app.post("/api/top-places")
 async def get_top_places(request: Dict[str, Any]):
     """Get top places for manual day building"""
     try:
         places = request.get("places", ["Delhi"])
         focus = request.get("focus", "both")
+        location = places[0] if places else "Delhi"
         
-        # Mock top places - replace with actual AI recommendations
-        top_places = [
-            {
-                "id": f"place_{i}",
-                "name": f"Top {focus.title()} Destination {i}",
-                "type": "Food" if i % 2 == 0 else "Place",
-                "location": places[0] if places else "Delhi",
-                "rating": 4.5 + (i * 0.1),
-                "image_url": f"https://example.com/image{i}.jpg",
-                "quick_info": f"Must-visit {focus} spot with amazing reviews",
-                "estimated_time": f"{1 + i} hours",
-                "cost_range": f"₹{i * 100} - ₹{(i + 1) * 200}"
-            }
-            for i in range(12)
-        ]
+        # Only the first place shapes the result today. The cached list is built from the
+        # normalized focus and carries this request's own spelling of the location.
+        cached = await top_places_cache.get_or_compute(
+            {"location": location, "focus": focus},
+            lambda: _build_top_places([location], normalize_params(focus))
+        )
+        top_places = [{**place, "location": location} for place in cached]
         
         return {"places": top_places, "total": len(top_places)}
         
@@ -292,44 +418,60 @@ async def get_top_places(request: Dict[str, Any]):
 # DAY PLANS MANAGEMENT
 # ======================================
 
+def _validate_cursor(cursor: Optional[str]):
+    """Reject malformed pagination cursors with a 400"""
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/day-plans/{user_id}")
-async def get_user_day_plans(user_id: str):
-    """Get user's day plans"""
+async def get_user_day_plans(user_id: str, limit: int = 50, cursor: Optional[str] = None):
+    """Get user's day plans, newest first, paginated by next_cursor"""
+    _validate_cursor(cursor)
     try:
-        plans_cursor = db.day_plans.find({"user_id": user_id}).sort("created_at", -1)
-        plans = await plans_cursor.to_list(length=50)
+        page = await paginate(db.day_plans, {"user_id": user_id}, "created_at", limit, cursor)
         
         # Convert ObjectId to string for JSON serialization
-        for plan in plans:
+        for plan in page["items"]:
             plan["_id"] = str(plan["_id"])
         
-        return plans
+        return page
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching day plans: {str(e)}")
 
 @app.get("/api/saved-reels/{user_id}")
-async def get_saved_reels(user_id: str):
-    """Get user's saved reels"""
+async def get_saved_reels(user_id: str, limit: int = 50, cursor: Optional[str] = None):
+    """Get user's saved reels, newest first, paginated by next_cursor"""
+    _validate_cursor(cursor)
     try:
-        saved_cursor = db.saved_reels.find({"user_id": user_id}).sort("saved_at", -1)
-        saved_reels = await saved_cursor.to_list(length=50)
+        page = await paginate(db.saved_reels, {"user_id": user_id}, "saved_at", limit, cursor)
+        saved_reels = page["items"]
+        
+        # Join the page against the reel catalog in one query
+        catalog = await get_reels_by_ids([saved["reel_id"] for saved in saved_reels])
         
-        # Mock reel data for each saved reel
         reels_data = []
         for saved in saved_reels:
+            reel = catalog.get(saved["reel_id"], {})
             reel_data = {
                 "id": saved["reel_id"],
-                "title": f"Saved Reel {saved['reel_id'][-3:]}",
+                "title": reel.get("title", f"Saved Reel {saved['reel_id'][-3:]}"),
                 "thumbnail_url": f"https://example.com/thumb_{saved['reel_id']}.jpg",
-                "location": "Delhi",
-                "type": "Food" if len(saved["reel_id"]) % 2 == 0 else "Place",
-                "instagram_url": f"https://instagram.com/p/{saved['reel_id']}",
+                "location": reel.get("location", "Delhi"),
+                "type": reel.get("type", "Food" if len(saved["reel_id"]) % 2 == 0 else "Place"),
+                "instagram_url": reel.get("instagram_url", f"https://instagram.com/p/{saved['reel_id']}"),
                 "saved_at": saved["saved_at"]
             }
             reels_data.append(reel_data)
         
-        return reels_data
+        return {
+            "items": reels_data,
+            "next_cursor": page["next_cursor"],
+            "has_more": page["has_more"]
+        }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching saved reels: {str(e)}")
@@ -342,20 +484,8 @@ async def get_saved_reels(user_id: str):
 async def chatbot_from_profile(request: ChatRequest):
     """Chat from Profile → Day Plans context"""
     try:
-        # Mock chatbot response - replace with actual chatbot integration
-        response = {
-            "message": f"Hi! I can help you with your day plans. You asked: '{request.message}'. Let me know which itinerary you'd like to discuss!",
-            "actions": [
-                {"type": "view_plans", "label": "View your plans"},
-                {"type": "create_plan", "label": "Create new plan"}
-            ],
-            "context": {
-                "itinerary_id": request.itinerary_id,
-                "context_type": "profile_dayplans",
-                "user_id": request.user_id
-            }
-        }
-        return response
+        chatbot = await load_chatbot()
+        return await chatbot.chat_from_profile_dayplans(request.user_id, request.message, request.itinerary_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
@@ -363,25 +493,12 @@ async def chatbot_from_profile(request: ChatRequest):
 @app.post("/api/chatbot/start-my-day")
 async def chatbot_from_start_day(request: ChatRequest):
     """Chat from Start My Day execution context"""
+    if not request.itinerary_id:
+        raise HTTPException(status_code=400, detail="Itinerary ID required for Start My Day context")
+    
     try:
-        if not request.itinerary_id:
-            raise HTTPException(status_code=400, detail="Itinerary ID required for Start My Day context")
-        
-        # Mock chatbot response for active day execution
-        response = {
-            "message": f"I'm here to help with your active trip! You said: '{request.message}'. How can I assist you today?",
-            "actions": [
-                {"type": "nearby_suggestions", "label": "Find nearby alternatives"},
-                {"type": "check_done", "label": "Mark location as visited"},
-                {"type": "get_directions", "label": "Get directions"}
-            ],
-            "context": {
-                "itinerary_id": request.itinerary_id,
-                "context_type": "start_my_day",
-                "user_id": request.user_id
-            }
-        }
-        return response
+        chatbot = await load_chatbot()
+        return await chatbot.chat_from_start_my_day(request.user_id, request.message, request.itinerary_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
@@ -390,28 +507,52 @@ async def chatbot_from_start_day(request: ChatRequest):
 async def chatbot_general(request: ChatRequest):
     """General travel assistance chat"""
     try:
-        # Mock general travel chatbot response
-        response = {
-            "message": f"Hello! I'm Toria, your travel assistant. You asked: '{request.message}'. I can help you plan trips, find great places, and answer travel questions!",
-            "actions": [
-                {"type": "plan_trip", "label": "Plan a new trip"},
-                {"type": "find_places", "label": "Find places to visit"},
-                {"type": "travel_tips", "label": "Get travel tips"}
-            ],
-            "context": {
-                "context_type": "general",
-                "user_id": request.user_id
-            }
-        }
-        return response
+        chatbot = await load_chatbot()
+        return await chatbot.general_travel_chat(request.user_id, request.message)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
 
+CHAT_STREAM_CONTEXTS = {
+    "profile-dayplans": "profile_dayplans",
+    "start-my-day": "start_my_day",
+    "general": "general"
+}
+
+async def _chat_events(request: ChatRequest, context_type: str):
+    chatbot = await load_chatbot()
+    async for event in chatbot.stream_chat(request.user_id, request.message, context_type, request.itinerary_id):
+        yield format_sse(event["event"], event["data"])
+
+@app.post("/api/chatbot/{context}/stream")
+async def chatbot_stream(context: str, request: ChatRequest):
+    """Stream a chat reply as server-sent events: actions, then tokens, then done"""
+    context_type = CHAT_STREAM_CONTEXTS.get(context)
+    if context_type is None:
+        raise HTTPException(status_code=404, detail=f"Unknown chat context: {context}")
+    if context_type == "start_my_day" and not request.itinerary_id:
+        raise HTTPException(status_code=400, detail="Itinerary ID required for Start My Day context")
+    
+    return StreamingResponse(
+        _chat_events(request, context_type),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ======================================
 # NOTIFICATION ENDPOINTS
 # ======================================
 
+@app.post("/api/notifications/register")
+async def register_notifications(request: PushTokenRequest):
+    """Register a device push token for a user"""
+    try:
+        await register_push_token(request.user_id, request.push_token, request.platform)
+        return {"success": True}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error registering push token: {str(e)}")
+
 @app.post("/api/notifications/send")
 async def send_push_notification(request: NotificationRequest):
     """Send push notification to user"""
@@ -427,21 +568,67 @@ async def send_push_notification(request: NotificationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Notification error: {str(e)}")
 
+@app.post("/api/notifications/broadcast")
+async def broadcast_to_segment(request: BroadcastRequest):
+    """Fan a notification out to a user segment; returns a job id to poll for progress"""
+    try:
+        return await broadcast_notification(request.segment, request.title, request.body, request.data)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Broadcast error: {str(e)}")
+
+@app.get("/api/notifications/broadcast/{job_id}")
+async def get_broadcast_progress(job_id: str):
+    """Get a broadcast job's status and progress counters"""
+    try:
+        job = await get_broadcast_job(job_id)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching broadcast: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    job["job_id"] = job.pop("_id")
+    return job
+
 @app.get("/api/notifications/{user_id}")
-async def get_notifications(user_id: str, limit: int = 20):
-    """Get user's notification history"""
+async def get_notifications(user_id: str, limit: int = 20, cursor: Optional[str] = None):
+    """Get user's notification history, newest first, paginated by next_cursor"""
+    _validate_cursor(cursor)
     try:
-        notifications = await get_user_notifications(user_id, limit)
+        page = await get_user_notifications_page(user_id, limit, cursor)
         
         # Convert ObjectId to string
-        for notification in notifications:
+        for notification in page["items"]:
             notification["_id"] = str(notification["_id"])
         
-        return notifications
+        return page
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching notifications: {str(e)}")
 
+@app.get("/api/notifications/{user_id}/unread-count")
+async def get_notifications_unread_count(user_id: str):
+    """Get the unread badge count from the maintained counter"""
+    try:
+        return {"user_id": user_id, "unread": await get_unread_count(user_id)}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching unread count: {str(e)}")
+
+@app.post("/api/notifications/{user_id}/mark-read")
+async def mark_read(user_id: str, request: MarkReadRequest):
+    """Mark a batch of notifications (or all of them) as read"""
+    try:
+        marked = await mark_notifications_read(user_id, request.notification_ids)
+        return {"success": True, "marked": marked, "unread": await get_unread_count(user_id)}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error marking notifications read: {str(e)}")
+
 @app.post("/api/notifications/location-suggestions")
 async def notify_location_suggestions(request: Dict[str, Any]):
     """Send location-based suggestions notification"""
@@ -473,22 +660,50 @@ async def notify_feedback_reminder(request: Dict[str, Any]):
 # ANALYTICS & TRACKING
 # ======================================
 
+def _queue_events(events: List[Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, int]:
+    """Hand events to the buffered writer; a full queue under the reject policy is a 429"""
+    try:
+        return track_events(events, user_id)
+    except AnalyticsQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
 @app.post("/api/analytics/track")
 async def track_event(request: Dict[str, Any]):
     """Track user events for analytics"""
+    result = _queue_events([request])
+    return {
+        "success": result["accepted"] == 1,
+        "event_tracked": request.get("event_name") or request.get("event"),
+        "dropped": result["dropped"]
+    }
+
+@app.post("/api/analytics/track-batch")
+async def track_event_batch(request: AnalyticsBatchRequest):
+    """Track an array of user events for analytics"""
+    if len(request.events) > MAX_EVENTS_PER_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_EVENTS_PER_BATCH} events per batch"
+        )
+    
+    result = _queue_events(request.events, request.user_id)
+    return {"success": result["dropped"] == 0, **result}
+
+@app.get("/api/analytics/summary")
+async def analytics_summary(granularity: str = "day",
+                            event_name: Optional[str] = None,
+                            user_id: Optional[str] = None,
+                            start: Optional[str] = None,
+                            end: Optional[str] = None):
+    """Get pre-aggregated event counts per hour or day"""
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    
     try:
-        event = {
-            "user_id": request.get("user_id"),
-            "event_name": request.get("event_name"),
-            "properties": request.get("properties", {}),
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        await db.analytics_events.insert_one(event)
-        return {"success": True, "event_tracked": event["event_name"]}
+        return await get_analytics_summary(granularity, event_name, user_id, start, end)
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analytics error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analytics summary error: {str(e)}")
 
 # ======================================
 # USER MANAGEMENT
@@ -535,6 +750,8 @@ async def update_user_preferences(user_id: str, preferences: Dict[str, Any]):
             {"$set": {"preferences": preferences, "updated_at": datetime.utcnow().isoformat()}},
             upsert=True
         )
+        invalidate_user_feed_preferences(user_id)
+        invalidate_chat_context(user_id)
         
         return {"success": True, "updated": result.modified_count > 0}
         
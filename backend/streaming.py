@@ -0,0 +1,11 @@
+"""
+Server-Sent Events helpers for Toria
+"""
+
+import json
+from typing import Any
+
+
+def format_sse(event: str, data: Any) -> str:
+    """One SSE frame; data is JSON-encoded"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,130 @@
+"""
+Unread Notification Counters for Toria
+Per-user unread counts maintained on write and served from an in-process cache
+"""
+
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+
+# Counts can change on other replicas, so cached values are kept briefly
+UNREAD_COUNT_CACHE_TTL = float(os.getenv('UNREAD_COUNT_CACHE_TTL', '15'))
+UNREAD_COUNT_CACHE_SIZE = int(os.getenv('UNREAD_COUNT_CACHE_SIZE', '50000'))
+
+UNREAD_QUERY = {"read": {"$ne": True}}
+
+
+class UnreadCounter:
+    """Keeps notification_counters.unread in step with notifications.read"""
+
+    def __init__(self, ttl: float = UNREAD_COUNT_CACHE_TTL, maxsize: int = UNREAD_COUNT_CACHE_SIZE):
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.stats = {"hits": 0, "misses": 0, "backfills": 0}
+
+    async def add(self, user_ids: List[str]):
+        """Count newly stored notifications, one per occurrence of a user id
+
+        Only existing counters are bumped; a missing one is backfilled from the stored
+        notifications (these included) on the user's next read.
+        """
+        if not user_ids:
+            return
+        counts = Counter(user_ids)
+        await db.notification_counters.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"unread": count}})
+            for user_id, count in counts.items()
+        ], ordered=False)
+        for user_id, count in counts.items():
+            if user_id in self.cache:
+                self.cache[user_id] += count
+
+    async def get(self, user_id: str) -> int:
+        """Unread count for the badge; reads the counter document at most once per TTL"""
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        self.stats["misses"] += 1
+        counter = await db.notification_counters.find_one({"_id": user_id})
+        if counter is None:
+            count = await self._backfill(user_id)
+        else:
+            count = max(0, counter.get("unread", 0))
+        self.cache[user_id] = count
+        return count
+
+    async def _backfill(self, user_id: str) -> int:
+        """One-time count for users whose notifications predate the counter
+
+        The counter is created before counting, so add() records any notification
+        stored while the count runs; the count is then added on top.
+        """
+        self.stats["backfills"] += 1
+        query = {"user_id": user_id, **UNREAD_QUERY}
+        try:
+            created = await db.notification_counters.update_one(
+                {"_id": user_id}, {"$setOnInsert": {"unread": 0}}, upsert=True
+            )
+        except DuplicateKeyError:
+            created = None
+        if created is None or created.upserted_id is None:
+            # Another request is backfilling this counter; answer without writing
+            return await db.notifications.count_documents(query)
+
+        count = await db.notifications.count_documents(query)
+        counter = await db.notification_counters.find_one_and_update(
+            {"_id": user_id}, {"$inc": {"unread": count}}, return_document=ReturnDocument.AFTER
+        )
+        return max(0, counter.get("unread", 0)) if counter else count
+
+    async def mark_read(self, user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+        """Mark the given notifications (or all of them) read; returns how many changed"""
+        query: Dict[str, Any] = {"user_id": user_id, **UNREAD_QUERY}
+        if notification_ids is not None:
+            try:
+                query["_id"] = {"$in": [ObjectId(nid) for nid in notification_ids]}
+            except InvalidId:
+                raise ValueError("Invalid notification id")
+
+        result = await db.notifications.update_many(query, {"$set": {"read": True, "read_at": datetime.utcnow()}})
+        changed = result.modified_count
+
+        if changed:
+            # Decrement by what was actually marked so a notification stored meanwhile stays counted
+            await db.notification_counters.update_one({"_id": user_id}, {"$inc": {"unread": -changed}})
+            self.cache.pop(user_id, None)
+        return changed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "cached_users": len(self.cache)}
+
+
+# Global instance
+unread_counter = UnreadCounter()
+
+# Helper functions for external use
+async def count_new_notifications(user_ids: List[str]):
+    """Bump unread counters for newly stored notifications"""
+    await unread_counter.add(user_ids)
+
+async def get_unread_count(user_id: str) -> int:
+    """Get a user's unread notification count"""
+    return await unread_counter.get(user_id)
+
+async def mark_notifications_read(user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+    """Mark notifications read and update the counter"""
+    return await unread_counter.mark_read(user_id, notification_ids)
+
+def get_unread_stats() -> Dict[str, Any]:
+    """Get unread counter cache statistics"""
+    return unread_counter.get_stats()
@@ -114,7 +114,9 @@ class ToriaBackendTester:
         
         # Test upvote reel
         try:
-            async with self.session.post(f"{BACKEND_URL}/reels/reel_1/upvote") as response:
+            payload = {"user_id": self.test_user_id}
+            async with self.session.post(f"{BACKEND_URL}/reels/reel_1/upvote", 
+                                       params=payload) as response:
                 if response.status == 200:
                     data = await response.json()
                     if data.get("success") and data.get("reel_id") == "reel_1":
@@ -211,13 +213,13 @@ class ToriaBackendTester:
         try:
             async with self.session.get(f"{BACKEND_URL}/day-plans/{self.test_user_id}") as response:
                 if response.status == 200:
-                    plans = await response.json()
-                    if isinstance(plans, list):
+                    page = await response.json()
+                    if isinstance(page, dict) and isinstance(page.get("items"), list) and "next_cursor" in page:
                         self.log_test("Day Plans", "Get User Day Plans", "PASS", 
-                                    f"Retrieved {len(plans)} day plans")
+                                    f"Retrieved {len(page['items'])} day plans")
                     else:
                         self.log_test("Day Plans", "Get User Day Plans", "FAIL", 
-                                    f"Invalid response format: {type(plans)}")
+                                    f"Invalid page format: {page}")
                 else:
                     self.log_test("Day Plans", "Get User Day Plans", "FAIL", 
                                 f"HTTP {response.status}")
@@ -228,13 +230,13 @@ class ToriaBackendTester:
         try:
             async with self.session.get(f"{BACKEND_URL}/saved-reels/{self.test_user_id}") as response:
                 if response.status == 200:
-                    saved_reels = await response.json()
-                    if isinstance(saved_reels, list):
+                    page = await response.json()
+                    if isinstance(page, dict) and isinstance(page.get("items"), list) and "next_cursor" in page:
                         self.log_test("Day Plans", "Get Saved Reels", "PASS", 
-                                    f"Retrieved {len(saved_reels)} saved reels")
+                                    f"Retrieved {len(page['items'])} saved reels")
                     else:
                         self.log_test("Day Plans", "Get Saved Reels", "FAIL", 
-                                    f"Invalid response format: {type(saved_reels)}")
+                                    f"Invalid page format: {page}")
                 else:
                     self.log_test("Day Plans", "Get Saved Reels", "FAIL", 
                                 f"HTTP {response.status}")
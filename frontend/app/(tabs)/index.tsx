@@ -427,8 +427,8 @@ const DiscoverScreen: React.FC = () => {
     refetch,
     isRefetching,
   } = useQuery({
-    queryKey: ['reels', currentLocation, selectedItinerary],
-    queryFn: () => fetchReels({ location: currentLocation }),
+    queryKey: ['reels', currentLocation, selectedItinerary, user?.id],
+    queryFn: () => fetchReels({ location: currentLocation, userId: user?.id }),
     enabled: !!currentLocation,
     onSuccess: () => {
       trackEvent('discover_impression', { location: currentLocation, count: reels.length });
@@ -436,7 +436,7 @@ const DiscoverScreen: React.FC = () => {
   });
 
   const upvoteMutation = useMutation({
-    mutationFn: upvoteReel,
+    mutationFn: (reelId: string) => upvoteReel(reelId, user?.id || 'anonymous'),
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ['reels'] });
       Toast.show({
@@ -75,6 +75,12 @@ export interface DayPlan {
   updated_at: string;
 }
 
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+  has_more: boolean;
+}
+
 export interface TravelPlanRequest {
   places: string[];
   going_with: string;
@@ -113,11 +119,12 @@ export const getUser = async (userId: string): Promise<User> => {
 };
 
 // Reels APIs
-export const fetchReels = async (filters?: { location?: string; type?: string; limit?: number }): Promise<Reel[]> => {
+export const fetchReels = async (filters?: { location?: string; type?: string; limit?: number; userId?: string }): Promise<Reel[]> => {
   const params = new URLSearchParams();
   if (filters?.location) params.append('location', filters.location);
   if (filters?.type) params.append('type', filters.type);
   if (filters?.limit) params.append('limit', filters.limit.toString());
+  if (filters?.userId) params.append('user_id', filters.userId);
 
   const response = await api.get(`/reels?${params.toString()}`);
   return response.data;
@@ -128,8 +135,8 @@ export const createReel = async (reelData: Partial<Reel>): Promise<Reel> => {
   return response.data;
 };
 
-export const upvoteReel = async (reelId: string): Promise<{ message: string }> => {
-  const response = await api.post(`/reels/${reelId}/upvote`);
+export const upvoteReel = async (reelId: string, userId: string): Promise<{ message: string }> => {
+  const response = await api.post(`/reels/${reelId}/upvote?user_id=${userId}`);
   return response.data;
 };
 
@@ -144,11 +151,16 @@ export const createDayPlan = async (planData: Partial<DayPlan>): Promise<DayPlan
   return response.data;
 };
 
-export const getUserDayPlans = async (userId: string): Promise<DayPlan[]> => {
-  const response = await api.get(`/day-plans/${userId}`);
+export const getUserDayPlansPage = async (userId: string, cursor?: string, limit?: number): Promise<Page<DayPlan>> => {
+  const response = await api.get(`/day-plans/${userId}`, { params: { cursor, limit } });
   return response.data;
 };
 
+export const getUserDayPlans = async (userId: string): Promise<DayPlan[]> => {
+  const page = await getUserDayPlansPage(userId);
+  return page.items;
+};
+
 export const getUserDayPlansByStatus = async (userId: string, status: string): Promise<DayPlan[]> => {
   const response = await api.get(`/day-plans/${userId}/${status}`);
   return response.data;
@@ -198,11 +210,16 @@ export const chatbotFromStartMyDay = async (
 };
 
 // Saved Reels APIs
-export const getSavedReels = async (userId: string): Promise<any[]> => {
-  const response = await api.get(`/saved-reels/${userId}`);
+export const getSavedReelsPage = async (userId: string, cursor?: string, limit?: number): Promise<Page<any>> => {
+  const response = await api.get(`/saved-reels/${userId}`, { params: { cursor, limit } });
   return response.data;
 };
 
+export const getSavedReels = async (userId: string): Promise<any[]> => {
+  const page = await getSavedReelsPage(userId);
+  return page.items;
+};
+
 // Analytics APIs
 export const trackEvent = async (eventName: string, properties?: Record<string, any>) => {
   try {
@@ -226,6 +243,18 @@ export const registerForNotifications = async (userId: string, pushToken: string
   return response.data;
 };
 
+export const getUnreadNotificationCount = async (userId: string): Promise<number> => {
+  const response = await api.get(`/notifications/${userId}/unread-count`);
+  return response.data.unread;
+};
+
+export const markNotificationsRead = async (userId: string, notificationIds?: string[]) => {
+  const response = await api.post(`/notifications/${userId}/mark-read`, {
+    notification_ids: notificationIds ?? null,
+  });
+  return response.data;
+};
+
 export const updateNotificationPreferences = async (userId: string, preferences: Record<string, boolean>) => {
   const response = await api.put(`/notifications/preferences/${userId}`, preferences);
   return response.data;
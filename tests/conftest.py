@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+os.environ.setdefault("CHATBOT_MOCK_LLM", "true")
+
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory database behind every module's shared `db` handle"""
+    mock_db = AsyncMongoMockClient()["toria_test"]
+    monkeypatch.setattr(database.database_manager, "get_database", lambda: mock_db)
+    return mock_db
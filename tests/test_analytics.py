@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from analytics import AnalyticsBuffer, AnalyticsQueueFull, build_event
+
+
+def test_build_event_accepts_either_event_key():
+    event = build_event({"event": "reel_view", "timestamp": "2025-01-01T00:00:00"}, user_id="u1")
+
+    assert (event["event_name"], event["user_id"]) == ("reel_view", "u1")
+    assert event["client_timestamp"] == "2025-01-01T00:00:00"
+
+
+def test_overflow_policies():
+    async def run():
+        dropping = AnalyticsBuffer(queue_size=3, overflow_policy="drop")
+        rejecting = AnalyticsBuffer(queue_size=3, overflow_policy="reject")
+        result = dropping.enqueue([{"n": i} for i in range(5)])
+        with pytest.raises(AnalyticsQueueFull):
+            rejecting.enqueue([{"n": i} for i in range(5)])
+        return result, rejecting.stats["rejected"], rejecting.get_stats()["queue_depth"]
+
+    result, rejected, depth = asyncio.run(run())
+
+    assert result == {"accepted": 3, "dropped": 2}
+    assert (rejected, depth) == (5, 0)
+
+
+def test_writer_batches_and_stop_flushes_everything(mongo):
+    buffer = AnalyticsBuffer(batch_size=4, flush_interval=0.01)
+
+    async def run():
+        buffer.start()
+        buffer.enqueue([build_event({"event_name": "tap", "n": i}) for i in range(10)])
+        await asyncio.sleep(0.05)
+        buffer.enqueue([build_event({"event_name": "late"}) for _ in range(3)])
+        await buffer.stop()
+        return await mongo.analytics_events.count_documents({})
+
+    stored = asyncio.run(run())
+
+    assert stored == 13
+    assert buffer.stats["flushed"] == 13
+    assert buffer.stats["batches"] >= 3
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import broadcast
+from broadcast import BroadcastService
+
+
+async def _wait_for(service, job_id):
+    while service._tasks:
+        await asyncio.sleep(0)
+    return await service.get_job(job_id)
+
+
+def test_segment_is_fanned_out_once_per_user_skipping_opt_outs(mongo):
+    service = BroadcastService(chunk_size=2)
+
+    async def run():
+        await mongo.users.insert_many([
+            {"user_id": "u1", "preferences": {"foodie": True}},
+            {"user_id": "u2", "preferences": {"foodie": True, "notifications": False}},
+            {"user_id": "u3", "preferences": {"foodie": True}},
+            {"user_id": "u4", "preferences": {"foodie": False}},
+        ])
+        submitted = await service.submit({"type": "preference", "flag": "foodie"}, "Street food week", "Try it")
+        job = await _wait_for(service, submitted["job_id"])
+        recipients = sorted(await mongo.notifications.distinct("user_id"))
+        return job, recipients
+
+    job, recipients = asyncio.run(run())
+
+    assert job["status"] == "completed"
+    assert (job["matched"], job["skipped_opted_out"], job["inserted"]) == (3, 1, 2)
+    assert recipients == ["u1", "u3"]
+
+
+def test_unexpected_error_marks_the_job_failed(mongo, monkeypatch):
+    service = BroadcastService()
+
+    async def broken_enqueue(notifications):
+        raise RuntimeError("outbox serializer blew up")
+
+    monkeypatch.setattr(broadcast, "enqueue_push", broken_enqueue)
+
+    async def run():
+        await mongo.users.insert_one({"user_id": "u1", "preferences": {"foodie": True}})
+        submitted = await service.submit({"type": "preference", "flag": "foodie"}, "Hi", "There")
+        return await _wait_for(service, submitted["job_id"])
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "failed"
+    assert job["error"] == "outbox serializer blew up"
+    assert "finished_at" in job
+
+
+def test_invalid_segment_is_rejected_before_a_job_is_recorded(mongo):
+    service = BroadcastService()
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.submit({"type": "upcoming_plan_city"}, "Hi", "There"))
+
+    assert asyncio.run(mongo.notification_jobs.count_documents({})) == 0
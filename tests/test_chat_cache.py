@@ -0,0 +1,53 @@
+from chat_cache import ChatResponseCache
+
+PREFERENCES = {"food": ["veg"]}
+
+
+def test_questions_match_across_case_punctuation_and_spacing():
+    cache = ChatResponseCache(similarity=False)
+    cache.put("What's the best time to visit Goa?", PREFERENCES, "November to February")
+
+    assert cache.get("what s the best   time to visit goa", PREFERENCES) == "November to February"
+    assert cache.get("What's the best time to visit Goa?", {"food": ["non-veg"]}) is None
+
+
+def test_short_and_referential_follow_ups_are_never_cached():
+    cache = ChatResponseCache(similarity=False)
+
+    for message in ("tell me more", "Is it safe in June?", "What should I eat there?", "Can you suggest another beach?"):
+        cache.put(message, PREFERENCES, "reply")
+        assert cache.get(message, PREFERENCES) is None
+
+    cache.put("Is there a good beach near Mumbai?", PREFERENCES, "Alibaug")
+    assert cache.get("Is there a good beach near Mumbai?", PREFERENCES) == "Alibaug"
+
+
+def test_similar_question_is_served_from_the_index():
+    cache = ChatResponseCache(similarity=True, threshold=0.8)
+    cache.put("What is the best time to visit Goa?", PREFERENCES, "November to February")
+
+    assert cache.get("What is the best time to visit Goa in winter?", PREFERENCES) == "November to February"
+    assert cache.stats["similar_hits"] == 1
+
+
+def test_restoring_an_expired_question_reuses_its_index_row():
+    cache = ChatResponseCache(maxsize=4, ttl=10, similarity=True)
+
+    for _ in range(21):
+        cache.put("What is the best time to visit Goa?", PREFERENCES, "November to February")
+        cache.cache.expire(cache.cache.timer() + 11)
+
+    assert len(cache.index.keys) == 1
+    assert cache.index.capacity == 4
+
+
+def test_compaction_keeps_one_row_per_live_key():
+    cache = ChatResponseCache(maxsize=4, ttl=10, similarity=True)
+    questions = [f"Where should I stay in city number {i}?" for i in range(10)]
+
+    for question in questions:
+        cache.put(question, PREFERENCES, question.upper())
+
+    assert cache.index.capacity == 4
+    assert sorted(cache.index.keys) == sorted(cache.cache.keys())
+    assert cache.get(questions[-1], PREFERENCES) == questions[-1].upper()
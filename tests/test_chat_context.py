@@ -0,0 +1,60 @@
+import asyncio
+
+from chat_context import ChatContextCache
+
+PLAN = {"id": "plan_1", "user_id": "u1", "title": "Old City", "stops": [{"name": "Fort", "type": "Place"}]}
+
+
+def _seed(mongo):
+    async def run():
+        await mongo.users.insert_one({"user_id": "u1", "preferences": {"food": ["veg"]}})
+        await mongo.day_plans.insert_one(dict(PLAN))
+    asyncio.run(run())
+
+
+def test_follow_up_turns_are_served_from_the_cache(mongo):
+    _seed(mongo)
+    cache = ChatContextCache()
+
+    async def run():
+        first = await cache.load("u1", "start_my_day", "plan_1")
+        second = await cache.load("u1", "start_my_day", "plan_1")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert second is first
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 1)
+    assert "_id" not in first["current_itinerary"]
+    assert set(first["fragments"]) == {"preferences", "itinerary"}
+
+
+def test_switching_itinerary_or_invalidating_reloads(mongo):
+    _seed(mongo)
+    cache = ChatContextCache()
+
+    async def run():
+        await cache.load("u1", "profile_dayplans", "plan_1")
+        await cache.load("u1", "profile_dayplans", "plan_2")
+        cache.invalidate("u1", itinerary_id="plan_1")
+        kept = len(cache.cache)
+        cache.invalidate("u1")
+        return kept, len(cache.cache)
+
+    assert asyncio.run(run()) == (1, 0)
+    assert cache.stats["misses"] == 2
+
+
+def test_failed_read_degrades_one_turn_without_caching(mongo, monkeypatch):
+    cache = ChatContextCache()
+
+    async def broken(user_id):
+        raise RuntimeError("users unavailable")
+
+    monkeypatch.setattr(cache, "_fetch_preferences", broken)
+
+    entry = asyncio.run(cache.load("u1", "general", None))
+
+    assert entry["user_preferences"] == {}
+    assert cache.stats["errors"] == 1
+    assert len(cache.cache) == 0
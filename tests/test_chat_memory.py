@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from chat_memory import CheckpointConflict, MongoCheckpointSaver
+
+
+def _config(thread_id, checkpoint_id=None):
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def _checkpoint(checkpoint_id):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = checkpoint_id
+    return checkpoint
+
+
+def test_cold_thread_is_loaded_from_mongo(mongo):
+    async def scenario():
+        await MongoCheckpointSaver().aput(_config("t1"), _checkpoint("c1"), {}, {})
+        cold = MongoCheckpointSaver()
+        loaded = await cold.aget_tuple(_config("t1"))
+        again = await cold.aget_tuple(_config("t1"))
+        return cold, loaded, again
+
+    cold, loaded, again = asyncio.run(scenario())
+
+    assert loaded.config["configurable"]["checkpoint_id"] == "c1"
+    assert again.checkpoint["id"] == "c1"
+    assert cold.stats["misses"] == 1 and cold.stats["hits"] == 1
+
+
+def test_stale_worker_conflicts_instead_of_overwriting(mongo):
+    async def scenario():
+        first, second = MongoCheckpointSaver(), MongoCheckpointSaver()
+        await first.aput(_config("t1"), _checkpoint("c1"), {}, {})
+        await second.aget_tuple(_config("t1"))
+        await first.aput(_config("t1", "c1"), _checkpoint("c2"), {}, {})
+        with pytest.raises(CheckpointConflict):
+            await second.aput(_config("t1", "c1"), _checkpoint("c2-stale"), {}, {})
+        return second, await mongo.chat_threads.find_one({"_id": "t1|"})
+
+    second, stored = asyncio.run(scenario())
+
+    assert stored["checkpoint_id"] == "c2"
+    assert second.stats["conflicts"] == 1
+    assert second.get_stats()["threads_in_memory"] == 0
+
+
+def test_memory_keeps_only_the_hottest_threads(mongo):
+    async def scenario():
+        saver = MongoCheckpointSaver(max_threads=2)
+        for thread_id in ("t1", "t2", "t3"):
+            await saver.aput(_config(thread_id), _checkpoint("c1"), {}, {})
+        return saver, await mongo.chat_threads.count_documents({})
+
+    saver, stored = asyncio.run(scenario())
+
+    assert stored == 3
+    assert ("t1", "") not in saver.threads
+    assert saver.get_stats()["threads_in_memory"] == 2
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+import chatbot
+from chat_cache import ChatResponseCache
+from chat_context import chat_context_cache
+
+PREFERENCES = {"budget": "{mid}", "food": ["veg", "street {chaat}"], "notes": "likes {braces}"}
+ITINERARY = {
+    "id": "plan_1",
+    "title": "Jaipur {Heritage} Walk",
+    "city": "Jaipur",
+    "stops": [{"name": "Hawa Mahal {front}", "time_window": "9:00 - 11:00", "type": "Place"}]
+}
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    """A chatbot on in-memory checkpoints, with Mongo reads replaced by fixed documents"""
+    async def fetch_preferences(user_id):
+        return PREFERENCES
+
+    async def fetch_itinerary(user_id, itinerary_id):
+        return ITINERARY if itinerary_id else None
+
+    monkeypatch.setattr(chatbot, "chat_memory", InMemorySaver())
+    monkeypatch.setattr(chat_context_cache, "_fetch_preferences", fetch_preferences)
+    monkeypatch.setattr(chat_context_cache, "_fetch_itinerary", fetch_itinerary)
+    chat_context_cache.cache.clear()
+    return chatbot.ToriaChatbot()
+
+
+@pytest.mark.parametrize("context_type, itinerary_id", [
+    ("general", None),
+    ("profile_dayplans", "plan_1"),
+    ("start_my_day", "plan_1"),
+])
+def test_chat_turn_with_braces_in_preferences_and_itinerary(bot, context_type, itinerary_id):
+    result = asyncio.run(bot.chat("user_1", "What should I eat near my next stop?", context_type, itinerary_id))
+
+    assert "error" not in result["context"]
+    assert "fallback" not in result["context"]
+    assert result["message"] == chatbot.llm._reply()
+
+
+def test_stream_turn_with_braces_in_preferences(bot):
+    async def collect():
+        return [event async for event in bot.chat_stream("user_1", "Any tips for Jaipur in winter?", "general")]
+
+    events = asyncio.run(collect())
+
+    assert events[-1]["event"] == "done"
+    assert events[-1]["data"]["message"] == chatbot.llm._reply()
+
+
+def test_saturated_gateway_returns_fallback(bot, monkeypatch):
+    monkeypatch.setattr(chatbot.llm_gateway, "max_concurrency", 0)
+    monkeypatch.setattr(chatbot.llm_gateway, "max_queue", 0)
+
+    result = asyncio.run(bot.chat("user_1", "Plan me a food crawl in Delhi", "profile_dayplans", "plan_1"))
+
+    assert result["context"]["fallback"] == "busy"
+    assert result["message"] == chatbot.FALLBACK_MESSAGES["profile_dayplans"]
+
+
+def test_thread_is_trimmed_to_max_messages_including_reply(bot, monkeypatch):
+    monkeypatch.setattr(chatbot, "CHAT_MAX_MESSAGES", 4)
+    config = {"configurable": {"thread_id": "user_1_general"}}
+
+    async def converse():
+        for i in range(5):
+            await bot.chat("user_1", f"Question number {i} about Goa", "general")
+        return await bot.graph.aget_state(config)
+
+    messages = asyncio.run(converse()).values["messages"]
+
+    assert len(messages) == 4
+    assert messages[-2].content == "Question number 4 about Goa"
+
+
+def test_response_cache_serves_standalone_questions_in_ongoing_threads(bot, monkeypatch):
+    cache = ChatResponseCache()
+    monkeypatch.setattr(chatbot, "chat_response_cache", cache)
+    question = "What is the best time to visit Goa?"
+
+    async def converse():
+        await bot.chat("user_2", question, "general")
+        await bot.chat("user_1", "I am travelling with my parents", "general")
+        await bot.chat("user_1", question, "general")
+        await bot.chat("user_1", "Is it safe to go there in June?", "general")
+        await bot.chat("user_3", question, "general")
+
+    asyncio.run(converse())
+
+    # user_1's repeat of the question hits despite the earlier turn; the follow-up bypasses the cache
+    assert cache.stats["stores"] == 2
+    assert cache.stats["hits"] == 2
+    assert cache.stats["skipped"] == 1
@@ -0,0 +1,27 @@
+import asyncio
+
+import chatbot
+from chatbot_loader import ChatbotLoader
+
+
+def test_warm_up_times_every_phase(mongo):
+    loader = ChatbotLoader(lazy=True)
+
+    stats = asyncio.run(loader.warm_up(probe=True, timeout=5))
+
+    assert stats["status"] == "ready"
+    assert set(stats["timings_ms"]) == {"import", "graph", "tokenizer", "llm_probe", "total"}
+    assert stats["errors"] == {}
+
+
+def test_failed_probe_degrades_without_raising(mongo, monkeypatch):
+    async def unreachable(timeout):
+        raise ConnectionError("model endpoint unreachable")
+
+    monkeypatch.setattr(chatbot, "probe_llm", unreachable)
+    loader = ChatbotLoader(lazy=True)
+
+    stats = asyncio.run(loader.warm_up(probe=True, timeout=5))
+
+    assert stats["status"] == "degraded"
+    assert stats["errors"] == {"llm_probe": "model endpoint unreachable"}
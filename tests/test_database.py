@@ -0,0 +1,31 @@
+import asyncio
+
+import database
+from database import DatabaseManager, _DatabaseProxy
+
+
+def test_every_handle_resolves_to_one_shared_client(monkeypatch):
+    manager = DatabaseManager(url="mongodb://localhost:1", db_name="toria_shared")
+    monkeypatch.setattr(database, "database_manager", manager)
+    handle, other = _DatabaseProxy(), _DatabaseProxy()
+
+    first = handle.trips
+    client = manager.client
+
+    assert first.full_name == "toria_shared.trips"
+    assert other["users"].database.client is client
+    assert manager.get_database().client is client
+    asyncio.run(manager.close())
+
+
+def test_close_releases_the_client_and_stats_report_it():
+    manager = DatabaseManager(url="mongodb://localhost:1")
+    manager.get_database()
+
+    assert manager.pool_stats()["connected"] is True
+    asyncio.run(manager.close())
+    stats = manager.pool_stats()
+
+    assert manager.client is None
+    assert stats["connected"] is False and stats["connected_at"] is None
+    assert manager.pool_options()["maxPoolSize"] == stats["max_pool_size"]
@@ -0,0 +1,85 @@
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+import database
+from engagement import ReelEngagementService, WriteBehindCounter
+
+
+def test_flush_batches_buffered_increments(mongo):
+    counter = WriteBehindCounter()
+
+    async def run():
+        await mongo.reels.insert_one({"id": "reel_a", "upvotes": 1})
+        for _ in range(3):
+            counter.increment("reels", "id", "reel_a", "upvotes")
+        counter.increment("reels", "id", "reel_a", "saves", 2)
+        flushed = await counter.flush()
+        return flushed, await mongo.reels.find_one({"id": "reel_a"})
+
+    flushed, reel = asyncio.run(run())
+
+    assert flushed == 1
+    assert (reel["upvotes"], reel["saves"]) == (4, 2)
+    assert not counter.pending
+
+
+class _RejectingCollection:
+    """Applies an unordered bulk_write except for documents matching `reject`, like a server-side error"""
+
+    def __init__(self, collection, reject):
+        self.collection = collection
+        self.reject = reject
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def bulk_write(self, ops, ordered=True):
+        errors = []
+        for index, op in enumerate(ops):
+            if op._filter == self.reject:
+                errors.append({"index": index, "code": 14, "errmsg": "Cannot apply $inc"})
+            else:
+                await self.collection.bulk_write([op])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nModified": len(ops) - len(errors)})
+
+
+def test_partial_bulk_failure_retries_only_failed_operations(mongo, monkeypatch):
+    counter = WriteBehindCounter()
+    written = []
+    counter.add_flush_listener(written.extend)
+    rejecting = {"reels": _RejectingCollection(mongo.reels, {"id": "bad"})}
+    monkeypatch.setattr(database.database_manager, "get_database", lambda: rejecting)
+
+    async def run():
+        await mongo.reels.insert_many([{"id": "good", "upvotes": 0}, {"id": "bad", "upvotes": 0}])
+        counter.increment("reels", "id", "good", "upvotes")
+        counter.increment("reels", "id", "bad", "upvotes")
+        await counter.flush()
+        # Only the rejected delta is still pending; the next flush must not repeat the applied one
+        rejecting["reels"].reject = None
+        await counter.flush()
+        return {doc["id"]: doc["upvotes"] async for doc in mongo.reels.find()}
+
+    counts = asyncio.run(run())
+
+    assert counts == {"good": 1, "bad": 1}
+    assert counter.stats["flush_errors"] == 1
+    assert [(target[2], deltas) for target, deltas in written] == [("good", {"upvotes": 1}), ("bad", {"upvotes": 1})]
+
+
+def test_engagement_on_unknown_reel_creates_no_stub(mongo):
+    service = ReelEngagementService()
+
+    async def run():
+        first = await service.upvote("missing_reel", "u1")
+        again = await service.upvote("missing_reel", "u1")
+        await service.save("missing_reel", "u1")
+        await service.counters.flush()
+        return first, again, await mongo.reels.count_documents({})
+
+    first, again, reels = asyncio.run(run())
+
+    assert (first, again) == (True, False)
+    assert reels == 0
@@ -0,0 +1,42 @@
+import asyncio
+
+from indexes import INDEX_SPECS, _collect_stages, ensure_indexes
+
+
+def test_indexes_are_created_once_per_spec(mongo):
+    async def scenario():
+        await ensure_indexes()
+        await ensure_indexes()
+        return {name: await mongo[name].index_information() for name in INDEX_SPECS}
+
+    info = asyncio.run(scenario())
+
+    for collection, models in INDEX_SPECS.items():
+        assert {model.document["name"] for model in models} <= set(info[collection])
+    assert info["saved_reels"]["user_reel"]["unique"] is True
+
+
+def test_unique_index_over_duplicates_does_not_block_the_rest(mongo):
+    async def scenario():
+        await mongo.reels.insert_many([{"id": "r1"}, {"id": "r1"}])
+        created = await ensure_indexes()
+        return created, await mongo.reels.index_information()
+
+    created, info = asyncio.run(scenario())
+
+    assert "id" not in created["reels"]
+    assert "location_position" in info
+
+
+def test_plan_stages_are_flattened_through_nested_inputs():
+    plan = {
+        "stage": "FETCH",
+        "inputStage": {
+            "stage": "SORT_MERGE",
+            "inputStages": [{"stage": "IXSCAN"}, {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}]
+        }
+    }
+
+    assert _collect_stages(plan) == ["FETCH", "SORT_MERGE", "IXSCAN", "SORT", "COLLSCAN"]
+    assert _collect_stages({"queryPlan": {"stage": "IXSCAN"}}) == ["IXSCAN"]
+    assert _collect_stages(None) == []
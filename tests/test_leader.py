@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from leader import LeaseLostError, MongoLease, current_fence, ensure_fenced
+
+
+def test_first_campaign_takes_the_lease_with_token_one(mongo):
+    lease = MongoLease("job", owner="a")
+
+    async def run():
+        await lease.campaign_once()
+        return await mongo.leader_leases.find_one({"_id": "job"})
+
+    doc = asyncio.run(run())
+
+    assert lease.is_leader
+    assert (doc["owner"], doc["token"]) == ("a", 1)
+
+
+def test_superseded_token_is_fenced_out(mongo):
+    lease = MongoLease("job", owner="a")
+
+    async def run():
+        await lease.campaign_once()
+        # Another instance took the lease over after ours lapsed
+        await mongo.leader_leases.update_one({"_id": "job"}, {"$set": {"owner": "b", "token": 2}})
+        current_fence.set((lease, lease.token))
+        with pytest.raises(LeaseLostError):
+            await ensure_fenced()
+
+    asyncio.run(run())
+
+    assert not lease.is_leader
+    assert lease.stats["lost"] == 1
+
+
+def test_ensure_fenced_is_a_no_op_outside_leader_jobs(mongo):
+    asyncio.run(ensure_fenced())
+
+
+def test_stop_releases_the_lease(mongo):
+    lease = MongoLease("job", owner="a")
+
+    async def run():
+        await lease.campaign_once()
+        await lease.stop()
+        return await mongo.leader_leases.find_one({"_id": "job"})
+
+    doc = asyncio.run(run())
+
+    assert lease.token is None
+    assert doc["expires_at"].year == 1970
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from llm_gateway import LLMGateway, LLMSaturated
+
+
+def test_same_tick_burst_beyond_the_queue_is_rejected():
+    gateway = LLMGateway(max_concurrency=1, max_queue=1, queue_timeout=1, request_timeout=1)
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def scenario():
+        return await asyncio.gather(*(gateway.run(call) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert results[:2] == ["ok", "ok"]
+    assert isinstance(results[2], LLMSaturated)
+    assert gateway.get_stats()["rejected"] == 1
+    assert gateway.get_stats()["in_flight"] == 0
+
+
+def test_slow_call_times_out_and_frees_its_slot():
+    gateway = LLMGateway(max_concurrency=1, max_queue=0, queue_timeout=1, request_timeout=0.01)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def fast():
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await gateway.run(slow)
+        return await gateway.run(fast)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert gateway.stats["timeouts"] == 1 and gateway.stats["completed"] == 1
+
+
+def test_stream_holds_one_slot_until_closed():
+    gateway = LLMGateway(max_concurrency=1, max_queue=0, queue_timeout=1, request_timeout=1)
+
+    async def tokens():
+        for token in ("Chandni ", "Chowk"):
+            yield token
+
+    async def scenario():
+        chunks = []
+        async for token in gateway.stream(tokens()):
+            chunks.append(token)
+            assert gateway.in_flight == 1
+        return "".join(chunks)
+
+    assert asyncio.run(scenario()) == "Chandni Chowk"
+    assert gateway.in_flight == 0
+    assert gateway.stats["completed"] == 1
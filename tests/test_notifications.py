@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import notifications
+from notifications import NotificationService
+
+
+def _trip(hours_ahead):
+    return {
+        "id": "plan_1",
+        "user_id": "u1",
+        "city": "Jaipur",
+        "status": "upcoming",
+        "date": (datetime.utcnow() + timedelta(hours=hours_ahead)).isoformat()
+    }
+
+
+def test_reminder_retried_after_failed_enqueue_is_stored_once(mongo, monkeypatch):
+    service = NotificationService()
+    enqueue = notifications.enqueue_push
+    attempts = []
+
+    async def flaky_enqueue(batch):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("outbox unavailable")
+        await enqueue(batch)
+
+    monkeypatch.setattr(notifications, "enqueue_push", flaky_enqueue)
+
+    async def run():
+        await mongo.notification_counters.insert_one({"_id": "u1", "unread": 0})
+        await mongo.day_plans.insert_one(_trip(22))
+        trip = await mongo.day_plans.find_one({})
+        first = await service._send_due_reminder(trip, asyncio.Semaphore(1))
+        second = await service._send_due_reminder(trip, asyncio.Semaphore(1))
+        third = await service._send_due_reminder(trip, asyncio.Semaphore(1))
+        return (first, second, third), await mongo.notifications.count_documents({}), \
+            await mongo.push_outbox.count_documents({}), await mongo.notification_counters.find_one({"_id": "u1"})
+
+    outcomes, stored, queued, counter = asyncio.run(run())
+
+    assert outcomes == ("failed", "sent", "already_sent")
+    assert (stored, queued) == (1, 1)
+    assert counter["unread"] == 1
+
+
+def test_trip_scan_sends_each_due_reminder_once(mongo):
+    service = NotificationService()
+
+    async def run():
+        await mongo.day_plans.insert_many([_trip(22), _trip(12), _trip(3)])
+        first = await service.schedule_trip_notifications()
+        second = await service.schedule_trip_notifications()
+        types = sorted([doc["data"]["type"] async for doc in mongo.notifications.find({})])
+        return first, second, types
+
+    first, second, types = asyncio.run(run())
+
+    assert (first["sent"], second["sent"]) == (2, 0)
+    assert types == ["trip_preparation", "trip_reminder"]
+
+
+def test_same_type_notifications_inside_the_window_become_one_digest(mongo, monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFICATION_COALESCE_WINDOW", 0.02)
+    service = NotificationService()
+
+    async def run():
+        results = [await service.send_feedback_reminder("u1", stop) for stop in ("Fort", "Bazaar", "Lake")]
+        await asyncio.sleep(0.05)
+        titles = [doc["title"] async for doc in mongo.notifications.find({}).sort("sent_at", 1)]
+        return results, titles
+
+    results, titles = asyncio.run(run())
+
+    assert "coalesced" not in results[0]
+    assert [r["pending"] for r in results[1:]] == [1, 2]
+    assert titles == ["💭 How was Fort?", "💭 How were your last 2 stops?"]
+    assert service.stats["digests_sent"] == 1
+
+
+def test_digest_refused_by_the_rate_limit_is_suppressed(mongo, monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFICATION_COALESCE_WINDOW", 0.02)
+    service = NotificationService()
+    suppressed = []
+    monkeypatch.setattr(notifications.engagement_service.counters, "increment",
+                        lambda *args: suppressed.append(args))
+
+    async def run():
+        service.rate_limiter.allow("u1", service.rate_limiter.capacity)
+        await service.send_location_suggestions("u1", "Fort", [{"name": "Cafe"}])
+        await service.send_location_suggestions("u1", "Lake", [{"name": "Boats"}])
+        await asyncio.sleep(0.05)
+        return await mongo.notifications.count_documents({})
+
+    stored = asyncio.run(run())
+
+    assert stored == 0
+    assert service.stats["suppressed"] == 2
+    assert suppressed == [("users", "user_id", "u1", "stats.notifications_suppressed.location_suggestions", 2)]
+
+
+def test_flush_sends_open_windows_without_waiting(mongo):
+    service = NotificationService()
+
+    async def run():
+        await service.send_feedback_reminder("u1", "Fort")
+        await service.send_feedback_reminder("u1", "Bazaar")
+        await service.flush_coalesced()
+        return await mongo.notifications.count_documents({}), service.get_coalescing_stats()["open_windows"]
+
+    stored, open_windows = asyncio.run(run())
+
+    assert (stored, open_windows) == (2, 0)
@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from pagination import MAX_PAGE_SIZE, clamp_page_size, decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trips_datetimes_and_object_ids():
+    saved_at = datetime(2025, 3, 1, 12, 30)
+    doc_id = ObjectId()
+
+    assert decode_cursor(encode_cursor(saved_at, doc_id)) == (saved_at, doc_id)
+    assert decode_cursor(encode_cursor("2025-03-01", "plan_7")) == ("2025-03-01", "plan_7")
+
+
+def test_malformed_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_page_size_is_clamped():
+    assert clamp_page_size(None) == 20
+    assert clamp_page_size(0) == 1
+    assert clamp_page_size(10_000) == MAX_PAGE_SIZE
+
+
+def test_pages_walk_every_document_once_including_ties(mongo):
+    start = datetime(2025, 1, 1)
+    # Pairs of documents share a timestamp, so the _id tie-breaker decides the order
+    docs = [{"_id": f"plan_{i:02d}", "user_id": "u1", "created_at": start + timedelta(minutes=i // 2)}
+            for i in range(11)]
+    docs.append({"_id": "other", "user_id": "u2", "created_at": start})
+
+    async def walk():
+        await mongo.day_plans.insert_many(docs)
+        seen, cursor = [], None
+        while True:
+            page = await paginate(mongo.day_plans, {"user_id": "u1"}, "created_at", 4, cursor)
+            seen.extend(doc["_id"] for doc in page["items"])
+            if not page["has_more"]:
+                assert page["next_cursor"] is None
+                return seen
+            cursor = page["next_cursor"]
+
+    seen = asyncio.run(walk())
+
+    expected = [doc["_id"] for doc in sorted(docs[:11], key=lambda d: (d["created_at"], d["_id"]), reverse=True)]
+    assert seen == expected
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import planner
+from planner import PlanJobQueue, PlanQueueFull
+from response_cache import ResponseCache
+
+REQUEST = {"user_id": "u1", "places": ["Jaipur"], "going_with": "Friends", "focus": "food",
+           "duration": 1, "duration_unit": "day"}
+
+
+@pytest.fixture(autouse=True)
+def plan_cache(monkeypatch):
+    cache = ResponseCache("plan_my_trip", persist=False)
+    monkeypatch.setattr(planner, "trip_plan_cache", cache)
+    return cache
+
+
+def _events(frames):
+    return [frame.split("\n", 1)[0].removeprefix("event: ") for frame in frames]
+
+
+def test_burst_of_submissions_never_overfills_the_queue(mongo):
+    jobs = PlanJobQueue(workers=1, queue_size=3)
+
+    async def run():
+        return await asyncio.gather(*(jobs.submit(REQUEST) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert sum(isinstance(result, PlanQueueFull) for result in results) == 2
+    assert jobs.stats == {"submitted": 3, "completed": 0, "failed": 0, "rejected": 2, "cache_hits": 0}
+
+
+def test_job_streams_each_stop_then_completes(mongo):
+    jobs = PlanJobQueue(workers=1)
+
+    async def run():
+        jobs.start()
+        submitted = await jobs.submit(REQUEST)
+        job = await jobs.get_job(submitted["job_id"])
+        frames = [frame async for frame in jobs.stream_events(job)]
+        await jobs.stop()
+        return frames
+
+    events = _events(asyncio.run(run()))
+
+    assert events[0] == "status"
+    assert events.count("stop") == 6
+    assert events[-1] == "completed"
+
+
+def test_repeated_plan_is_served_from_the_cache(mongo, plan_cache):
+    jobs = PlanJobQueue(workers=1)
+
+    async def run():
+        jobs.start()
+        for request in (REQUEST, {**REQUEST, "user_id": "u2", "places": ["  JAIPUR "]}):
+            submitted = await jobs.submit(request)
+            job = await jobs.get_job(submitted["job_id"])
+            [frame async for frame in jobs.stream_events(job)]
+        await jobs.stop()
+        return await jobs.get_job(submitted["job_id"])
+
+    job = asyncio.run(run())
+
+    assert jobs.stats["cache_hits"] == 1
+    assert (job["status"], job["stops_done"]) == ("completed", 6)
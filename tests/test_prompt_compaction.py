@@ -0,0 +1,53 @@
+from prompt_compaction import PromptCompactor, TokenEstimator
+
+
+def _compactor(itinerary_budget=600, preferences_budget=150):
+    # Character estimate only, so budgets do not depend on tiktoken being installed
+    estimator = TokenEstimator()
+    estimator._loaded = True
+    return PromptCompactor(itinerary_budget, preferences_budget, estimator)
+
+
+def _itinerary(count, done=()):
+    return {
+        "title": "Old Delhi",
+        "city": "Delhi",
+        "stops": [
+            {"name": f"Stop {i}", "time_window": f"{9 + i}:00", "type": "Food",
+             "quick_info": "Try the famous parathas here " * 2, "completed": i in done}
+            for i in range(1, count + 1)
+        ]
+    }
+
+
+def test_done_stops_are_dropped_and_numbers_kept():
+    text = _compactor().compact_itinerary(_itinerary(4, done={1, 2}), "start_my_day")
+
+    lines = text.splitlines()
+    assert lines[1] == "2 stop(s) already done"
+    assert lines[2].startswith("3. 12:00 | Stop 3 | Food - Try")
+    assert "Stop 1" not in text
+
+
+def test_over_budget_sheds_details_then_later_stops():
+    compactor = _compactor(itinerary_budget=40)
+
+    text = compactor.compact_itinerary(_itinerary(10), "start_my_day")
+
+    assert "parathas" not in text
+    assert text.endswith("more stop(s)")
+    assert text.splitlines()[1].startswith("1. ")
+    assert compactor.estimator.count(text) <= 40
+    assert compactor.stats["details_dropped"] == 1
+
+
+def test_preferences_drop_empty_values_and_truncate_to_budget():
+    compactor = _compactor(preferences_budget=10)
+
+    short = _compactor().compact_preferences({"food": ["veg"], "budget": "", "notes": None})
+    long = compactor.compact_preferences({"notes": "x" * 500})
+
+    assert short == '{"food":["veg"]}'
+    assert long.endswith("...")
+    assert compactor.estimator.count(long) <= 10
+    assert _compactor().compact_preferences({}) == "None"
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import push
+from push import DEAD, PENDING, SENT, TOKEN_INVALID, TOKEN_OK, PushDeliveryService, PushTransport
+
+
+class RecordingTransport(PushTransport):
+    """Returns a fixed result per token and remembers every multicast"""
+
+    def __init__(self, results=None, delay=0.0):
+        self.results = results or {}
+        self.delay = delay
+        self.calls = []
+
+    async def send_multicast(self, message, tokens):
+        self.calls.append((message["title"], list(tokens)))
+        await asyncio.sleep(self.delay)
+        return [self.results.get(token, TOKEN_OK) for token in tokens]
+
+
+def _notification(user_id, title="Trip tomorrow"):
+    return {"_id": f"n_{user_id}", "user_id": user_id, "title": title, "body": "Pack light", "data": {}}
+
+
+async def _seed(mongo, service, notifications, tokens):
+    await mongo.push_tokens.insert_many([{"user_id": user, "token": token} for user, token in tokens])
+    await mongo.notifications.insert_many([dict(n) for n in notifications])
+    await service.enqueue(notifications)
+
+
+def test_same_content_shares_a_multicast_and_invalid_tokens_are_dropped(mongo):
+    transport = RecordingTransport({"t2": TOKEN_INVALID})
+    service = PushDeliveryService(transport)
+
+    async def run():
+        await _seed(mongo, service, [_notification("u1"), _notification("u2"), _notification("u3", "Other")],
+                    [("u1", "t1"), ("u2", "t2")])
+        await service._deliver(await service._claim("w"))
+        statuses = {doc["user_id"]: doc["status"] async for doc in mongo.push_outbox.find({})}
+        return statuses, await mongo.push_tokens.distinct("token")
+
+    statuses, tokens = asyncio.run(run())
+
+    assert transport.calls == [("Trip tomorrow", ["t1", "t2"])]
+    assert statuses == {"u1": SENT, "u2": DEAD, "u3": "no_device"}
+    assert tokens == ["t1"]
+
+
+def test_outcome_from_an_expired_claim_does_not_overwrite_the_new_claim(mongo):
+    service = PushDeliveryService(RecordingTransport())
+
+    async def run():
+        await _seed(mongo, service, [_notification("u1")], [("u1", "t1")])
+        stale = await service._claim("a")
+        await mongo.push_outbox.update_many({}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+        fresh = await service._claim("b")
+        await service._deliver(fresh)
+        # The stalled worker finally records a transient failure for its old claim
+        await service._record(stale, {stale[0]["_id"]: [push.TOKEN_RETRY]}, [])
+        return await mongo.push_outbox.find_one({})
+
+    doc = asyncio.run(run())
+
+    assert doc["status"] == SENT
+    assert doc["attempts"] == 1
+
+
+def test_lease_is_renewed_while_a_slow_claim_is_delivered(mongo, monkeypatch):
+    monkeypatch.setattr(push, "PUSH_CLAIM_LEASE", 0.06)
+    service = PushDeliveryService(RecordingTransport(delay=0.15))
+
+    async def run():
+        await _seed(mongo, service, [_notification("u1")], [("u1", "t1")])
+        delivery = asyncio.create_task(service._deliver_claimed(await service._claim("a")))
+        await asyncio.sleep(0.1)
+        stolen = await service._claim("b")
+        await delivery
+        return stolen, await mongo.push_outbox.find_one({})
+
+    stolen, doc = asyncio.run(run())
+
+    assert stolen == []
+    assert doc["status"] == SENT
+    assert "claim_id" not in doc
+
+
+def test_transient_failure_is_rescheduled(mongo):
+    service = PushDeliveryService(RecordingTransport({"t1": push.TOKEN_RETRY}))
+
+    async def run():
+        await _seed(mongo, service, [_notification("u1")], [("u1", "t1")])
+        await service._deliver(await service._claim("w"))
+        return await mongo.push_outbox.find_one({})
+
+    doc = asyncio.run(run())
+
+    assert (doc["status"], doc["attempts"]) == (PENDING, 1)
+    assert doc["next_attempt_at"] >= doc["updated_at"]
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from ranking import CandidateSet, FeedRanker, preference_tags
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+def _reel(reel_id, upvotes=0, saves=0, hours_old=0, tags=()):
+    return {"id": reel_id, "upvotes": upvotes, "saves": saves, "tags": list(tags),
+            "created_at": (NOW - timedelta(hours=hours_old)).isoformat()}
+
+
+def _rank(reels, tags=(), limit=10):
+    return [reel["id"] for reel in FeedRanker().rank(CandidateSet(reels), list(tags), limit, now=NOW.timestamp())]
+
+
+def test_engagement_and_recency_order_the_feed():
+    reels = [_reel("old_quiet", hours_old=500), _reel("popular", upvotes=500, saves=100), _reel("fresh")]
+
+    assert _rank(reels) == ["popular", "fresh", "old_quiet"]
+
+
+def test_matching_tags_lift_a_reel():
+    reels = [_reel("place", upvotes=10, tags=["place"]), _reel("food", upvotes=5, tags=["food", "street"])]
+
+    assert _rank(reels)[0] == "place"
+    assert _rank(reels, tags=["food"])[0] == "food"
+
+
+def test_limit_and_missing_timestamps():
+    reels = [_reel(f"r{i}", upvotes=i) for i in range(20)] + [{"id": "no_date", "upvotes": 0}]
+
+    top = _rank(reels, limit=3)
+
+    assert top == ["r19", "r18", "r17"]
+    assert _rank([]) == []
+    assert "no_date" in _rank(reels, limit=len(reels))
+
+
+def test_apply_counts_reorders_without_rebuilding():
+    candidates = CandidateSet([_reel("a", upvotes=10), _reel("b", upvotes=1)])
+
+    candidates.apply_counts({"b": {"upvotes": 100}, "unknown": {"upvotes": 5}})
+
+    ranked = FeedRanker().rank(candidates, [], 2, now=NOW.timestamp())
+    assert [reel["id"] for reel in ranked] == ["b", "a"]
+    assert ranked[0]["upvotes"] == 101
+
+
+def test_preference_tags_are_deduplicated_and_lowercased():
+    preferences = {"interests": ["Food", " food ", "Heritage"], "focus": "Nightlife", "budget": "low"}
+
+    assert preference_tags(preferences) == ["food", "heritage", "nightlife"]
+    assert preference_tags(None) == []
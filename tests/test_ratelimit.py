@@ -0,0 +1,22 @@
+from ratelimit import KeyedRateLimiter, TokenBucket
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("ratelimit.time.monotonic", lambda: clock[0])
+    bucket = TokenBucket(capacity=2, rate=0.5)
+
+    burst = [bucket.take() for _ in range(3)]
+    clock[0] += 2
+    refilled = bucket.take()
+
+    assert burst == [True, True, False]
+    assert refilled is True
+    assert bucket.take() is False
+
+
+def test_keys_have_independent_buckets():
+    limiter = KeyedRateLimiter(capacity=1, rate=0.001)
+
+    assert [limiter.allow("u1"), limiter.allow("u1"), limiter.allow("u2")] == [True, False, True]
+    assert limiter.get_stats() == {"allowed": 2, "limited": 1, "tracked_keys": 2}
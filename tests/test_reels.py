@@ -0,0 +1,53 @@
+import asyncio
+
+from ranking import CandidateSet
+from reels import ReelCatalog, ReelFeedCache, build_mock_reels, normalize_location
+
+
+def _candidates(location="Goa", count=4):
+    return CandidateSet([{**reel, "position": None} for reel in build_mock_reels(location, count)])
+
+
+def test_flushed_counts_patch_cached_feeds_in_place():
+    cache = ReelFeedCache()
+    key = ("Goa", None)
+    candidates = _candidates()
+    cache.put(key, candidates)
+    reel_id = candidates.reels[0]["id"]
+    before = candidates.reels[0]["upvotes"]
+
+    cache.on_counters_flushed([
+        (("reels", "id", reel_id, False), {"upvotes": 3, "saves": 1}),
+        (("users", "user_id", "u1", False), {"stats.reels_saved": 1}),
+    ])
+
+    assert cache.get(key) is candidates
+    assert candidates.reels[0]["upvotes"] == before + 3
+    assert candidates.upvotes[0] == before + 3
+    assert cache.stats["invalidations"] == 0
+
+
+def test_reverse_index_forgets_replaced_and_expired_feeds():
+    cache = ReelFeedCache(maxsize=2, ttl=10)
+
+    cache.put(("Goa", None), _candidates("Goa"))
+    cache.put(("Goa", None), _candidates("Goa", 2))
+    assert len(cache.reel_keys) == 2
+
+    cache.cache.expire(cache.cache.timer() + 11)
+    assert cache.reel_keys == {}
+
+
+def test_only_known_locations_are_seeded(mongo):
+    catalog = ReelCatalog()
+
+    async def run():
+        known = await catalog.get_candidates(normalize_location(" goa "), None)
+        unknown = await catalog.get_candidates(normalize_location("Atlantis"), None)
+        return known, unknown, await mongo.reels.distinct("location")
+
+    known, unknown, locations = asyncio.run(run())
+
+    assert len(known) > 0
+    assert len(unknown) == 0
+    assert locations == ["Goa"]
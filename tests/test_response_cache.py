@@ -0,0 +1,67 @@
+import asyncio
+
+from response_cache import ResponseCache, cache_key
+
+
+def test_keys_ignore_case_whitespace_and_dict_order():
+    assert cache_key({"city": "  New   Delhi", "days": 2}) == cache_key({"days": 2, "city": "new delhi"})
+    assert cache_key({"stops": ["a", "b"]}) != cache_key({"stops": ["b", "a"]})
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache("test", persist=False)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"places": ["Fort"]}
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_compute({"city": "Jaipur"}, compute) for _ in range(5)))
+        results.append(await cache.get_or_compute({"city": "JAIPUR"}, compute))
+        return results
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(result == {"places": ["Fort"]} for result in results)
+    assert (cache.stats["misses"], cache.stats["coalesced"], cache.stats["hits"]) == (1, 4, 1)
+
+
+def test_persisted_responses_are_shared_across_instances(mongo):
+    first, second = ResponseCache("plans", persist=True), ResponseCache("plans", persist=True)
+
+    async def compute():
+        return {"plan": "day trip"}
+
+    async def never():
+        raise AssertionError("should be served from the shared store")
+
+    async def run():
+        await first.get_or_compute({"city": "Goa"}, compute)
+        return await second.get_or_compute({"city": "goa"}, never)
+
+    assert asyncio.run(run()) == {"plan": "day trip"}
+    assert second.stats["persistent_hits"] == 1
+
+
+def test_failed_compute_is_not_cached():
+    cache = ResponseCache("test", persist=False)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream down")
+        return "ok"
+
+    async def run():
+        try:
+            await cache.get_or_compute({"q": 1}, flaky)
+        except RuntimeError:
+            pass
+        return await cache.get_or_compute({"q": 1}, flaky)
+
+    assert asyncio.run(run()) == "ok"
+    assert cache._inflight == {}
@@ -0,0 +1,62 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from retention import Archiver, RETENTION_POLICIES
+
+
+def _notification(user_id, days_old, read=False):
+    return {"user_id": user_id, "title": "Hi", "read": read, "sent_at": datetime.utcnow() - timedelta(days=days_old)}
+
+
+def _seed(mongo, *notifications):
+    async def run():
+        await mongo.notifications.insert_many(list(notifications))
+        unread = sum(1 for n in notifications if not n["read"])
+        await mongo.notification_counters.insert_one({"_id": "u1", "unread": unread})
+    asyncio.run(run())
+
+
+def test_expiry_sweep_deletes_old_unread_and_decrements_counters(mongo, tmp_path):
+    _seed(mongo, _notification("u1", 120), _notification("u1", 100), _notification("u1", 120, read=True),
+          _notification("u1", 3))
+    archiver = Archiver(directory=str(tmp_path), segment_size=1)
+
+    async def run():
+        expired = await archiver.expire_unread(archiving=False)
+        remaining = await mongo.notifications.count_documents({})
+        return expired, remaining, await mongo.notification_counters.find_one({"_id": "u1"})
+
+    expired, remaining, counter = asyncio.run(run())
+
+    # The old read notification is left to the TTL index
+    assert (expired, remaining) == (2, 2)
+    assert counter["unread"] == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_expiry_sweep_waits_for_the_archiver_when_archiving(mongo):
+    _seed(mongo, _notification("u1", 91))
+    archiver = Archiver()
+
+    assert asyncio.run(archiver.expire_unread(archiving=True)) == 0
+    assert asyncio.run(archiver.expire_unread(archiving=False)) == 1
+
+
+def test_archiver_writes_segments_before_deleting(mongo, tmp_path):
+    _seed(mongo, _notification("u1", 120), _notification("u1", 100, read=True), _notification("u1", 1))
+    archiver = Archiver(directory=str(tmp_path))
+    policy = next(p for p in RETENTION_POLICIES if p.collection == "notifications")
+
+    async def run():
+        archived = await archiver.archive_policy(policy)
+        return archived, await mongo.notification_counters.find_one({"_id": "u1"})
+
+    archived, counter = asyncio.run(run())
+
+    [segment] = os.listdir(tmp_path / "notifications")
+    with gzip.open(tmp_path / "notifications" / segment, "rt") as lines:
+        assert len(lines.readlines()) == 2
+    assert archived == 2
+    assert counter["unread"] == 1
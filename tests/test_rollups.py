@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from mongomock import aggregate as mongomock_aggregate
+from pymongo import ASCENDING
+
+import rollups
+from rollups import ALL_USERS, WATERMARK_ID, AnalyticsRollupJob
+
+HOUR = "2025-03-01T09"
+
+
+@pytest.fixture(autouse=True)
+def substr_bytes(monkeypatch):
+    """mongomock lacks $substrBytes; for ASCII timestamps it is the same as $substr"""
+    handle = mongomock_aggregate._Parser._handle_string_operator
+
+    def handle_string_operator(self, operator, values):
+        return handle(self, "$substr" if operator == "$substrBytes" else operator, values)
+
+    monkeypatch.setattr(mongomock_aggregate._Parser, "_handle_string_operator", handle_string_operator)
+
+
+def _seed(mongo, count):
+    async def run():
+        await mongo.analytics_rollups.create_index(
+            [("granularity", ASCENDING), ("user_id", ASCENDING), ("bucket", ASCENDING), ("event_name", ASCENDING)],
+            unique=True
+        )
+        # Old enough to clear the safety lag
+        base = datetime.utcnow() - timedelta(minutes=10)
+        await mongo.analytics_events.insert_many([
+            {"_id": ObjectId.from_datetime(base + timedelta(seconds=i)),
+             "event_name": "reel_view", "user_id": f"u{i % 2}", "timestamp": f"{HOUR}:15:00"}
+            for i in range(count)
+        ])
+    asyncio.run(run())
+
+
+async def _count(mongo, granularity, bucket, user_id=ALL_USERS):
+    doc = await mongo.analytics_rollups.find_one(
+        {"granularity": granularity, "bucket": bucket, "event_name": "reel_view", "user_id": user_id}
+    )
+    return doc["count"] if doc else 0
+
+
+def test_events_roll_into_hour_and_day_buckets(mongo):
+    _seed(mongo, 5)
+    job = AnalyticsRollupJob(batch_size=2)
+
+    async def run():
+        totals = await job.run_until_caught_up()
+        summary = await job.get_summary("hour")
+        return totals, summary, await _count(mongo, "day", HOUR[:10], "u0")
+
+    totals, summary, u0_day = asyncio.run(run())
+
+    assert totals["events"] == 5
+    assert summary["totals"] == {"reel_view": 5}
+    assert u0_day == 3
+
+
+def test_batch_taken_over_after_expired_claim_is_counted_once(mongo):
+    _seed(mongo, 4)
+    job = AnalyticsRollupJob(batch_size=10)
+
+    async def stall_then_expire():
+        # First run writes its counters, then its claim lapses before the watermark moves
+        original = job._write_counts
+
+        async def write_then_expire(counts, batch_id, now):
+            written = await original(counts, batch_id, now)
+            del job._write_counts
+            await mongo.analytics_rollup_state.update_one(
+                {"_id": WATERMARK_ID}, {"$set": {"claim.expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+            )
+            return written
+
+        job._write_counts = write_then_expire
+        await job.run_once()
+
+        # Newer events arrive before the takeover; they belong to the next batch
+        await mongo.analytics_events.insert_one(
+            {"_id": ObjectId.from_datetime(datetime.utcnow() - timedelta(minutes=5)),
+             "event_name": "reel_view", "user_id": "u0", "timestamp": f"{HOUR}:40:00"}
+        )
+        await job.run_until_caught_up()
+        return await _count(mongo, "hour", HOUR), await mongo.analytics_rollup_state.find_one({"_id": WATERMARK_ID})
+
+    count, state = asyncio.run(stall_then_expire())
+
+    assert count == 5
+    assert "claim" not in state
+
+
+def test_run_stops_when_claim_expired_before_write(mongo, monkeypatch):
+    _seed(mongo, 3)
+    job = AnalyticsRollupJob()
+    monkeypatch.setattr(rollups, "ROLLUP_CLAIM_TIMEOUT", -1)
+
+    async def run():
+        result = await job.run_once()
+        return result, await mongo.analytics_rollups.count_documents({})
+
+    result, buckets = asyncio.run(run())
+
+    assert result == {"events": 0, "buckets": 0}
+    assert buckets == 0
+    assert job.stats["claims_lost"] == 1
@@ -0,0 +1,72 @@
+import asyncio
+
+from scheduler import AsyncScheduler
+
+
+def test_slow_job_skips_overlapping_ticks():
+    scheduler = AsyncScheduler()
+    started = []
+
+    async def slow():
+        started.append(1)
+        await asyncio.sleep(0.12)
+
+    async def run():
+        job = scheduler.add_job("slow", slow, interval=0.02)
+        scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return job
+
+    job = asyncio.run(run())
+
+    assert len(started) == 1
+    assert job.skipped_overlaps >= 2
+
+
+def test_failures_and_timeouts_are_recorded_and_the_job_keeps_running():
+    scheduler = AsyncScheduler()
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def hangs():
+        await asyncio.sleep(1)
+
+    async def run():
+        scheduler.add_job("broken", broken, interval=0.02)
+        scheduler.add_job("hangs", hangs, interval=0.05, timeout=0.01)
+        scheduler.start()
+        await asyncio.sleep(0.09)
+        await scheduler.stop()
+        return scheduler.get_metrics()["jobs"]
+
+    jobs = asyncio.run(run())
+
+    assert jobs["broken"]["runs"] >= 2
+    assert jobs["broken"]["failures"] == jobs["broken"]["runs"]
+    assert jobs["broken"]["last_error"] == "boom"
+    assert jobs["hangs"]["timeouts"] >= 1
+    assert jobs["hangs"]["last_error"] == "timed out after 0.01s"
+
+
+def test_leader_only_job_is_skipped_without_the_lease(mongo, monkeypatch):
+    scheduler = AsyncScheduler()
+    calls = []
+
+    async def work():
+        calls.append(1)
+
+    async def run():
+        job = scheduler.add_job("leader_job", work, interval=0.02, leader_only=True)
+        # Another instance holds the lease for the whole run
+        monkeypatch.setattr(job.lease, "start", lambda: None)
+        scheduler.start()
+        await asyncio.sleep(0.07)
+        await scheduler.stop()
+        return job
+
+    job = asyncio.run(run())
+
+    assert calls == []
+    assert job.skipped_not_leader >= 2
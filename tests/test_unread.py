@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import database
+from unread import UnreadCounter
+
+
+def _notification(user_id, read=False):
+    return {"user_id": user_id, "title": "Hi", "read": read}
+
+
+class _RacingNotifications:
+    """Stores one more notification (and counts it) while the backfill is counting"""
+
+    def __init__(self, collection, counter):
+        self.collection = collection
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def count_documents(self, query):
+        count = await self.collection.count_documents(query)
+        await self.collection.insert_one(_notification("u1"))
+        await self.counter.add(["u1"])
+        return count
+
+
+def test_backfill_counts_existing_unread_once(mongo):
+    counter = UnreadCounter()
+
+    async def run():
+        await mongo.notifications.insert_many([_notification("u1"), _notification("u1"), _notification("u1", True)])
+        first = await counter.get("u1")
+        counter.cache.clear()
+        second = await counter.get("u1")
+        return first, second
+
+    assert asyncio.run(run()) == (2, 2)
+    assert counter.stats["backfills"] == 1
+
+
+def test_notification_stored_during_backfill_is_counted(mongo, monkeypatch):
+    counter = UnreadCounter()
+    racing = _RacingNotifications(mongo.notifications, counter)
+    monkeypatch.setattr(database.database_manager, "get_database",
+                        lambda: SimpleNamespace(notifications=racing, notification_counters=mongo.notification_counters))
+
+    async def run():
+        await mongo.notifications.insert_one(_notification("u1"))
+        await counter.get("u1")
+        return await mongo.notification_counters.find_one({"_id": "u1"})
+
+    assert asyncio.run(run())["unread"] == 2
+
+
+def test_add_and_mark_read_keep_the_cached_count_current(mongo):
+    counter = UnreadCounter()
+
+    async def run():
+        await mongo.notifications.insert_many([_notification("u1"), _notification("u1")])
+        await counter.get("u1")
+        await mongo.notifications.insert_one(_notification("u1"))
+        await counter.add(["u1"])
+        after_add = await counter.get("u1")
+        changed = await counter.mark_read("u1")
+        return after_add, changed, await counter.get("u1")
+
+    assert asyncio.run(run()) == (3, 3, 0)